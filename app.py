@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
-"""Application entry point."""
-from bills_collector.app import create_app, celery
+"""Application entry point for the flask CLI and the development server.
+
+gunicorn serves ``bills_collector.app:create_app()`` and Celery runs
+``bills_collector.worker``; neither needs the migrations registered here.
+"""
+from bills_collector.app import create_app, register_migrations
 
 app = create_app()
+register_migrations(app)
 
 app.jinja_env.auto_reload = True
 app.config['TEMPLATES_AUTO_RELOAD'] = True
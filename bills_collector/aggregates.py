@@ -0,0 +1,110 @@
+"""Maintenance of the precomputed bill aggregates in ``bill_monthly_totals``.
+
+Every write to a bill's amount or date goes through ``record_bill`` so the
+monthly totals stay in step with the ``bills`` table inside the same
+transaction. ``rebuild_monthly_totals`` recomputes everything from scratch.
+"""
+from datetime import date, datetime, timezone
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+
+from bills_collector.extensions import db
+from bills_collector.models import Bill, BillMonthlyTotal, LinkedAccount
+
+
+def month_of(value) -> date:
+    """First day of the month ``value`` falls in"""
+    return date(value.year, value.month, 1)
+
+
+def record_bill(account_id, bill_date, amount, count=1):
+    """Add a bill's amount (or remove it, with negative values) to its month.
+
+    Upserts so concurrent workers can update the same bucket safely.
+    Accounts without a user have no totals, as in ``rebuild_monthly_totals``.
+    Does not commit; the caller's transaction covers the bill write too.
+    """
+    stmt = insert(BillMonthlyTotal).from_select(
+        [
+            BillMonthlyTotal.user_id,
+            BillMonthlyTotal.account_id,
+            BillMonthlyTotal.month,
+            BillMonthlyTotal.total_amount,
+            BillMonthlyTotal.bill_count,
+            BillMonthlyTotal.updated_at,
+        ],
+        select(
+            LinkedAccount.user_id,
+            LinkedAccount.id,
+            literal(month_of(bill_date), db.Date),
+            literal(amount, db.Float),
+            literal(count, db.Integer),
+            literal(datetime.now(timezone.utc), db.DateTime),
+        ).where(
+            LinkedAccount.id == account_id,
+            LinkedAccount.user_id.is_not(None),
+        ),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            BillMonthlyTotal.user_id,
+            BillMonthlyTotal.account_id,
+            BillMonthlyTotal.month,
+        ],
+        set_={
+            "total_amount": BillMonthlyTotal.total_amount + stmt.excluded.total_amount,
+            "bill_count": BillMonthlyTotal.bill_count + stmt.excluded.bill_count,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+    db.session.execute(stmt)
+
+
+def move_bill(account_id, old_bill_date, old_amount, new_bill_date, new_amount):
+    """Move a bill's contribution after its amount or date changed"""
+    if month_of(old_bill_date) == month_of(new_bill_date):
+        if old_amount != new_amount:
+            record_bill(account_id, new_bill_date, new_amount - old_amount, count=0)
+        return
+
+    record_bill(account_id, old_bill_date, -old_amount, count=-1)
+    record_bill(account_id, new_bill_date, new_amount, count=1)
+
+
+def rebuild_monthly_totals():
+    """Recompute every monthly total from the bills table and commit"""
+    month = func.date_trunc("month", Bill.bill_date).cast(db.Date)
+
+    totals = (
+        select(
+            LinkedAccount.user_id,
+            Bill.account_id,
+            month,
+            func.sum(Bill.amount),
+            func.count(Bill.id),
+            func.now(),
+        )
+        .join(LinkedAccount, LinkedAccount.id == Bill.account_id)
+        .where(LinkedAccount.user_id.is_not(None))
+        .group_by(LinkedAccount.user_id, Bill.account_id, month)
+    )
+
+    db.session.query(BillMonthlyTotal).delete()
+    db.session.execute(
+        insert(BillMonthlyTotal).from_select(
+            [
+                BillMonthlyTotal.user_id,
+                BillMonthlyTotal.account_id,
+                BillMonthlyTotal.month,
+                BillMonthlyTotal.total_amount,
+                BillMonthlyTotal.bill_count,
+                BillMonthlyTotal.updated_at,
+            ],
+            totals,
+        )
+    )
+    db.session.commit()
+
+    return BillMonthlyTotal.query.count()
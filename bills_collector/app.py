@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-
-"""The app module, containing the app factory function."""
+"""The app module, containing the app factory functions.
+
+``create_app`` builds the web app and ``create_worker_app`` the app Celery
+tasks run in. The worker never imports the routes, and the web app never
+imports the tasks, so each process only loads what it uses. Migrations are
+only registered for the flask CLI, see ``register_migrations``.
+"""
 
 # Core python packages
 import logging
@@ -9,28 +15,18 @@ import sys
 # 3rd party python packages
 from flask import Flask, render_template
 from werkzeug.middleware.proxy_fix import ProxyFix
-import sentry_sdk
-from sentry_sdk.integrations.flask import FlaskIntegration
-from sentry_sdk.integrations.celery import CeleryIntegration
-from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
 
 # Local module imports
 from bills_collector.extensions import (
     bcrypt,
+    cache,
     db,
-    migrate,
     celery,
     login_manager,
     oauth,
     csrf,
 )
-from bills_collector.routes import views, auth, connect, api
-
-# Initialize Sentry
-sentry_sdk.init(
-    dsn=environ.get("SENTRY_DSN"),
-    integrations=[FlaskIntegration(), CeleryIntegration(), SqlalchemyIntegration()],
-)
+from bills_collector import client_pool, commands, pdf_processing, tracing, transport, user_cache
 
 
 def create_app():
@@ -39,12 +35,10 @@ def create_app():
 
     :param config_object: The configuration object to use.
     """
-    app = Flask(__name__.split(".")[0])
+    app = create_base_app()
 
-    config_type = environ.get(
-        "CONFIG_TYPE", default="bills_collector.config.DevelopmentConfig"
-    )
-    app.config.from_object(config_type)
+    # requests give up on a slow Google sooner than tasks do
+    transport.configure(app, web=True)
 
     # ProxyFix for production environment
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
@@ -54,11 +48,10 @@ def create_app():
     # set the absolute path to the static folder
     app.static_folder = app.root_path + app.static_url_path
 
-    register_extensions(app)
     register_blueprints(app)
     register_errorhandlers(app)
     register_shellcontext(app)
-    configure_logger(app)
+    register_commands(app)
 
     app.logger.info("Application startup complete")
 
@@ -74,19 +67,60 @@ def create_app():
     return app
 
 
+def create_worker_app():
+    """Create the app Celery tasks run in: extensions only, no blueprints."""
+    app = create_base_app()
+    app.logger.info("Worker application startup complete")
+    return app
+
+
+def create_base_app():
+    """Configuration, Sentry, extensions and logging, shared by web and worker."""
+    app = Flask(__name__.split(".")[0])
+
+    config_type = environ.get(
+        "CONFIG_TYPE", default="bills_collector.config.DevelopmentConfig"
+    )
+    app.config.from_object(config_type)
+
+    # Initialize Sentry
+    tracing.init_sentry(app)
+
+    register_extensions(app)
+    configure_logger(app)
+
+    return app
+
+
 def register_extensions(app):
     """Register Flask extensions."""
     bcrypt.init_app(app)
     db.init_app(app)
-    migrate.init_app(app, db)
     celery.init_app(app)
     login_manager.init_app(app)
     oauth.init_app(app)
     csrf.init_app(app)
+    cache.init_app(app)
+    user_cache.configure(app)
+    pdf_processing.configure(app)
+    client_pool.configure(app)
+    transport.configure(app)
+
+
+def register_migrations(app):
+    """Register Flask-Migrate and its ``flask db`` commands.
+
+    Alembic is slow to import and only the CLI needs it, so this is left out
+    of ``create_app`` and called by the CLI entry point, ``app.py``.
+    """
+    from flask_migrate import Migrate    # pylint: disable=import-outside-toplevel
+    Migrate(app, db)
 
 
 def register_blueprints(app):
     """Register Flask blueprints."""
+    # pylint: disable=import-outside-toplevel
+    from bills_collector.routes import views, auth, connect, api, metrics
 
     csrf.exempt(connect.connect_bp)
 
@@ -94,6 +128,7 @@ def register_blueprints(app):
     app.register_blueprint(auth.auth_bp)
     app.register_blueprint(connect.connect_bp)
     app.register_blueprint(api.api_bp)
+    app.register_blueprint(metrics.metrics_bp)
 
 
 def register_errorhandlers(app):
@@ -123,6 +158,12 @@ def register_shellcontext(app):
     app.shell_context_processor(shell_context)
 
 
+def register_commands(app):
+    """Register Click commands."""
+    app.cli.add_command(commands.rebuild_bill_totals)
+    app.cli.add_command(commands.export_bills_command)
+
+
 def configure_logger(app):
     """Configure loggers."""
     handler = logging.StreamHandler(sys.stdout)
@@ -0,0 +1,97 @@
+"""Server-side response cache and conditional GET helpers for the API.
+
+Cached responses live in the ``cache`` extension under a per-user namespace.
+Writing an account or a rule bumps the user's namespace, which orphans every
+cached response for that user in one step; the orphans expire on their own.
+
+A namespace bumped in one process's dict is not seen by the others, so
+responses are only cached when the cache is shared, or when
+``CACHE_LOCAL_RESPONSES`` says the app runs in a single process.
+"""
+from dataclasses import dataclass
+from functools import wraps
+import hashlib
+
+from flask import current_app, request
+from flask_login import current_user
+
+from bills_collector.extensions import cache
+
+
+@dataclass
+class CacheableResponse:
+    """JSON body plus the ETag it was generated for"""
+
+    body: str
+    etag: str
+    timeout: int = None
+
+
+def compute_etag(rows):
+    """Build an ETag from the ids and ``last_update_at`` of the given rows"""
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(f'{row.id}:{row.last_update_at};'.encode('UTF-8'))
+    return digest.hexdigest()
+
+
+def cacheable_json(payload, rows, timeout=None):
+    """Serialise ``payload`` and tag it with the ETag of ``rows``"""
+    return CacheableResponse(
+        body=current_app.json.dumps(payload),
+        etag=compute_etag(rows),
+        timeout=timeout
+    )
+
+
+def _namespace_key(user_id):
+    return f'api-ns:{user_id}'
+
+
+def invalidate_user_cache(user_id):
+    """Drop every cached API response of this user"""
+    if user_id is None:
+        return
+    cache.incr(_namespace_key(user_id))
+    cache.delete_prefix(f'api:{user_id}:')
+
+
+def _caching_responses():
+    return cache.shared or current_app.config['CACHE_LOCAL_RESPONSES']
+
+
+def _response_key(user_id):
+    namespace = cache.get(_namespace_key(user_id)) or 0
+    return f'api:{user_id}:{namespace}:{request.full_path}'
+
+
+def conditional_json(view):
+    """Serve a view from the response cache and honour ``If-None-Match``.
+
+    The wrapped view returns a ``CacheableResponse`` on success. Anything else
+    (errors, redirects) is passed through untouched and never cached.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        caching = _caching_responses()
+        key = _response_key(current_user.id) if caching else None
+        entry = cache.get_json(key) if caching else None
+
+        if entry is None:
+            rv = view(*args, **kwargs)
+            if not isinstance(rv, CacheableResponse):
+                return rv
+
+            entry = {'body': rv.body, 'etag': rv.etag}
+            if caching and (rv.timeout is None or rv.timeout > 0):
+                cache.set_json(key, entry, timeout=rv.timeout)
+
+        response = current_app.response_class(entry['body'], mimetype='application/json')
+        response.set_etag(entry['etag'])
+        # Let the browser keep the body but revalidate on every poll
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+        return response.make_conditional(request)
+
+    return wrapper
@@ -0,0 +1,127 @@
+"""Per-process pool of API clients, reused across tasks.
+
+Building a ``GoogleClient`` fetches the discovery document and sets up an
+HTTP session, so Drive clients are kept between tasks, keyed by the linked
+account they upload to. The pool is a bounded LRU: an entry is dropped once
+it is ``ttl`` seconds old or its access token is about to expire, whichever
+comes first, and every client leaving the pool is closed. Celery's
+``worker_process_shutdown`` closes whatever is left.
+
+Hits, misses and evictions are exported to Prometheus and kept in ``stats``.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+import threading
+import time
+
+from celery.signals import worker_process_shutdown
+
+from bills_collector.integrations import GoogleClient
+from bills_collector.metrics import CLIENT_POOL_EVICTIONS, CLIENT_POOL_REQUESTS
+
+# Drop a client this long before its access token expires
+TOKEN_EXPIRY_MARGIN = 60
+
+
+@dataclass
+class PoolStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class ClientPool:
+    """Thread-safe LRU of clients built by ``factory(token)``, closed on eviction"""
+
+    def __init__(self, name, factory, maxsize=32, ttl=1800):
+        self.name = name
+        self.factory = factory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = PoolStats()
+        # key -> (expires_at on the wall clock, client)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expires_at(self, client):
+        expires_at = time.time() + self.ttl
+        token_expires_at = getattr(client, 'token_expires_at', None)
+        if token_expires_at:
+            expires_at = min(expires_at, token_expires_at - TOKEN_EXPIRY_MARGIN)
+        return expires_at
+
+    def _evict(self, key, reason):
+        """Remove ``key``, returning its client to close outside the lock"""
+        _, client = self._data.pop(key)
+        self.stats.evictions += 1
+        CLIENT_POOL_EVICTIONS.labels(self.name, reason).inc()
+        return client
+
+    def get(self, key, token):
+        """The pooled client for ``key``, built from ``token`` on a miss"""
+        stale = []
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, client = entry
+                if expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.stats.hits += 1
+                    CLIENT_POOL_REQUESTS.labels(self.name, 'hit').inc()
+                    return client
+                stale.append(self._evict(key, 'expired'))
+            self.stats.misses += 1
+            CLIENT_POOL_REQUESTS.labels(self.name, 'miss').inc()
+
+        for client in stale:
+            client.close()
+
+        # building a client makes network calls, keep them out of the lock
+        client = self.factory(token)
+
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                # another thread built one meanwhile, keep the pooled one
+                evicted.append(client)
+                client = self._data[key][1]
+                self._data.move_to_end(key)
+            else:
+                self._data[key] = (self._expires_at(client), client)
+                while len(self._data) > self.maxsize:
+                    evicted.append(self._evict(next(iter(self._data)), 'size'))
+
+        for evicted_client in evicted:
+            evicted_client.close()
+        return client
+
+    def discard(self, key):
+        """Drop and close the client for ``key``, e.g. after its token was revoked"""
+        with self._lock:
+            client = self._evict(key, 'discarded') if key in self._data else None
+        if client is not None:
+            client.close()
+
+    def close_all(self):
+        with self._lock:
+            clients = [self._evict(key, 'shutdown') for key in list(self._data)]
+        for client in clients:
+            client.close()
+
+    def __len__(self):
+        return len(self._data)
+
+
+drive_clients = ClientPool('drive', lambda token: GoogleClient(token=token))
+
+
+def configure(app):
+    """Size the pools from the app config"""
+    drive_clients.close_all()
+    drive_clients.maxsize = app.config['DRIVE_CLIENT_POOL_SIZE']
+    drive_clients.ttl = app.config['DRIVE_CLIENT_POOL_TTL']
+
+
+@worker_process_shutdown.connect
+def close_client_pools(**kwargs):    # pylint: disable=unused-argument
+    drive_clients.close_all()
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""Click commands."""
+import click
+from flask.cli import with_appcontext
+
+from bills_collector.aggregates import rebuild_monthly_totals
+from bills_collector.exports import EXPORT_FORMATS, export_bills
+from bills_collector.models import User
+
+
+@click.command('rebuild-bill-totals')
+@with_appcontext
+def rebuild_bill_totals():
+    """Recompute bill_monthly_totals from the bills table."""
+    rows = rebuild_monthly_totals()
+    click.echo(f'Rebuilt {rows} monthly total rows')
+
+
+@click.command('export-bills')
+@click.argument('email')
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv')
+@click.option('--gzip', 'use_gzip', is_flag=True, help='Gzip the output.')
+@click.option('--output', type=click.File('wb'), default='-', help='File to write to, stdout by default.')
+@with_appcontext
+def export_bills_command(email, export_format, use_gzip, output):
+    """Stream every bill of the user with EMAIL."""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.ClickException(f'No user with email {email}')
+
+    for chunk in export_bills(user.id, export_format, gzip=use_gzip):
+        output.write(chunk)
@@ -0,0 +1,180 @@
+"""Index of the files in each destination Drive folder.
+
+Statements are uploaded as ``YYYY-MM.pdf``, so re-runs and retries used to
+leave a duplicate in the folder each time. The index keeps the id, name,
+md5Checksum and link of every file of a folder in the ``cache`` extension,
+so it is shared by every worker, and is brought up to date from the Drive
+changes feed instead of listing the folder again. Before uploading, a file
+is looked up in it:
+
+- the same content is already in the folder: nothing is uploaded;
+- the email's file is there with other content: it gets a new revision;
+- otherwise a new file is created.
+
+Uploaded files carry the id of their email, and the MIME part id of the
+attachment, in ``appProperties``, which is how the file of an email's
+attachment is recognised, even among several statements of one email.
+"""
+from dataclasses import dataclass
+import hashlib
+
+from celery.utils.log import get_task_logger
+
+from bills_collector.extensions import cache
+
+logger = get_task_logger(__name__)
+
+# A folder untouched for this long is listed again from scratch
+DRIVE_INDEX_TIMEOUT = 7 * 24 * 3600
+
+# Bytes hashed per read when computing a local file's md5
+MD5_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadAction:
+    """What ``upload_to_folder`` did with a file"""
+    CREATED = 'created'
+    REVISED = 'revised'
+    TAGGED = 'tagged'
+    SKIPPED = 'skipped'
+
+
+@dataclass
+class UploadResult:
+    action: str
+    file: dict
+
+
+def file_md5(file_path):
+    """Hex md5 of a local file, as Drive reports it in ``md5Checksum``"""
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(MD5_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def index_cache_key(account_id, folder_id):
+    return f'drive-folder:{account_id}:{folder_id}'
+
+
+def index_entry(file):
+    """The fields of a Drive file resource the index keeps"""
+    return {
+        'name': file.get('name', ''),
+        'md5Checksum': file.get('md5Checksum'),
+        'webViewLink': file.get('webViewLink', ''),
+        'email_id': (file.get('appProperties') or {}).get('email_id'),
+        'part_id': (file.get('appProperties') or {}).get('part_id'),
+    }
+
+
+class DriveFolderIndex:
+    """Files of one Drive folder, keyed by file id"""
+
+    def __init__(self, drive_app, account_id, folder_id):
+        self.drive_app = drive_app
+        self.folder_id = folder_id
+        self.key = index_cache_key(account_id, folder_id)
+        self.page_token = None
+        self.files = {}
+
+    @classmethod
+    def load(cls, drive_app, account_id, folder_id):
+        """The folder's index, caught up with the changes feed or listed afresh"""
+        index = cls(drive_app, account_id, folder_id)
+        cached = cache.get_json(index.key)
+
+        if cached is None:
+            index.rebuild()
+        else:
+            index.page_token = cached['page_token']
+            index.files = cached['files']
+            index.catch_up()
+
+        index.save()
+        return index
+
+    def rebuild(self):
+        # take the token first, so changes made while listing are replayed
+        self.page_token = self.drive_app.get_drive_changes_token()
+        self.files = {
+            file['id']: index_entry(file)
+            for file in self.drive_app.list_drive_folder(self.folder_id)
+        }
+        logger.info(f"Indexed {len(self.files)} files of Drive folder {self.folder_id}")
+
+    def catch_up(self):
+        changes, self.page_token = self.drive_app.list_drive_changes(self.page_token)
+        for change in changes:
+            file = change.get('file') or {}
+            in_folder = self.folder_id in file.get('parents', [])
+            if change.get('removed') or file.get('trashed') or not in_folder:
+                self.files.pop(change['fileId'], None)
+            else:
+                self.files[change['fileId']] = index_entry(file)
+
+    def save(self):
+        cache.set_json(
+            self.key, {'page_token': self.page_token, 'files': self.files},
+            timeout=DRIVE_INDEX_TIMEOUT,
+        )
+
+    def record(self, file):
+        """Add or replace a file this process just wrote"""
+        self.files[file['id']] = index_entry(file)
+        self.save()
+
+    def find_content(self, md5):
+        """Id and entry of a file with this content, or None"""
+        return next(((file_id, f) for file_id, f in self.files.items() if f['md5Checksum'] == md5), None)
+
+    def find_email_file(self, name, email_id, part_id=None):
+        """Id and entry of the file uploaded earlier for this attachment of the email, or None"""
+        return next(
+            ((file_id, f) for file_id, f in self.files.items()
+             if f['name'] == name and f['email_id'] == email_id and f.get('part_id') == part_id),
+            None
+        )
+
+
+def upload_to_folder(index, file_mime_type, file_path, file_name, email_id, part_id=None) -> UploadResult:
+    """Put a file in the index's folder, uploading only what Drive lacks.
+
+    ``part_id`` tells apart the attachments of an email with several.
+    """
+    drive_app = index.drive_app
+    part_id = part_id or None
+    app_properties = {'email_id': email_id}
+    if part_id is not None:
+        app_properties['part_id'] = part_id
+    md5 = file_md5(file_path)
+
+    found = index.find_content(md5)
+    if found is not None:
+        file_id, entry = found
+        if entry['email_id'] is not None:
+            return UploadResult(UploadAction.SKIPPED, dict(entry, id=file_id))
+
+        # same bytes uploaded before the files were tagged, tag it in place
+        file = drive_app.update_drive_file(file_id, app_properties=app_properties)
+        index.record(file)
+        return UploadResult(UploadAction.TAGGED, file)
+
+    found = index.find_email_file(file_name, email_id, part_id)
+    if found is not None:
+        file = drive_app.update_drive_file(
+            found[0], file_mime_type=file_mime_type, file_path=file_path
+        )
+        index.record(file)
+        return UploadResult(UploadAction.REVISED, file)
+
+    file = drive_app.upload_file_to_drive(
+        file_mime_type=file_mime_type,
+        file_path=file_path,
+        file_name=file_name,
+        drive_folder_id=index.folder_id,
+        app_properties=app_properties,
+    )
+    index.record(file)
+    return UploadResult(UploadAction.CREATED, file)
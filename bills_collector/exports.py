@@ -0,0 +1,116 @@
+"""Streaming exports of a user's bills.
+
+Rows are read through a server-side cursor (``yield_per``) and encoded into
+bounded chunks, so memory stays flat no matter how many bills are exported.
+"""
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import select
+
+from bills_collector.extensions import db
+from bills_collector.models import Bill, LinkedAccount
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+EXPORT_COLUMNS = [
+    Bill.id,
+    Bill.account_id,
+    Bill.email_id,
+    Bill.amount,
+    Bill.bill_date,
+    Bill.due_date,
+    Bill.status,
+    Bill.bill_url,
+]
+
+# Rows fetched from the cursor per round-trip
+EXPORT_BATCH_SIZE = 1000
+# Encoded bytes buffered before a chunk is handed to the response
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_bill_rows(user_id, batch_size=EXPORT_BATCH_SIZE):
+    """Yield every bill of the user, ordered by (due_date, id)"""
+    user_accounts = select(LinkedAccount.id).where(LinkedAccount.user_id == user_id)
+
+    stmt = (
+        select(*EXPORT_COLUMNS)
+        .where(Bill.account_id.in_(user_accounts.scalar_subquery()))
+        .order_by(Bill.due_date, Bill.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    result = db.session.execute(stmt)
+    try:
+        yield from result
+    finally:
+        result.close()
+
+
+def _field(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float, str)):
+        return value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_csv(rows):
+    """Encode rows as CSV text chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.key for column in EXPORT_COLUMNS])
+
+    for row in rows:
+        writer.writerow([_field(value) for value in row])
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows):
+    """Encode rows as newline delimited JSON text chunks"""
+    buffer = io.StringIO()
+
+    for row in rows:
+        record = {key: _field(value) for key, value in row._mapping.items()}
+        buffer.write(json.dumps(record))
+        buffer.write('\n')
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def iter_gzip(chunks):
+    """Gzip a stream of byte chunks without buffering it"""
+    compressor = zlib.compressobj(wbits=31)    # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_bills(user_id, export_format='csv', gzip=False):
+    """Byte chunks of the user's bills in the requested format"""
+    encoder = iter_csv if export_format == 'csv' else iter_ndjson
+    chunks = (chunk.encode('UTF-8') for chunk in encoder(iter_bill_rows(user_id)))
+
+    if gzip:
+        chunks = iter_gzip(chunks)
+
+    return chunks
@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 """Extensions module. Each extension is initialized in the app factory located in app.py."""
 
+import json
+import threading
+import time
+
 import flask
 from authlib.integrations.flask_client import OAuth
 from celery import Celery
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 
@@ -32,21 +35,150 @@ class FlaskCelery(Celery):
 
             def __call__(self, *args, **kwargs):
                 if flask.has_app_context():
-                    TaskBase.__call__(self, *args, **kwargs)
+                    return TaskBase.__call__(self, *args, **kwargs)
                 else:
                     with _celery.app.app_context():
-                        TaskBase.__call__(self, *args, **kwargs)
+                        return TaskBase.__call__(self, *args, **kwargs)
 
         self.Task = ContextTask # pylint: disable=invalid-name,
 
     def init_app(self, app):
         self.app = app
-        self.config_from_object(app.config)
+        # Flask only loads upper case settings, so Celery's are prefixed with CELERY_
+        self.config_from_object(app.config, namespace='CELERY')
+
+class FlaskCache:
+    """Small key/value cache backed by valkey, with an in-process fallback.
+
+    ``CACHE_TYPE = 'valkey'`` stores entries in the valkey instance at
+    ``CACHE_VALKEY_URL`` so they are shared by every web and worker process.
+    Any other value keeps a per-process dict, which is what tests use; its
+    expired entries are swept out every ``SWEEP_INTERVAL`` seconds.
+    """
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, app=None):
+        self.client = None
+        self.key_prefix = ''
+        self.default_timeout = 300
+        self._local = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.key_prefix = app.config.get('CACHE_KEY_PREFIX', '')
+        self.default_timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        self._local = {}
+
+        if app.config.get('CACHE_TYPE') == 'valkey':
+            import redis    # pylint: disable=import-outside-toplevel
+            self.client = redis.Redis.from_url(
+                app.config['CACHE_VALKEY_URL'], decode_responses=True
+            )
+        else:
+            self.client = None
+
+        app.extensions['cache'] = self
+
+    @property
+    def shared(self):
+        """Whether every web and worker process sees the same entries"""
+        return self.client is not None
+
+    def get(self, key):
+        """Return the cached string for ``key`` or None"""
+        key = self.key_prefix + key
+        if self.client is not None:
+            return self.client.get(key)
+
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Store ``value`` for ``timeout`` seconds (0 means no expiry)"""
+        timeout = self.default_timeout if timeout is None else timeout
+        key = self.key_prefix + key
+        if self.client is not None:
+            self.client.set(key, value, ex=timeout or None)
+            return
+
+        now = time.monotonic()
+        expires_at = now + timeout if timeout else None
+        with self._lock:
+            self._local[key] = (expires_at, value)
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+    def _sweep(self, now):
+        """Drop the expired entries of the in-process dict, with the lock held"""
+        self._local = {
+            key: entry for key, entry in self._local.items()
+            if entry[0] is None or entry[0] >= now
+        }
+        self._next_sweep = now + self.SWEEP_INTERVAL
+
+    def delete(self, *keys):
+        """Remove the given keys"""
+        keys = [self.key_prefix + key for key in keys]
+        if self.client is not None:
+            if keys:
+                self.client.delete(*keys)
+            return
+
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        """Remove every in-process key starting with ``prefix``.
+
+        Shared entries are left to expire, scanning valkey's keys would block it.
+        """
+        if self.client is not None:
+            return
+
+        prefix = self.key_prefix + prefix
+        with self._lock:
+            for key in [key for key in self._local if key.startswith(prefix)]:
+                del self._local[key]
+
+    def incr(self, key):
+        """Atomically increment a counter, creating it if missing"""
+        if self.client is not None:
+            return self.client.incr(self.key_prefix + key)
+
+        with self._lock:
+            prefixed = self.key_prefix + key
+            _, value = self._local.get(prefixed, (None, 0))
+            value = int(value) + 1
+            self._local[prefixed] = (None, value)
+            return value
+
+    def get_json(self, key):
+        """Return the decoded JSON value for ``key`` or None"""
+        value = self.get(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set_json(self, key, value, timeout=None):
+        """JSON encode and store ``value``"""
+        self.set(key, json.dumps(value), timeout=timeout)
 
 bcrypt = Bcrypt()
 db = SQLAlchemy()
-migrate = Migrate()
 celery = FlaskCelery()
 login_manager = LoginManager()
 oauth = OAuth()
 csrf = CSRFProtect()
+cache = FlaskCache()
@@ -1,10 +1,26 @@
+"""Clients of the external services.
 
-from .google_client import GoogleClient
-from .llm_client import LLMClient
-from .zoho_client import ZohoClient
+Each client is imported on first access, so a process only loads the SDKs
+of the services it talks to: the web app never pulls in ``google.genai``.
+"""
+from importlib import import_module
 
 __all__ = [
     'GoogleClient',
     'LLMClient',
     'ZohoClient'
 ]
+
+_MODULES = {
+    'GoogleClient': '.google_client',
+    'LLMClient': '.llm_client',
+    'ZohoClient': '.zoho_client',
+}
+
+
+def __getattr__(name):
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
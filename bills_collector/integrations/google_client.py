@@ -1,30 +1,106 @@
-"""Client for accessing Google Services"""
+"""Client for accessing Google Services.
+
+The Google API client libraries are imported where Drive is used, so the
+web app, which only needs the OAuth session, does not load them.
+"""
 from datetime import datetime, timezone, timedelta
+import json
+import threading
 from uuid import uuid4
 
 from authlib.integrations.requests_client import OAuth2Session
 from flask import current_app
-import google.oauth2.credentials
-import googleapiclient.discovery
-from googleapiclient.http import MediaFileUpload
-import requests
-
 
-from bills_collector.extensions import db, oauth
+from bills_collector.caching import invalidate_user_cache
+from bills_collector.extensions import cache, db, oauth
 from bills_collector.models import LinkedAccount
+from bills_collector.transport import transport
 
 GOOGLE_DISCOVERY_URL = (
     "https://accounts.google.com/.well-known/openid-configuration"
 )
+# Every client reads the discovery document, which hardly ever changes
+GOOGLE_DISCOVERY_CACHE_TIMEOUT = 3600
+
+# Partial-response masks, so Gmail only sends the fields we read
+GMAIL_LIST_FIELDS = 'messages(id,threadId),nextPageToken,resultSizeEstimate'
+GMAIL_METADATA_FIELDS = 'id,threadId,internalDate,sizeEstimate,payload(mimeType,headers)'
+GMAIL_METADATA_HEADERS = ['Content-Type', 'From', 'Subject']
+GMAIL_ATTACHMENT_FIELDS = 'size,data'
+# body.data is only the inline data of small parts, large ones have an attachmentId
+GMAIL_PART_FIELDS = 'partId,mimeType,filename,body(attachmentId,size,data)'
+
+def gmail_parts_mask(depth):
+    """Mask selecting the part tree of a message down to ``depth`` levels"""
+    mask = GMAIL_PART_FIELDS
+    for _ in range(depth):
+        mask = f'{GMAIL_PART_FIELDS},parts({mask})'
+    return mask
+
+# Nesting the mask reaches, deeper parts need the message fetched unmasked
+GMAIL_PARTS_DEPTH = 3
+GMAIL_MESSAGE_FIELDS = f'id,threadId,internalDate,payload({gmail_parts_mask(GMAIL_PARTS_DEPTH)})'
+GMAIL_UNMASKED_MESSAGE_FIELDS = 'id,threadId,internalDate,payload'
+
+def parts_cut_off(part, depth=GMAIL_PARTS_DEPTH):
+    """Whether the mask dropped parts nested below ``part``, e.g. of a forwarded message"""
+    if depth == 0:
+        return part.get('mimeType', '').startswith(('multipart/', 'message/'))
+    return any(parts_cut_off(child, depth - 1) for child in part.get('parts', []))
+
+# Drive file fields the folder index keeps
+DRIVE_FILE_FIELDS = 'id,name,md5Checksum,webViewLink,appProperties'
+DRIVE_LIST_FIELDS = f'nextPageToken,files({DRIVE_FILE_FIELDS})'
+DRIVE_CHANGES_FIELDS = (
+    f'nextPageToken,newStartPageToken,changes(fileId,removed,file({DRIVE_FILE_FIELDS},parents,trashed))'
+)
+
+def response_size(resp):
+    """Bytes on the wire for a response body, compressed if it was"""
+    content_length = resp.headers.get('Content-Length')
+    if content_length is not None:
+        return int(content_length)
+    return len(resp.content)
 
 def get_google_provider_cfg():
-    return requests.get(GOOGLE_DISCOVERY_URL).json()
+    """Google's OpenID discovery document, cached rather than fetched per client"""
+    discovery_url = current_app.config.get('GOOGLE_DISCOVERY_URL', GOOGLE_DISCOVERY_URL)
+    cache_key = f'google-discovery:{discovery_url}'
+
+    provider_cfg = cache.get_json(cache_key)
+    if provider_cfg is None:
+        resp = transport.session().get(discovery_url)
+        resp.raise_for_status()
+        provider_cfg = resp.json()
+        cache.set_json(cache_key, provider_cfg, timeout=GOOGLE_DISCOVERY_CACHE_TIMEOUT)
+    return provider_cfg
+
+def build_drive_service(credentials):
+    """Build a Drive v3 service, rooted at DRIVE_API_URL when configured"""
+    # pylint: disable=import-outside-toplevel
+    import googleapiclient.discovery
+    from googleapiclient.discovery_cache import get_static_doc
+
+    http = transport.google_api_http(credentials)
+    drive_api_url = current_app.config.get('DRIVE_API_URL')
+    if not drive_api_url:
+        return googleapiclient.discovery.build("drive", "v3", http=http)
+
+    # rootUrl also drives the media upload URL, so patch the document itself
+    discovery_doc = json.loads(get_static_doc("drive", "v3"))
+    discovery_doc['rootUrl'] = drive_api_url.rstrip('/') + '/'
+    return googleapiclient.discovery.build_from_document(discovery_doc, http=http)
 
 class GoogleClient:
     """ Google client class"""
 
     def __init__(self, token=None, account_id=None):
         """Contstructor"""
+        # bytes received from Gmail, per API call
+        self.bytes_received = {}
+        self.__bytes_lock = threading.Lock()
+        self.__drive_service = None
+
         if token is not None:
             self.app = self.__init_with_token(token)
             self.app.ensure_active_token(token=self.app.token)
@@ -39,9 +115,10 @@ class GoogleClient:
         # create the default app
         self.app = oauth.register(
             'google',
-            server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+            server_metadata_url=GOOGLE_DISCOVERY_URL,
             update_token=self.__update_token,
-            authorize_params={'prompt':'consent'}
+            authorize_params={'prompt':'consent'},
+            client_kwargs={'default_timeout': transport.timeout}
         )
 
     def __init_with_account_id(self, account_id):
@@ -61,12 +138,13 @@ class GoogleClient:
         token_endpoint = google_provider_cfg['token_endpoint']
         revocation_endpoint = google_provider_cfg['revocation_endpoint']
 
-        return OAuth2Session(client_id=client_id,
-                             client_secret=client_secret,
-                             token_endpoint=token_endpoint,
-                             revocation_endpoint=revocation_endpoint,
-                             token=token,
-                             update_token=self.__update_token)
+        return transport.mount(OAuth2Session(client_id=client_id,
+                                             client_secret=client_secret,
+                                             token_endpoint=token_endpoint,
+                                             revocation_endpoint=revocation_endpoint,
+                                             token=token,
+                                             update_token=self.__update_token,
+                                             default_timeout=transport.timeout))
 
     def __update_token(name, token, refresh_token=None, access_token=None):
         """Method to update token in db on refresh"""
@@ -89,14 +167,25 @@ class GoogleClient:
         item.last_update_at = datetime.now(timezone.utc)
 
         db.session.commit()
+        invalidate_user_cache(item.user_id)
         return None
 
     def close(self):
         """Method to close a oauth2session object"""
         self.app.close()
+        if self.__drive_service is not None:
+            self.__drive_service.close()
+            self.__drive_service = None
+
+    @property
+    def token_expires_at(self):
+        """Epoch seconds the access token expires at, if known"""
+        token = getattr(self.app, 'token', None) or {}
+        return token.get('expires_at')
 
     def __get_google_credentials(self):
         """Creates a google api client"""
+        import google.oauth2.credentials    # pylint: disable=import-outside-toplevel
 
         google_provider_cfg = get_google_provider_cfg()
         token_endpoint = google_provider_cfg['token_endpoint']
@@ -112,62 +201,198 @@ class GoogleClient:
         return google_creds
 
 
-    def fetch_inbox_emails(self, from_address, subject_text):
-        """Fetch emails from Inbox"""
+    @property
+    def gmail_api_url(self):
+        return current_app.config.get('GMAIL_API_URL', 'https://gmail.googleapis.com').rstrip('/')
 
-        api_url = 'https://gmail.googleapis.com/gmail/v1/users/me/messages'
-        query_data = {
-            'includeSpamTrash': 'false',
-            'q': f'has:attachment newer_than:40d in:INBOX from:{from_address} subject:{subject_text}',
-            'maxResults': 500
-        }
+    @property
+    def bytes_transferred(self):
+        """Total bytes received from Gmail by this client"""
+        return sum(self.bytes_received.values())
 
-        resp = self.app.get(api_url, params=query_data)
+    def __gmail_get(self, call, api_url, params=None):
+        """GET a Gmail resource, counting the bytes received"""
+        resp = self.app.get(api_url, params=params)
 
         resp.raise_for_status()
 
+        with self.__bytes_lock:
+            self.bytes_received[call] = self.bytes_received.get(call, 0) + response_size(resp)
+
         return resp.json()
 
-    def fetch_one_email(self, message_id):
-        """Fetch email from Inbox"""
+    @staticmethod
+    def inbox_query(criteria, since=None, until=None):
+        """Search of the Inbox for attachments matching ``criteria``.
+
+        ``since`` and ``until`` bound the received date, inclusive; without
+        either the search covers the last 40 days.
+        """
+        window = 'newer_than:40d'
+        if since is not None or until is not None:
+            # before: excludes its own day
+            window = ' '.join(filter(None, [
+                since and f"after:{since.strftime('%Y/%m/%d')}",
+                until and f"before:{(until + timedelta(days=1)).strftime('%Y/%m/%d')}",
+            ]))
+        return f'has:attachment {window} in:INBOX {criteria}'.rstrip()
+
+    def fetch_inbox_emails(self, from_address, subject_text, page_token=None, max_results=500,
+                           since=None, until=None):
+        """Fetch a page of emails from Inbox, ``nextPageToken`` leads to the next one"""
+        return self.search_inbox_emails(
+            f'from:{from_address} subject:{subject_text}',
+            page_token=page_token, max_results=max_results, since=since, until=until,
+        )
 
-        api_url = f'https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}'
+    def search_inbox_emails(self, criteria, page_token=None, max_results=500, since=None, until=None):
+        """Fetch a page of the Inbox emails matching any search ``criteria``"""
 
-        resp = self.app.get(api_url)
+        api_url = f'{self.gmail_api_url}/gmail/v1/users/me/messages'
+        query_data = {
+            'includeSpamTrash': 'false',
+            'q': self.inbox_query(criteria, since=since, until=until),
+            'maxResults': max_results,
+            'fields': GMAIL_LIST_FIELDS,
+        }
+        if page_token:
+            query_data['pageToken'] = page_token
 
-        resp.raise_for_status()
+        return self.__gmail_get('messages.list', api_url, params=query_data)
 
-        return resp.json()
+    def fetch_one_email(self, message_id, email_format='full'):
+        """Fetch email from Inbox.
 
-    def get_email_attachment(self, message_id, attachment_id):
-        """Get Attachment of email"""
+        ``full`` returns the part tree with attachment ids and inline bodies,
+        ``metadata`` only the date, size, top-level MIME type and headers.
+        """
 
-        api_url = f'https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}/attachments/{attachment_id}'
+        api_url = f'{self.gmail_api_url}/gmail/v1/users/me/messages/{message_id}'
+        if email_format == 'metadata':
+            query_data = {
+                'format': 'metadata',
+                'metadataHeaders': GMAIL_METADATA_HEADERS,
+                'fields': GMAIL_METADATA_FIELDS,
+            }
+        else:
+            query_data = {'format': email_format, 'fields': GMAIL_MESSAGE_FIELDS}
 
-        resp = self.app.get(api_url)
+        email = self.__gmail_get(f'messages.get.{email_format}', api_url, params=query_data)
+        if email_format == 'full' and parts_cut_off(email.get('payload', {})):
+            current_app.logger.warning(
+                f"Parts of email {message_id} nest below the fields mask, fetching it unmasked"
+            )
+            query_data['fields'] = GMAIL_UNMASKED_MESSAGE_FIELDS
+            email = self.__gmail_get('messages.get.full', api_url, params=query_data)
+        return email
 
-        resp.raise_for_status()
+    def fetch_email_metadata(self, message_id):
+        """Fetch the headers and top-level MIME type of an email"""
+        return self.fetch_one_email(message_id, email_format='metadata')
 
-        return resp.json()
+    def get_email_attachment(self, message_id, attachment_id):
+        """Get Attachment of email"""
 
-    def upload_file_to_drive(self, file_mime_type, file_path, file_name, drive_folder_id):
-        """Upload file to Google Drive"""
+        api_url = f'{self.gmail_api_url}/gmail/v1/users/me/messages/{message_id}/attachments/{attachment_id}'
 
-        google_creds = self.__get_google_credentials()
+        return self.__gmail_get(
+            'attachments.get', api_url, params={'fields': GMAIL_ATTACHMENT_FIELDS}
+        )
 
-        drive_service = googleapiclient.discovery.build("drive", "v3", credentials=google_creds)
+    @property
+    def drive_service(self):
+        """Drive v3 service of this client, built on first use"""
+        if self.__drive_service is None:
+            self.__drive_service = build_drive_service(self.__get_google_credentials())
+        return self.__drive_service
+
+    def upload_file_to_drive(self, file_mime_type, file_path, file_name, drive_folder_id,
+                             app_properties=None):
+        """Upload file to Google Drive"""
+        from googleapiclient.http import MediaFileUpload    # pylint: disable=import-outside-toplevel
 
         file_metadata = {"name": file_name, "parents": [drive_folder_id]}
+        if app_properties:
+            file_metadata["appProperties"] = app_properties
         media = MediaFileUpload(
             file_path, mimetype=file_mime_type, resumable=False
         )
         # pylint: disable=maybe-no-member
         file = (
-            drive_service.files()
-            .create(body=file_metadata, media_body=media, fields="id,webViewLink")
+            self.drive_service.files()
+            .create(body=file_metadata, media_body=media, fields=DRIVE_FILE_FIELDS)
             .execute()
         )
 
         return file
 
+    def update_drive_file(self, file_id, file_mime_type=None, file_path=None, file_name=None,
+                          app_properties=None):
+        """Update a Drive file's metadata, and its content as a new revision if a path is given"""
+        from googleapiclient.http import MediaFileUpload    # pylint: disable=import-outside-toplevel
+
+        file_metadata = {}
+        if file_name:
+            file_metadata["name"] = file_name
+        if app_properties:
+            file_metadata["appProperties"] = app_properties
+        media = None
+        if file_path:
+            media = MediaFileUpload(file_path, mimetype=file_mime_type, resumable=False)
+
+        # pylint: disable=maybe-no-member
+        return (
+            self.drive_service.files()
+            .update(fileId=file_id, body=file_metadata, media_body=media, fields=DRIVE_FILE_FIELDS)
+            .execute()
+        )
 
+    def list_drive_folder(self, drive_folder_id):
+        """Every file in a Drive folder, following the pages"""
+
+        files = []
+        page_token = None
+        while True:
+            # pylint: disable=maybe-no-member
+            resp = (
+                self.drive_service.files()
+                .list(
+                    q=f"'{drive_folder_id}' in parents and trashed = false",
+                    spaces="drive",
+                    pageSize=1000,
+                    pageToken=page_token,
+                    fields=DRIVE_LIST_FIELDS,
+                )
+                .execute()
+            )
+            files.extend(resp.get("files", []))
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                return files
+
+    def get_drive_changes_token(self):
+        """Page token of the Drive changes feed as of now"""
+        # pylint: disable=maybe-no-member
+        return self.drive_service.changes().getStartPageToken().execute()["startPageToken"]
+
+    def list_drive_changes(self, page_token):
+        """Changes since ``page_token``, and the token to resume from next time"""
+
+        changes = []
+        while True:
+            # pylint: disable=maybe-no-member
+            resp = (
+                self.drive_service.changes()
+                .list(
+                    pageToken=page_token,
+                    spaces="drive",
+                    includeRemoved=True,
+                    pageSize=1000,
+                    fields=DRIVE_CHANGES_FIELDS,
+                )
+                .execute()
+            )
+            changes.extend(resp.get("changes", []))
+            if "newStartPageToken" in resp:
+                return changes, resp["newStartPageToken"]
+            page_token = resp["nextPageToken"]
@@ -14,8 +14,16 @@ class LLMClient:
     A client for interacting with OpenRouter's LLM
     """
     
-    def __init__(self, api_key: str, base_url: str = "https://openrouter.ai/api/v1"):
-        self.client = genai.Client()
+    def __init__(self, api_key: str, base_url: str = None, client_args: dict = None):
+        options = {}
+        if base_url:
+            options['base_url'] = base_url
+        if client_args:
+            # passed on to the httpx client, e.g. {'http2': True}
+            options['client_args'] = client_args
+        http_options = types.HttpOptions(**options) if options else None
+        # an empty key falls back to the GEMINI_API_KEY / GOOGLE_API_KEY env vars
+        self.client = genai.Client(api_key=api_key or None, http_options=http_options)
 
     def extract_bill_info(self, pdf_path: str) -> dict:
         """
@@ -44,4 +52,7 @@ class LLMClient:
                 "response_schema": ExtractedBill,
             })
         
-        return response.parsed
\ No newline at end of file
+        if response.parsed is None:
+            return None
+
+        return response.parsed.model_dump()
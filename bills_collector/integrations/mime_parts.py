@@ -0,0 +1,74 @@
+"""Walk the MIME tree of a Gmail message resource"""
+from dataclasses import dataclass
+from enum import Enum
+
+# MIME types a bill attachment may come as
+ATTACHMENT_MIME_TYPES = ("application/pdf", "application/octet-stream")
+
+
+class PartKind(str, Enum):
+    """The leaf parts the inbox pipeline cares about"""
+    PDF = 'pdf'
+    TEXT = 'text'
+    HTML = 'html'
+
+
+@dataclass(frozen=True)
+class MessagePart:
+    """A leaf of a message's MIME tree"""
+
+    kind: PartKind
+    part_id: str
+    mime_type: str
+    filename: str
+    size: int
+    # Gmail either inlines a small body as base64 or returns an id to fetch it by
+    attachment_id: str = None
+    data: str = None
+
+    @property
+    def is_inline(self):
+        return self.data is not None
+
+
+def describe_part(part):
+    """The ``MessagePart`` for a leaf part, or None if it is of no interest"""
+    mime_type = part.get("mimeType", "")
+    filename = part.get("filename", "")
+
+    if mime_type in ATTACHMENT_MIME_TYPES and filename.lower().endswith(".pdf"):
+        kind = PartKind.PDF
+    elif mime_type == "text/plain" and not filename:
+        kind = PartKind.TEXT
+    elif mime_type == "text/html" and not filename:
+        kind = PartKind.HTML
+    else:
+        return None
+
+    body = part.get("body", {})
+    return MessagePart(
+        kind=kind,
+        part_id=part.get("partId", ""),
+        mime_type=mime_type,
+        filename=filename,
+        size=body.get("size", 0),
+        attachment_id=body.get("attachmentId"),
+        data=body.get("data") or None,
+    )
+
+
+def walk_message_parts(part):
+    """Lazily yield every interesting leaf of a message payload, depth first.
+
+    Descends into every container, e.g. a PDF inside ``multipart/alternative``
+    inside ``multipart/mixed``, or a forwarded ``message/rfc822``.
+    """
+    children = part.get("parts")
+    if children:
+        for child in children:
+            yield from walk_message_parts(child)
+        return
+
+    descriptor = describe_part(part)
+    if descriptor is not None:
+        yield descriptor
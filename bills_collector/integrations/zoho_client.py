@@ -1,19 +1,46 @@
 """Client for accessing Zoho Services"""
 from datetime import datetime, timezone, timedelta
+import threading
 from uuid import uuid4
 
-from authlib.integrations.requests_client import OAuth2Session
+from authlib.integrations.requests_client import OAuth2Auth, OAuth2Session
 from flask import current_app
 from requests.models import PreparedRequest
 
+from bills_collector.caching import invalidate_user_cache
 from bills_collector.extensions import db, oauth
 from bills_collector.models import LinkedAccount
+from bills_collector.transport import transport
+
+# Most messages a Zoho Mail search returns per request
+ZOHO_SEARCH_LIMIT = 200
+# Bytes read per step when streaming an attachment to disk
+ZOHO_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class ZohoOAuth2Auth(OAuth2Auth):
+    """Zoho APIs take the access token as ``Zoho-oauthtoken``, not ``Bearer``"""
+
+    def __call__(self, req):
+        self.ensure_active_token()
+        req.headers['Authorization'] = f"Zoho-oauthtoken {self.token['access_token']}"
+        return req
+
+
+class ZohoOAuth2Session(OAuth2Session):
+    token_auth_class = ZohoOAuth2Auth
+
 
 class ZohoClient:
     """ Zoho client class"""
 
     def __init__(self, token=None):
         """Contstructor"""
+        # bytes received from Zoho Mail, per API call
+        self.bytes_received = {}
+        self.__bytes_lock = threading.Lock()
+        self.__mail_account_id = None
+
         if token is not None:
             self.app = self.__init_with_token(token)
         else:
@@ -21,6 +48,7 @@ class ZohoClient:
                 'zoho',
                 update_token=self.__update_token,
                 authorize_params={'prompt':'consent'},
+                client_kwargs={'default_timeout': transport.timeout},
                 #token_endpoint_auth_method=self.auth_client
             )
 
@@ -29,11 +57,12 @@ class ZohoClient:
         client_secret = current_app.config['ZOHO_CLIENT_SECRET']
         token_endpoint = current_app.config['ZOHO_ACCESS_TOKEN_URL']
 
-        return OAuth2Session(client_id=client_id,
-                             client_secret=client_secret,
-                             token_endpoint=token_endpoint,
-                             token=token,
-                             update_token=self.__update_token)
+        return transport.mount(ZohoOAuth2Session(client_id=client_id,
+                                                 client_secret=client_secret,
+                                                 token_endpoint=token_endpoint,
+                                                 token=token,
+                                                 update_token=self.__update_token,
+                                                 default_timeout=transport.timeout))
 
     def __update_token(name, token, refresh_token=None, access_token=None):
         """Method to update token in db on refresh"""
@@ -55,8 +84,74 @@ class ZohoClient:
         item.last_update_at = datetime.now(timezone.utc)
 
         db.session.commit()
+        invalidate_user_cache(item.user_id)
         return None
 
     def close(self):
         """Method to close a oauth2session object"""
         self.app.close()
+
+    @property
+    def mail_api_url(self):
+        return current_app.config.get('ZOHO_MAIL_API_URL', 'https://mail.zoho.com').rstrip('/')
+
+    def __count_bytes(self, call, received):
+        with self.__bytes_lock:
+            self.bytes_received[call] = self.bytes_received.get(call, 0) + received
+
+    def __mail_get(self, call, path, params=None):
+        """GET a Zoho Mail resource, counting the bytes received"""
+        resp = self.app.get(f'{self.mail_api_url}/api/{path}', params=params)
+
+        resp.raise_for_status()
+
+        self.__count_bytes(call, len(resp.content))
+
+        return resp.json()['data']
+
+    @property
+    def mail_account_id(self):
+        """Zoho Mail id of the mailbox the token belongs to"""
+        if self.__mail_account_id is None:
+            accounts = self.__mail_get('accounts.list', 'accounts')
+            self.__mail_account_id = accounts[0]['accountId']
+        return self.__mail_account_id
+
+    def list_mail_folders(self):
+        """Every folder of the mailbox"""
+        return self.__mail_get('folders.list', f'accounts/{self.mail_account_id}/folders')
+
+    def search_emails(self, search_key, start=1, limit=ZOHO_SEARCH_LIMIT):
+        """One page of the messages matching ``search_key``, newest first.
+
+        ``start`` is the 1-based index of the first message of the page.
+        """
+        return self.__mail_get(
+            'messages.search',
+            f'accounts/{self.mail_account_id}/messages/search',
+            params={'searchKey': search_key, 'start': start, 'limit': limit},
+        )
+
+    def get_attachment_info(self, folder_id, message_id):
+        """Names, ids and sizes of a message's attachments"""
+        return self.__mail_get(
+            'attachmentinfo',
+            f'accounts/{self.mail_account_id}/folders/{folder_id}/messages/{message_id}/attachmentinfo',
+        )
+
+    def download_attachment(self, folder_id, message_id, attachment_id, file_obj,
+                            chunk_size=ZOHO_DOWNLOAD_CHUNK_SIZE):
+        """Stream an attachment's raw bytes into ``file_obj``, returning the number written"""
+        api_url = (
+            f'{self.mail_api_url}/api/accounts/{self.mail_account_id}/folders/{folder_id}'
+            f'/messages/{message_id}/attachments/{attachment_id}'
+        )
+        written = 0
+        with self.app.get(api_url, stream=True) as resp:
+            resp.raise_for_status()
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                written += file_obj.write(chunk)
+
+        self.__count_bytes('attachments.get', written)
+
+        return written
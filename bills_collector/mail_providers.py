@@ -0,0 +1,342 @@
+"""Mail providers the inbox pipeline reads bills from.
+
+Every inbox account type has a ``MailProvider`` that lists the messages a
+rule matches, fetches a message's parts and downloads an attachment to disk.
+``process_inbox`` only talks to this interface, so Gmail and Zoho Mail
+inboxes go through the same pipeline.
+
+A provider also declares its ``capabilities``: how many requests one account
+may have in flight, which sizes the pipeline's download threads, and how
+many messages one listing returns, which is also the batch checked against
+the processed emails in one query.
+
+Listings cover the last ``SEARCH_WINDOW`` unless given a date range, and
+every page carries the cursor of the next one, so a backfill can checkpoint
+it and resume the listing where it stopped.
+
+The periodic scan lists an inbox with ``stream_inbox``, which Gmail answers
+with one search for all of an account's rules where the query length
+allows (see ``bills_collector/query_planner.py``); the pipeline then routes
+each message of such a page to its rule from the headers ``fetch_headers``
+returns.
+"""
+from dataclasses import dataclass, replace
+from datetime import date, datetime, time, timedelta
+from functools import partial
+import base64
+
+from flask import current_app
+
+from bills_collector.integrations import GoogleClient, ZohoClient
+from bills_collector.integrations.mime_parts import (
+    ATTACHMENT_MIME_TYPES,
+    MessagePart,
+    PartKind,
+    walk_message_parts,
+)
+from bills_collector.integrations.zoho_client import ZOHO_SEARCH_LIMIT
+from bills_collector.query_planner import RuleFilter, coalesced_criteria, plan_queries
+
+# Characters of base64 decoded per step when writing an attachment to disk
+ATTACHMENT_DECODE_CHUNK_SIZE = 64 * 1024
+
+# How far back rules look, as Gmail's newer_than:40d
+SEARCH_WINDOW = timedelta(days=40)
+
+
+def decode_attachment_data(data: str) -> bytes:
+    """Decode the urlsafe base64 body of a Gmail attachment"""
+    return base64.urlsafe_b64decode(data.encode("UTF-8"))
+
+
+def write_attachment_data(data: str, file_obj, chunk_size=ATTACHMENT_DECODE_CHUNK_SIZE) -> int:
+    """Decode the urlsafe base64 body of a Gmail attachment into ``file_obj``.
+
+    Works through ``data`` a chunk at a time, so only one chunk of encoded and
+    decoded bytes is alive besides ``data`` itself, instead of two full copies.
+    Returns the number of bytes written.
+    """
+    chunk_size -= chunk_size % 4    # whole base64 quanta, so chunks decode alone
+    written = 0
+
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        if len(chunk) % 4:
+            chunk += "=" * (-len(chunk) % 4)    # Gmail may drop the padding
+        written += file_obj.write(base64.urlsafe_b64decode(chunk))
+
+    return written
+
+
+@dataclass(frozen=True)
+class ProviderCapabilities:
+    """What a provider lets the pipeline do for one account"""
+
+    # requests one account may have in flight at once
+    max_concurrency: int
+    # messages listed per request, and so per dedupe query
+    page_size: int
+    # a cheap metadata call can rule a message out before it is fetched
+    metadata_first_pass: bool = False
+
+
+@dataclass(frozen=True)
+class MailMessage:
+    """A listed message, with its headers, date and leaf parts once fetched"""
+
+    message_id: str
+    # folder holding the message, for providers that address messages by folder
+    folder_id: str = None
+    received_on: date = None
+    parts: tuple = ()
+    sender: str = None
+    subject: str = None
+    mime_type: str = None
+
+
+@dataclass(frozen=True)
+class MessagePage:
+    """One listing request's messages, and where the listing resumes"""
+
+    messages: list
+    # cursor of the next page, None on the last one
+    next_cursor: str = None
+
+
+class MailProvider:
+    """Reads the messages of one inbox account.
+
+    Methods other than the ``stream_`` ones are called from the pipeline's
+    download threads, so they must not touch the database.
+    """
+
+    account_type = None
+    capabilities = ProviderCapabilities(max_concurrency=1, page_size=100)
+
+    def __init__(self, client):
+        self.client = client
+
+    def stream_pages(self, rule, since=None, until=None, cursor=None, page_size=None):
+        """Lazily yield a ``MessagePage`` per request for the messages ``rule`` matches.
+
+        ``since`` and ``until`` are inclusive dates, without them the listing
+        covers the last ``SEARCH_WINDOW``. ``cursor`` is the ``next_cursor``
+        of a page yielded before, to resume after it.
+        """
+        raise NotImplementedError
+
+    def stream_messages(self, rule):
+        """Lazily yield the non-empty pages of messages ``rule`` matched lately"""
+        for page in self.stream_pages(rule):
+            if page.messages:
+                yield page.messages
+
+    def stream_inbox(self, rules):
+        """Lazily yield ``(filters, messages)`` for the non-empty pages ``rules`` matched lately.
+
+        Every message of a page matches one of ``filters``, the
+        ``RuleFilter``s of the rules its search was for; with more than one
+        the message's headers tell which.
+        """
+        for rule in rules:
+            filters = [RuleFilter.of(rule)]
+            for messages in self.stream_messages(rule):
+                yield filters, messages
+
+    def fetch_headers(self, message) -> MailMessage:
+        """``message`` with its sender, subject and top-level MIME type"""
+        raise NotImplementedError
+
+    def is_worth_fetching(self, message) -> bool:    # pylint: disable=unused-argument
+        """Whether a cheap look at ``message`` says it can carry a bill"""
+        return True
+
+    def fetch_parts(self, message) -> MailMessage:
+        """``message`` with its date and leaf parts"""
+        raise NotImplementedError
+
+    def fetch_attachment(self, message, part, file_obj) -> int:
+        """Write ``part``'s bytes to ``file_obj``, returning the number written"""
+        raise NotImplementedError
+
+    @property
+    def bytes_received(self):
+        """Bytes received from the provider so far, per API call"""
+        return self.client.bytes_received
+
+    def close(self):
+        self.client.close()
+
+
+class GmailProvider(MailProvider):
+    """Gmail, through the REST API with partial responses"""
+
+    account_type = 'gmail'
+    # 250 quota units per user per second, a messages.get costs 5
+    capabilities = ProviderCapabilities(max_concurrency=8, page_size=500, metadata_first_pass=True)
+
+    def __init__(self, account):
+        super().__init__(GoogleClient(token=account.token_json))
+        if not current_app.config['GMAIL_METADATA_FIRST_PASS']:
+            self.capabilities = replace(self.capabilities, metadata_first_pass=False)
+        self.query_max_length = current_app.config['GMAIL_QUERY_MAX_LENGTH']
+
+    def stream_pages(self, rule, since=None, until=None, cursor=None, page_size=None):
+        return self.list_pages(
+            partial(self.client.fetch_inbox_emails, from_address=rule.email_from,
+                    subject_text=rule.email_subject, since=since, until=until),
+            cursor=cursor, page_size=page_size,
+        )
+
+    def stream_inbox(self, rules):
+        # room the rules' terms have next to the rest of the query and a space
+        max_length = self.query_max_length - len(self.client.inbox_query('')) - 1
+        for group in plan_queries([RuleFilter.of(rule) for rule in rules], max_length):
+            if len(group) == 1:
+                pages = (page.messages for page in self.stream_pages(group[0].rule))
+            else:
+                pages = (page.messages for page in self.search_pages(coalesced_criteria(group)))
+            for messages in pages:
+                if messages:
+                    yield group, messages
+
+    def search_pages(self, criteria, since=None, until=None, cursor=None, page_size=None):
+        """Lazily yield a ``MessagePage`` per request for the messages matching ``criteria``"""
+        return self.list_pages(
+            partial(self.client.search_inbox_emails, criteria, since=since, until=until),
+            cursor=cursor, page_size=page_size,
+        )
+
+    def list_pages(self, list_page, cursor=None, page_size=None):
+        """Follow ``list_page``'s ``nextPageToken``s from ``cursor``"""
+        page_token = cursor
+        while True:
+            page = list_page(page_token=page_token, max_results=page_size or self.capabilities.page_size)
+            page_token = page.get("nextPageToken")
+            yield MessagePage(
+                [MailMessage(email["id"]) for email in page.get("messages", [])],
+                next_cursor=page_token,
+            )
+            if not page_token:
+                return
+
+    def fetch_headers(self, message):
+        payload = self.client.fetch_email_metadata(message.message_id).get("payload", {})
+        headers = {header["name"].lower(): header["value"] for header in payload.get("headers", [])}
+        return replace(
+            message,
+            sender=headers.get("from", ""),
+            subject=headers.get("subject", ""),
+            mime_type=payload.get("mimeType", ""),
+        )
+
+    def is_worth_fetching(self, message):
+        if message.mime_type is None:
+            message = self.fetch_headers(message)
+        mime_type = message.mime_type
+        return mime_type.startswith("multipart/") or mime_type in ATTACHMENT_MIME_TYPES
+
+    def fetch_parts(self, message):
+        email_msg = self.client.fetch_one_email(message.message_id)
+        return replace(
+            message,
+            received_on=date.fromtimestamp(int(email_msg["internalDate"]) / 1000),  # epoch time in ms
+            parts=tuple(walk_message_parts(email_msg["payload"])),
+        )
+
+    def fetch_attachment(self, message, part, file_obj):
+        if part.is_inline:
+            # small attachments come inline, no extra round-trip
+            return write_attachment_data(part.data, file_obj)
+
+        attachment = self.client.get_email_attachment(
+            message_id=message.message_id, attachment_id=part.attachment_id
+        )
+        return write_attachment_data(attachment["data"], file_obj)
+
+
+class ZohoMailProvider(MailProvider):
+    """Zoho Mail, searching the inbox folder page by page"""
+
+    account_type = 'zoho'
+    # Zoho Mail throttles each user well before Gmail does
+    capabilities = ProviderCapabilities(max_concurrency=4, page_size=ZOHO_SEARCH_LIMIT)
+
+    def __init__(self, account):
+        super().__init__(ZohoClient(token=account.token_json))
+        self.__inbox_folder_id = None
+
+    @property
+    def inbox_folder_id(self):
+        if self.__inbox_folder_id is None:
+            self.__inbox_folder_id = next(
+                folder["folderId"] for folder in self.client.list_mail_folders()
+                if folder.get("folderType") == "Inbox"
+            )
+        return self.__inbox_folder_id
+
+    def stream_pages(self, rule, since=None, until=None, cursor=None, page_size=None):
+        # the search has no date range, results are filtered on their date instead
+        search_key = f"sender:{rule.email_from}::subject:{rule.email_subject}::has:attachment"
+        page_size = page_size or self.capabilities.page_size
+        oldest = datetime.combine(since, time.min) if since else datetime.now() - SEARCH_WINDOW
+        newest = datetime.combine(until + timedelta(days=1), time.min) if until else None
+        start = int(cursor or 1)
+        while True:
+            page = self.client.search_emails(search_key, start=start, limit=page_size)
+
+            messages = []
+            exhausted = len(page) < page_size
+            for email in page:
+                received_at = datetime.fromtimestamp(int(email["receivedTime"]) / 1000)  # epoch time in ms
+                if received_at < oldest:
+                    # results are newest first, everything after is older still
+                    exhausted = True
+                    break
+                if newest is not None and received_at >= newest:
+                    continue
+                if email.get("folderId") == self.inbox_folder_id and email.get("hasAttachment") != "0":
+                    messages.append(MailMessage(
+                        email["messageId"], folder_id=email["folderId"], received_on=received_at.date()
+                    ))
+
+            start += len(page)
+            yield MessagePage(messages, next_cursor=None if exhausted else str(start))
+            if exhausted:
+                return
+
+    def fetch_parts(self, message):
+        info = self.client.get_attachment_info(message.folder_id, message.message_id)
+        pdfs = [
+            attachment for attachment in info.get("attachments", [])
+            if attachment["attachmentName"].lower().endswith(".pdf")
+        ]
+        return replace(message, parts=tuple(
+            MessagePart(
+                kind=PartKind.PDF,
+                part_id=str(index),
+                mime_type="application/pdf",
+                filename=attachment["attachmentName"],
+                size=int(attachment.get("attachmentSize", 0)),
+                attachment_id=str(attachment["attachmentId"]),
+            )
+            for index, attachment in enumerate(pdfs)
+        ))
+
+    def fetch_attachment(self, message, part, file_obj):
+        return self.client.download_attachment(
+            message.folder_id, message.message_id, part.attachment_id, file_obj
+        )
+
+
+# Provider of each inbox account type
+PROVIDERS = {provider.account_type: provider for provider in (GmailProvider, ZohoMailProvider)}
+
+
+def get_provider(account) -> MailProvider:
+    """Provider reading ``account``'s inbox"""
+    try:
+        provider_class = PROVIDERS[account.account_type]
+    except KeyError:
+        raise ValueError(f"No mail provider for {account.account_type} accounts") from None
+    return provider_class(account)
@@ -0,0 +1,169 @@
+"""Prometheus metrics for the inbox ingestion pipeline.
+
+Every stage of ``process_inbox`` and ``extract_bill_info`` is timed
+with ``track_stage``, labelled by the inbox's account type and the stage.
+The stage is also recorded as a Sentry span of the running trace.
+
+The web app serves the metrics on ``/metrics``; Celery workers serve them on
+``WORKER_METRICS_PORT``. Under gunicorn or the prefork pool each child
+process has its own counters, so set ``PROMETHEUS_MULTIPROC_DIR`` to an
+empty, writable directory shared by all processes of a service: the values
+are then written there and aggregated on every scrape.
+"""
+from contextlib import contextmanager
+import os
+import time
+
+from celery.signals import worker_process_shutdown, worker_ready
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+from bills_collector.tracing import record_stage_span, stage_span
+
+# Pipeline stages, in the order an email goes through them
+STAGES = (
+    'list', 'dedupe', 'metadata', 'fetch', 'attachment', 'decrypt', 'optimise', 'upload',
+    'db_write', 'llm',
+)
+
+# From a dedupe query (ms) up to a slow LLM call (tens of seconds)
+STAGE_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    'bills_pipeline_stage_seconds',
+    'Time spent in a stage of the inbox pipeline',
+    ['account_type', 'stage'],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    'bills_pipeline_stage_errors',
+    'Stage executions that failed',
+    ['account_type', 'stage'],
+)
+EMAILS_PROCESSED = Counter(
+    'bills_pipeline_emails_processed',
+    'Emails saved as bills',
+    ['account_type'],
+)
+API_BYTES_RECEIVED = Counter(
+    'bills_pipeline_api_bytes_received',
+    'Response bytes received from the mail provider',
+    ['account_type', 'call'],
+)
+PDF_BYTES = Counter(
+    'bills_pipeline_pdf_bytes',
+    'Size of the PDFs as downloaded and as uploaded after optimisation',
+    ['account_type', 'version'],
+)
+PDF_BYTES_SAVED = Histogram(
+    'bills_pipeline_pdf_bytes_saved',
+    'Bytes the optimisation stage took off each PDF',
+    ['account_type'],
+    buckets=(0, 16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2),
+)
+DRIVE_UPLOADS = Counter(
+    'bills_pipeline_drive_uploads',
+    'PDFs put in a Drive folder, by what it took: created, revised, tagged or skipped',
+    ['account_type', 'action'],
+)
+CLIENT_POOL_REQUESTS = Counter(
+    'bills_client_pool_requests',
+    'Lookups in a pool of API clients, by whether a pooled client was reused',
+    ['pool', 'result'],
+)
+CLIENT_POOL_EVICTIONS = Counter(
+    'bills_client_pool_evictions',
+    'Clients closed and dropped from a pool: expired, size, discarded or shutdown',
+    ['pool', 'reason'],
+)
+HTTP_REQUESTS = Counter(
+    'bills_http_requests',
+    'Outbound HTTP requests sent through the shared transport',
+    ['host'],
+)
+HTTP_CONNECTIONS_OPENED = Counter(
+    'bills_http_connections_opened',
+    'Outbound connections the shared transport had to open, i.e. could not reuse',
+    ['host'],
+)
+BILLS_EXTRACTED = Counter(
+    'bills_pipeline_bills_extracted',
+    'Bills updated with the details extracted by the LLM',
+    ['account_type'],
+)
+
+
+@contextmanager
+def track_stage(stage, account_type):
+    """Time the block as ``stage``, counting it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        with stage_span(stage, account_type):
+            yield
+    except Exception:
+        STAGE_ERRORS.labels(account_type, stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(account_type, stage).observe(time.perf_counter() - start)
+
+
+def record_stage(stage, account_type, started_at, finished_at):
+    """Time a stage that ran elsewhere, e.g. in the PDF pool, from its wall clock"""
+    record_stage_span(stage, account_type, started_at, finished_at)
+    STAGE_SECONDS.labels(account_type, stage).observe(finished_at - started_at)
+
+
+def record_pdf_size(account_type, bytes_in, bytes_out):
+    """Count a PDF's size before and after the optimisation stage"""
+    PDF_BYTES.labels(account_type, 'downloaded').inc(bytes_in)
+    PDF_BYTES.labels(account_type, 'optimised').inc(bytes_out)
+    PDF_BYTES_SAVED.labels(account_type).observe(max(bytes_in - bytes_out, 0))
+
+
+def record_stage_error(stage, account_type):
+    """Count a stage failure that is reported rather than raised"""
+    STAGE_ERRORS.labels(account_type, stage).inc()
+
+
+def multiprocess_enabled():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def get_registry():
+    """Registry to expose: the aggregate of every process in multiprocess mode"""
+    if not multiprocess_enabled():
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics():
+    """Body and content type of a scrape"""
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+@worker_ready.connect
+def start_worker_exporter(sender, **kwargs):    # pylint: disable=unused-argument
+    """Serve the worker's metrics from the main worker process"""
+    from bills_collector.extensions import celery    # pylint: disable=import-outside-toplevel
+
+    port = celery.app.config.get('WORKER_METRICS_PORT')
+    if port:
+        start_http_server(port, registry=get_registry())
+
+
+@worker_process_shutdown.connect
+def mark_worker_process_dead(pid=None, **kwargs):    # pylint: disable=unused-argument
+    """Let the aggregate drop the live-only values of an exited pool process"""
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -68,6 +68,7 @@ class InboxRule(db.Model):
     email_from: str
     email_subject: str
     attachment_password: str
+    attachment_passwords: list
     destination_folder_id: str
     destination_folder_name: str
     destination_account_id: str
@@ -80,6 +81,8 @@ class InboxRule(db.Model):
     email_from = db.Column(db.String(150), nullable=False)
     email_subject = db.Column(db.String(150), nullable=False)
     attachment_password = db.Column(db.String(50), nullable=False)
+    # more passwords to try when the statement's password changes over time
+    attachment_passwords = db.Column(JSONB, nullable=False, default=list, server_default="[]")
     destination_folder_id = db.Column(db.String(150))
     destination_folder_name = db.Column(db.String(150))
     destination_account_id = db.Column(
@@ -96,6 +99,12 @@ class InboxRule(db.Model):
         "LinkedAccount", foreign_keys=[destination_account_id]
     )
 
+    @property
+    def candidate_passwords(self):
+        """Every password to try on an attachment, without duplicates"""
+        passwords = [self.attachment_password, *(self.attachment_passwords or [])]
+        return list(dict.fromkeys(passwords)) or [""]
+
     def __repr__(self):
         return "<InboxRule {}>".format(self.id)
 
@@ -116,6 +125,12 @@ class ProcessedEmail(db.Model):
 
     account = relationship("LinkedAccount", foreign_keys=[account_id])
 
+    # An email is processed once per inbox, even with a scan and a backfill listing it
+    # at once. Dedupe lookups filter on both columns for a batch of listed emails.
+    __table_args__ = (
+        db.UniqueConstraint("account_id", "email_id", name="uq_processed_emails_account_email"),
+    )
+
     def __repr__(self):
         return "<ProcessedEmail {}>".format(self.id)
 
@@ -147,5 +162,171 @@ class Bill(db.Model):
 
     account = relationship("LinkedAccount", foreign_keys=[account_id])
 
+    # Keyset pagination walks (due_date, id) within an account, optionally
+    # narrowed by status. The listed columns are included so pages are
+    # served from the index alone.
+    __table_args__ = (
+        db.Index(
+            "ix_bills_account_due_date_id",
+            "account_id", "due_date", "id",
+            postgresql_include=["amount", "bill_date", "status", "bill_url"],
+        ),
+        db.Index(
+            "ix_bills_account_status_due_date_id",
+            "account_id", "status", "due_date", "id",
+            postgresql_include=["amount", "bill_date", "bill_url"],
+        ),
+    )
+
     def __repr__(self):
         return "<Bill {}>".format(self.id)
+
+
+@dataclass
+class BillMonthlyTotal(db.Model):
+    """Per account monthly bill totals, maintained incrementally"""
+
+    account_id: str
+    month: datetime
+    total_amount: float
+    bill_count: int
+
+    __tablename__ = "bill_monthly_totals"
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey("users.id"), nullable=False)
+    account_id = db.Column(
+        UUID(as_uuid=True), db.ForeignKey("linked_accounts.id"), nullable=False
+    )
+    month = db.Column(db.Date, nullable=False)  # first day of the month
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    bill_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (PrimaryKeyConstraint("user_id", "account_id", "month"),)
+
+    def __repr__(self):
+        return "<BillMonthlyTotal {} {}>".format(self.account_id, self.month)
+
+
+@dataclass
+class InboxBackfill(db.Model):
+    """Import of a rule's emails over a past date range, checkpointed per page"""
+
+    id: str
+    rule_id: str
+    start_date: datetime
+    end_date: datetime
+    status: str
+    pages_done: int
+    messages_listed: int
+    emails_processed: int
+    error: str
+    created_at: datetime
+    last_update_at: datetime
+    finished_at: datetime
+
+    __tablename__ = "inbox_backfills"
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4, nullable=False)
+    user_id = db.Column(UUID(as_uuid=True), db.ForeignKey("users.id"))
+    rule_id = db.Column(UUID(as_uuid=True), db.ForeignKey("inbox_rules.id"), nullable=False)
+    # received dates covered, both inclusive
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    # pending, running, completed or failed
+    status = db.Column(db.String(20), nullable=False, default="pending")
+    # where the provider's listing resumes, None before the first page
+    page_cursor = db.Column(db.String(500))
+    pages_done = db.Column(db.Integer, nullable=False, default=0)
+    messages_listed = db.Column(db.Integer, nullable=False, default=0)
+    emails_processed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    last_update_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = db.Column(db.DateTime)
+
+    rule = relationship("InboxRule")
+
+    # resumed by status, and listed per rule
+    __table_args__ = (
+        db.Index("ix_inbox_backfills_status", "status"),
+        db.Index("ix_inbox_backfills_rule_created", "rule_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return "<InboxBackfill {}>".format(self.id)
+
+
+@dataclass
+class ProcessingRun(db.Model):
+    """One scan of every inbox with rules, as queued by ``check_inbox``"""
+
+    id: str
+    status: str
+    accounts_total: int
+    started_at: datetime
+    finished_at: datetime
+
+    __tablename__ = "processing_runs"
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4, nullable=False)
+    # running, completed, or interrupted when the next run started first
+    status = db.Column(db.String(20), nullable=False, default="running")
+    accounts_total = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # when its last account finished
+    finished_at = db.Column(db.DateTime)
+
+    # listed newest first
+    __table_args__ = (
+        db.Index("ix_processing_runs_started_at", "started_at"),
+    )
+
+    def __repr__(self):
+        return "<ProcessingRun {}>".format(self.id)
+
+
+@dataclass
+class ProcessingRunAccount(db.Model):
+    """Progress of one inbox in a processing run, its counters written in batches"""
+
+    id: str
+    run_id: str
+    account_id: str
+    status: str
+    listed: int
+    duplicates: int
+    skipped: int
+    fetched: int
+    uploaded: int
+    extracted: int
+    failed: int
+    error: str
+    queued_at: datetime
+    started_at: datetime
+    finished_at: datetime
+
+    __tablename__ = "processing_run_accounts"
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4, nullable=False)
+    run_id = db.Column(UUID(as_uuid=True), db.ForeignKey("processing_runs.id"), nullable=False)
+    account_id = db.Column(UUID(as_uuid=True), db.ForeignKey("linked_accounts.id"), nullable=False)
+    # queued, running, completed or failed
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    # emails listed, already processed, ruled out before download and downloaded,
+    # PDFs uploaded to Drive, bills extracted, and failed uploads and extractions
+    listed = db.Column(db.Integer, nullable=False, default=0)
+    duplicates = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    fetched = db.Column(db.Integer, nullable=False, default=0)
+    uploaded = db.Column(db.Integer, nullable=False, default=0)
+    extracted = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    queued_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    # one row per account and run, read per run
+    __table_args__ = (
+        db.Index("ix_processing_run_accounts_run_account", "run_id", "account_id", unique=True),
+    )
+
+    def __repr__(self):
+        return "<ProcessingRunAccount {} {}>".format(self.run_id, self.account_id)
@@ -0,0 +1,232 @@
+"""CPU bound PDF work of the inbox pipeline, run in a pool of processes.
+
+Decrypting and re-saving a statement holds the GIL for as long as pikepdf
+takes, so it is handed to a ``ProcessPoolExecutor`` of ``PDF_WORKERS``
+processes, one by default as every prefork child of the worker starts its
+own pool. ``process_inbox`` keeps downloading the next emails while
+earlier ones decrypt, with at most ``max_in_flight`` emails waiting on it.
+With ``PDF_WORKERS = 0`` the work runs inline in the calling process.
+pikepdf is only imported by the functions using it, so the web app, which
+configures the pool but never decrypts, does not load it.
+
+The decrypted copy is written size optimised, see ``SaveOptions``, so large
+scanned statements upload faster and take less space in Drive.
+
+A rule may list several candidate passwords. The one that opened a sender's
+statement is remembered in the ``cache`` extension, as its index among the rule's
+passwords rather than the password itself, and is tried first next time.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+import multiprocessing
+import os
+import threading
+import time
+
+from celery.signals import worker_process_shutdown
+
+from bills_collector.extensions import cache
+
+# How long the password that worked for a sender is remembered
+PASSWORD_CACHE_TIMEOUT = 30 * 24 * 3600
+
+
+class NoMatchingPassword(Exception):
+    """None of a rule's candidate passwords opens the PDF"""
+
+
+@dataclass(frozen=True)
+class SaveOptions:
+    """How the decrypted copy of a PDF is written"""
+
+    # pack objects into compressed object streams
+    object_streams: bool = False
+    # decompress and compress again flate streams written at a low level
+    recompress_streams: bool = False
+    # drop fonts, images etc. that no page refers to
+    remove_unused_resources: bool = False
+    # so viewers such as Drive show the first page before the rest arrives
+    linearize: bool = False
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            object_streams=config.get("PDF_OBJECT_STREAMS", False),
+            recompress_streams=config.get("PDF_RECOMPRESS_STREAMS", False),
+            remove_unused_resources=config.get("PDF_REMOVE_UNUSED_RESOURCES", False),
+            linearize=config.get("PDF_LINEARIZE", False),
+        )
+
+
+@dataclass
+class DecryptResult:
+    """Outcome of decrypting one PDF, as sent back by the pool process"""
+
+    password_index: int
+    # wall clock, so the stages can be timed and traced from the parent
+    started_at: float
+    opened_at: float
+    finished_at: float
+    # size of the downloaded file and of the decrypted, optimised copy
+    bytes_in: int
+    bytes_out: int
+
+    @property
+    def seconds(self):
+        return self.finished_at - self.started_at
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_in - self.bytes_out
+
+
+def save_pdf(pdf, dest_path, options=None):
+    """Save ``pdf`` decrypted, applying the size ``options``"""
+    import pikepdf    # pylint: disable=import-outside-toplevel
+    options = options or SaveOptions()
+    if options.remove_unused_resources:
+        pdf.remove_unreferenced_resources()
+
+    pdf.save(
+        dest_path,
+        object_stream_mode=(
+            pikepdf.ObjectStreamMode.generate if options.object_streams
+            else pikepdf.ObjectStreamMode.preserve
+        ),
+        recompress_flate=options.recompress_streams,
+        linearize=options.linearize,
+        # same input, same bytes: lets Drive uploads be skipped by checksum
+        deterministic_id=True,
+    )
+
+
+def decrypt_pdf(src_path, dest_path, password, options=None):
+    """Open a (possibly encrypted) PDF and save a decrypted copy"""
+    import pikepdf    # pylint: disable=import-outside-toplevel
+    pdf = pikepdf.open(src_path, password=password)
+    try:
+        save_pdf(pdf, dest_path, options)
+    finally:
+        pdf.close()
+
+
+def decrypt_with_candidates(src_path, dest_path, passwords, options=None) -> DecryptResult:
+    """Decrypt ``src_path`` with the first of ``passwords`` that opens it"""
+    import pikepdf    # pylint: disable=import-outside-toplevel
+    started_at = time.time()
+    for index, password in enumerate(passwords):
+        try:
+            pdf = pikepdf.open(src_path, password=password)
+        except pikepdf.PasswordError:
+            continue
+        break
+    else:
+        raise NoMatchingPassword(f"No candidate password opens {src_path}")
+
+    opened_at = time.time()
+    try:
+        save_pdf(pdf, dest_path, options)
+    finally:
+        pdf.close()
+
+    return DecryptResult(
+        password_index=index,
+        started_at=started_at,
+        opened_at=opened_at,
+        finished_at=time.time(),
+        bytes_in=os.path.getsize(src_path),
+        bytes_out=os.path.getsize(dest_path),
+    )
+
+
+def password_cache_key(rule_id, sender):
+    return f"pdf-password:{rule_id}:{sender.lower()}"
+
+
+def order_passwords(rule_id, sender, passwords):
+    """``passwords`` with the one that last worked for this sender first"""
+    passwords = list(passwords)
+    try:
+        index = cache.get_json(password_cache_key(rule_id, sender))
+    except ValueError:
+        # not written by remember_password, ignore it
+        index = None
+    if not isinstance(index, int) or not 0 <= index < len(passwords):
+        return passwords
+
+    return [passwords[index]] + passwords[:index] + passwords[index + 1:]
+
+
+def remember_password(rule_id, sender, passwords, password):
+    """Remember which of the rule's ``passwords`` opened the sender's statement, by its index"""
+    cache.set_json(
+        password_cache_key(rule_id, sender),
+        list(passwords).index(password),
+        timeout=PASSWORD_CACHE_TIMEOUT,
+    )
+
+
+class PdfProcessor:
+    """Lazily started process pool for the PDF stages"""
+
+    def __init__(self):
+        self.max_workers = 0
+        self.save_options = SaveOptions()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def configure(self, app):
+        self.max_workers = app.config.get("PDF_WORKERS", 1)
+        self.save_options = SaveOptions.from_config(app.config)
+
+    @property
+    def max_in_flight(self):
+        """PDFs queued at once: enough to keep every process busy"""
+        return max(self.max_workers * 2, 1)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the parent runs sentry, db and http threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def submit_decrypt(self, src_path, dest_path, passwords) -> Future:
+        """Decrypt in the pool, the future resolves to a ``DecryptResult``"""
+        if not self.max_workers:
+            future = Future()
+            try:
+                future.set_result(
+                    decrypt_with_candidates(src_path, dest_path, passwords, self.save_options)
+                )
+            except Exception as e:    # pylint: disable=broad-except
+                future.set_exception(e)
+            return future
+
+        # the pool processes keep the working directory they were started in
+        return self._get_executor().submit(
+            decrypt_with_candidates,
+            os.path.abspath(src_path), os.path.abspath(dest_path), passwords, self.save_options
+        )
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+
+pdf_processor = PdfProcessor()
+
+
+def configure(app):
+    pdf_processor.configure(app)
+
+
+@worker_process_shutdown.connect
+def shutdown_pdf_processor(**kwargs):    # pylint: disable=unused-argument
+    """Stop the pool processes along with the worker process that owns them"""
+    pdf_processor.shutdown()
@@ -0,0 +1,140 @@
+"""Ledger of processing runs in ``processing_runs`` and ``processing_run_accounts``.
+
+``check_inbox`` starts a run with a row per inbox it queues. While
+``process_inbox`` works through an inbox, ``RunProgress`` counts its emails in
+memory and adds them to the inbox's row at most every
+``PROCESSING_RUN_FLUSH_SECONDS``, with one ``UPDATE`` of relative increments,
+instead of writing the row for every email. The run finishes with its last
+inbox, so the API and the dashboard read progress off a few small rows.
+"""
+from datetime import datetime, timezone
+import time
+
+from sqlalchemy import exists, update
+
+from bills_collector.extensions import db
+from bills_collector.models import ProcessingRun, ProcessingRunAccount
+
+# Counters of a run's inbox, as columns of processing_run_accounts
+COUNTERS = ("listed", "duplicates", "skipped", "fetched", "uploaded", "extracted", "failed")
+
+# Inboxes of a run still to finish
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def start_run(account_ids):
+    """Record a run over ``account_ids``, each queued, and return its id.
+
+    Runs still going are marked interrupted: their inboxes may never finish
+    when a worker died, and a new run lists the same emails anyway.
+    """
+    now = datetime.now(timezone.utc)
+    db.session.execute(
+        update(ProcessingRun)
+        .where(ProcessingRun.status == "running")
+        .values(status="interrupted", finished_at=now)
+    )
+
+    run = ProcessingRun(accounts_total=len(account_ids), started_at=now)
+    if not account_ids:
+        run.status, run.finished_at = "completed", now
+    db.session.add(run)
+    db.session.flush()
+    db.session.add_all(
+        ProcessingRunAccount(run_id=run.id, account_id=account_id, queued_at=now)
+        for account_id in account_ids
+    )
+    # read before the commit expires it
+    run_id = run.id
+    db.session.commit()
+    return run_id
+
+
+def start_account(run_id, account_id, flush_seconds=10.0) -> "RunProgress":
+    """Mark an inbox of ``run_id`` running and count its progress.
+
+    Without a run, e.g. when the inbox was queued on its own, it gets a run of
+    its own, leaving any scan going on alone.
+    """
+    now = datetime.now(timezone.utc)
+    run_account_id = None
+    if run_id is not None:
+        run_account_id = db.session.execute(
+            update(ProcessingRunAccount)
+            .where(ProcessingRunAccount.run_id == run_id, ProcessingRunAccount.account_id == account_id)
+            .values(status="running", error=None, started_at=now)
+            .returning(ProcessingRunAccount.id)
+        ).scalar()
+    else:
+        run = ProcessingRun(accounts_total=1, started_at=now)
+        db.session.add(run)
+        db.session.flush()
+        run_id = run.id
+
+    if run_account_id is None:
+        run_account = ProcessingRunAccount(
+            run_id=run_id, account_id=account_id, status="running", queued_at=now, started_at=now
+        )
+        db.session.add(run_account)
+        db.session.flush()
+        run_account_id = run_account.id
+
+    db.session.commit()
+    return RunProgress(run_id, run_account_id, flush_seconds)
+
+
+def finish_account(progress, error=None):
+    """Mark an inbox completed or failed, and its run completed after its last inbox"""
+    now = datetime.now(timezone.utc)
+    progress.flush(status="completed" if error is None else "failed", error=error, finished_at=now)
+
+    # after the commit above, so of two inboxes finishing together the later sees both done
+    still_active = exists().where(
+        ProcessingRunAccount.run_id == ProcessingRun.id,
+        ProcessingRunAccount.status.in_(ACTIVE_STATUSES),
+    )
+    db.session.execute(
+        update(ProcessingRun)
+        .where(ProcessingRun.id == progress.run_id, ProcessingRun.status == "running", ~still_active)
+        .values(status="completed", finished_at=now)
+    )
+    db.session.commit()
+
+
+class RunProgress:
+    """Counters of an inbox's run, added to its ledger row in batches.
+
+    Only the task's thread counts and flushes, as it owns the database
+    session. Without ``run_account_id``, e.g. for a backfill, nothing is written.
+    """
+
+    def __init__(self, run_id=None, run_account_id=None, flush_seconds=10.0):
+        self.run_id = run_id
+        self.run_account_id = run_account_id
+        self.flush_seconds = flush_seconds
+        self.pending = dict.fromkeys(COUNTERS, 0)
+        self.flushed_at = time.monotonic()
+
+    def add(self, counter, count=1):
+        self.pending[counter] += count
+
+    def flush_if_due(self):
+        if time.monotonic() - self.flushed_at >= self.flush_seconds:
+            self.flush()
+
+    def flush(self, **values):
+        """Add the counts since the last flush to the ledger row, with ``values``"""
+        values.update(
+            (counter, getattr(ProcessingRunAccount, counter) + count)
+            for counter, count in self.pending.items() if count
+        )
+        if values and self.run_account_id is not None:
+            db.session.execute(
+                update(ProcessingRunAccount)
+                .where(ProcessingRunAccount.id == self.run_account_id)
+                .values(**values)
+            )
+            db.session.commit()
+
+        self.pending = dict.fromkeys(COUNTERS, 0)
+        self.flushed_at = time.monotonic()
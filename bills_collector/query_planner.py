@@ -0,0 +1,124 @@
+"""Coalescing of an account's rules into a few Gmail searches.
+
+Every rule used to list its own messages, so an account with many billers
+paid a ``messages.list`` per rule and run. ``plan_queries`` ORs the rules
+of an account together into as few searches as fit in the query length
+Gmail takes, and ``RuleFilter.matches`` sends each listed message back to
+its rule locally, from the From and Subject headers:
+
+- ``from:`` matches when every word of the rule's sender, usually just an
+  address or a domain, is in the From header;
+- ``subject:`` matches when every word of the rule's subject is in the
+  Subject header, as Gmail's grouped ``subject:(...)`` does.
+
+Like Gmail, words match whole tokens of the header, not any substring, so
+``from:bank`` does not match ``alerts@hdfcbank.com`` and route its messages
+to the wrong rule. A word holding punctuation, e.g. ``bank.com``, matches the
+same tokens in a row.
+"""
+from dataclasses import dataclass, field
+import re
+
+# Gmail search syntax, which would change the meaning of an OR'd query
+SEARCH_SYNTAX = re.compile(r'[(){}"]')
+
+
+def search_words(text) -> list:
+    """Words of ``text`` with the search syntax taken out"""
+    return SEARCH_SYNTAX.sub(' ', text or '').split()
+
+
+def search_term(operator, text) -> str:
+    """``operator`` applied to every word of ``text``, or nothing without any"""
+    words = search_words(text)
+    if not words:
+        return ''
+    return f"{operator}:{words[0]}" if len(words) == 1 else f"{operator}:({' '.join(words)})"
+
+
+# Runs of letters and digits, the tokens Gmail matches search words against
+TOKEN = re.compile(r'\w+')
+
+
+def tokens(text) -> list:
+    return TOKEN.findall((text or '').lower())
+
+
+def contains_run(header_tokens, run) -> bool:
+    """Whether ``run`` appears in ``header_tokens``, in a row"""
+    return any(
+        header_tokens[start:start + len(run)] == run
+        for start in range(len(header_tokens) - len(run) + 1)
+    )
+
+
+def contains_words(header, text) -> bool:
+    """Whether every word of ``text`` is in ``header``, as whole tokens"""
+    header_tokens = tokens(header)
+    return all(contains_run(header_tokens, tokens(word)) for word in search_words(text))
+
+
+@dataclass(frozen=True)
+class RuleFilter:
+    """The sender and subject a rule matches, read off its row once.
+
+    Download threads route messages with it, they must not touch ``rule``'s
+    attributes, which belong to the task's database session.
+    """
+
+    rule: object = field(compare=False)
+    rule_id: object
+    email_from: str
+    email_subject: str
+    passwords: tuple = ()
+
+    @classmethod
+    def of(cls, rule):
+        return cls(
+            rule=rule,
+            rule_id=rule.id,
+            email_from=rule.email_from or '',
+            email_subject=rule.email_subject or '',
+            passwords=tuple(rule.candidate_passwords),
+        )
+
+    @property
+    def clause(self) -> str:
+        """Search terms matching this rule alone"""
+        terms = filter(None, [search_term('from', self.email_from),
+                              search_term('subject', self.email_subject)])
+        return f"({' '.join(terms)})"
+
+    def matches(self, sender, subject) -> bool:
+        return contains_words(sender, self.email_from) and contains_words(subject, self.email_subject)
+
+
+def coalesced_criteria(filters) -> str:
+    """Search terms matching any of ``filters``"""
+    clauses = [rule_filter.clause for rule_filter in filters]
+    return clauses[0] if len(clauses) == 1 else f"{{{' '.join(clauses)}}}"
+
+
+def plan_queries(filters, max_length) -> list:
+    """Split ``filters`` into groups whose ``coalesced_criteria`` fit in ``max_length``.
+
+    Groups keep the order of ``filters``; a rule too long to share a search
+    gets one of its own.
+    """
+    # the braces of the OR, less the space before the first clause
+    groups, group, length = [], [], 1
+    for rule_filter in filters:
+        clause_length = len(rule_filter.clause) + 1
+        if group and length + clause_length > max_length:
+            groups.append(group)
+            group, length = [], 1
+        group.append(rule_filter)
+        length += clause_length
+    if group:
+        groups.append(group)
+    return groups
+
+
+def route(filters, sender, subject):
+    """The first of ``filters`` a message from ``sender`` about ``subject`` matches, if any"""
+    return next((rule_filter for rule_filter in filters if rule_filter.matches(sender, subject)), None)
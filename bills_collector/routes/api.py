@@ -1,14 +1,26 @@
 """Routes for API"""
-from datetime import datetime, timezone
+import base64
+import binascii
+from datetime import date, datetime, timedelta, timezone
+import json
+import time
+from uuid import UUID
 
 from authlib.integrations.base_client import OAuthError
-from flask import Blueprint, jsonify, make_response, request, current_app
+from flask import Blueprint, jsonify, make_response, request, current_app, stream_with_context
 from flask_login import current_user, login_required
+import requests
+from sqlalchemy import func, tuple_
 
-from bills_collector.extensions import db
+from bills_collector.caching import cacheable_json, conditional_json, invalidate_user_cache
+from bills_collector.extensions import celery, db
+from bills_collector.exports import EXPORT_FORMATS, export_bills
 from bills_collector.integrations import GoogleClient
-from bills_collector.models import LinkedAccount, InboxRule
-from bills_collector.tasks import inbox_tasks
+from bills_collector.aggregates import month_of
+from bills_collector.models import (
+    Bill, BillMonthlyTotal, InboxBackfill, LinkedAccount, InboxRule, ProcessingRun, ProcessingRunAccount
+)
+from bills_collector.processing_runs import COUNTERS
 
 # Blueprint Configuration
 api_bp = Blueprint(
@@ -18,12 +30,39 @@ api_bp = Blueprint(
 
 gdrive_app = None
 
+# Stop serving a cached access token this many seconds before it expires
+TOKEN_EXPIRY_MARGIN = 60
+
+BILLS_PAGE_SIZE = 50
+BILLS_MAX_PAGE_SIZE = 200
+
+SUMMARY_MONTHS = 12
+SUMMARY_DUE_WITHIN_DAYS = 7
+
+RUNS_PAGE_SIZE = 10
+RUNS_MAX_PAGE_SIZE = 50
+
 def custom_error(message, status_code):
     """Method to throw RESTful errors"""
     return make_response(jsonify(message), status_code)
 
+@api_bp.errorhandler(requests.ConnectionError)
+@api_bp.errorhandler(requests.Timeout)
+def upstream_unavailable(error):
+    """Google or Zoho did not answer within the web app's timeouts"""
+    current_app.logger.warning("Upstream request failed: %s", error)
+    return custom_error("Upstream service did not respond in time", 504)
+
+def parse_attachment_passwords(req_data):
+    """The optional list of extra passwords of an inbox rule request"""
+    passwords = req_data.get('attachment_passwords') or []
+    if not isinstance(passwords, list) or not all(isinstance(p, str) for p in passwords):
+        raise ValueError('attachment_passwords must be a list of strings')
+    return passwords
+
 @api_bp.route('/linked_accounts', methods=['GET'])
 @login_required
+@conditional_json
 def get_linked_accounts():
     """Get all linked account of this user"""
 
@@ -31,10 +70,11 @@ def get_linked_accounts():
         LinkedAccount.user_id == current_user.id
     ).all()
 
-    return jsonify({'linked_accounts': accounts}), 200
+    return cacheable_json({'linked_accounts': accounts}, accounts)
 
 @api_bp.route('/linked_accounts/<account_id>', methods=['GET'])
 @login_required
+@conditional_json
 def get_linked_account_by_id(account_id):
     """Get all linked account of this user"""
 
@@ -46,24 +86,21 @@ def get_linked_account_by_id(account_id):
     if account is None:
         return custom_error("", 404)
 
-    # ensure token is active
+    # ensure token is active, the session holds the refreshed token if it changed
     goog_client = GoogleClient(token=account.token_json)
-
-    # fetch token again incase it is refreshed
-    account = LinkedAccount.query.filter(
-        LinkedAccount.user_id == current_user.id,
-        LinkedAccount.id == account_id
-    ).first()
+    token = goog_client.app.token
+    goog_client.close()
 
     dict_account = {
         'id': account.id,
         'account_type': account.account_type,
-        'access_token': account.access_token
+        'access_token': token['access_token']
     }
 
-    goog_client.close()
+    # never serve the access token from cache after it has expired
+    timeout = int(token['expires_at'] - time.time()) - TOKEN_EXPIRY_MARGIN
 
-    return jsonify(dict_account), 200
+    return cacheable_json(dict_account, [account], timeout=max(timeout, 0))
 
 @api_bp.route('/linked_accounts/<account_id>/refresh_token', methods=['POST'])
 @login_required
@@ -84,11 +121,13 @@ def refresh_account_tokens(account_id):
     except OAuthError as e:
         current_app.logger.exception(e)
         return make_response('Not Ok', 410)
+    goog_client.close()
 
     return make_response('Ok', 200)
 
 @api_bp.route('/linked_accounts/<account_id>/inbox_rules')
 @login_required
+@conditional_json
 def get_rules_for_email_account(account_id):
     """Get all Inbox rules for the account"""
 
@@ -97,7 +136,7 @@ def get_rules_for_email_account(account_id):
         InboxRule.user_id == current_user.id
     ).all()
 
-    return jsonify({'inbox_rules': inbox_rules}), 200
+    return cacheable_json({'inbox_rules': inbox_rules}, inbox_rules)
 
 @api_bp.route('/linked_accounts/<account_id>/inbox_rules', methods=['POST'])
 @login_required
@@ -106,6 +145,11 @@ def create_rule_for_email_account(account_id):
 
     req_data = request.json
 
+    try:
+        attachment_passwords = parse_attachment_passwords(req_data)
+    except ValueError as e:
+        return custom_error(str(e), 400)
+
     inbox_rule = InboxRule(
         user_id = current_user.id,
         account_id = account_id,
@@ -113,6 +157,7 @@ def create_rule_for_email_account(account_id):
         email_from = req_data['email_from'],
         email_subject = req_data['email_subject'],
         attachment_password = req_data['attachment_password'],
+        attachment_passwords = attachment_passwords,
         destination_folder_id = req_data['destination_folder_id'],
         destination_folder_name = req_data['destination_folder_name'],
         destination_account_id = req_data['destination_account_id'],
@@ -120,6 +165,7 @@ def create_rule_for_email_account(account_id):
 
     db.session.add(inbox_rule)
     db.session.commit()
+    invalidate_user_cache(current_user.id)
 
     return jsonify(inbox_rule), 201
 
@@ -139,25 +185,379 @@ def update_rule_for_email_account(account_id, rule_id):
     if inbox_rule is None:
         return custom_error("", 404)
 
+    try:
+        attachment_passwords = parse_attachment_passwords(req_data)
+    except ValueError as e:
+        return custom_error(str(e), 400)
+
     inbox_rule.name = req_data['name']
     inbox_rule.last_update_at = datetime.now(timezone.utc)
     inbox_rule.email_from = req_data['email_from']
     inbox_rule.email_subject = req_data['email_subject']
     inbox_rule.attachment_password = req_data['attachment_password']
+    inbox_rule.attachment_passwords = attachment_passwords
     inbox_rule.destination_folder_id = req_data['destination_folder_id']
     inbox_rule.destination_folder_name = req_data['destination_folder_name']
     inbox_rule.destination_account_id = req_data['destination_account_id']
 
     db.session.commit()
+    invalidate_user_cache(current_user.id)
 
     return jsonify(inbox_rule), 200
 
+def queue_backfill(backfill):
+    """Run a backfill on a worker, by name so the web app does not import the tasks"""
+    celery.send_task('bills_collector.tasks.backfill_tasks.backfill_rule', args=[str(backfill.id)])
+
+@api_bp.route('/linked_accounts/<account_id>/inbox_rules/<rule_id>/backfills', methods=['POST'])
+@login_required
+def start_rule_backfill(account_id, rule_id):
+    """Import the rule's emails received between start_date and end_date
+
+    Body: start_date and end_date, inclusive ISO dates. The backfill runs in
+    the background, poll it at /api/backfills/<id>.
+    """
+
+    inbox_rule = InboxRule.query.filter(
+        InboxRule.id == rule_id,
+        InboxRule.account_id == account_id,
+        InboxRule.user_id == current_user.id
+    ).first()
+
+    if inbox_rule is None:
+        return custom_error("", 404)
+
+    req_data = request.json or {}
+    try:
+        start_date = date.fromisoformat(req_data['start_date'])
+        end_date = date.fromisoformat(req_data['end_date'])
+    except (KeyError, TypeError, ValueError):
+        return custom_error('start_date and end_date must be ISO dates', 400)
+    if start_date > end_date:
+        return custom_error('start_date must not be after end_date', 400)
+
+    backfill = InboxBackfill(
+        user_id=current_user.id,
+        rule_id=inbox_rule.id,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    db.session.add(backfill)
+    db.session.commit()
+    queue_backfill(backfill)
+
+    return jsonify(backfill), 202
+
+@api_bp.route('/linked_accounts/<account_id>/inbox_rules/<rule_id>/backfills', methods=['GET'])
+@login_required
+def get_rule_backfills(account_id, rule_id):
+    """Backfills of the rule, newest first"""
+
+    backfills = InboxBackfill.query.join(InboxRule).filter(
+        InboxBackfill.rule_id == rule_id,
+        InboxRule.account_id == account_id,
+        InboxBackfill.user_id == current_user.id
+    ).order_by(InboxBackfill.created_at.desc()).all()
+
+    return jsonify({'backfills': backfills}), 200
+
+@api_bp.route('/backfills/<backfill_id>', methods=['GET'])
+@login_required
+def get_backfill(backfill_id):
+    """Progress of a backfill"""
+
+    backfill = InboxBackfill.query.filter(
+        InboxBackfill.id == backfill_id,
+        InboxBackfill.user_id == current_user.id
+    ).first()
+
+    if backfill is None:
+        return custom_error("", 404)
+
+    return jsonify(backfill), 200
+
+@api_bp.route('/backfills/<backfill_id>/resume', methods=['POST'])
+@login_required
+def resume_backfill(backfill_id):
+    """Run a failed backfill again, from its last finished page"""
+
+    backfill = InboxBackfill.query.filter(
+        InboxBackfill.id == backfill_id,
+        InboxBackfill.user_id == current_user.id
+    ).first()
+
+    if backfill is None:
+        return custom_error("", 404)
+    if backfill.status != 'failed':
+        return custom_error(f'Backfill is {backfill.status}, only failed ones resume', 409)
+
+    backfill.status = 'pending'
+    backfill.last_update_at = datetime.now(timezone.utc)
+    db.session.commit()
+    queue_backfill(backfill)
+
+    return jsonify(backfill), 202
+
+def seconds_between(start, end):
+    """Seconds from ``start`` to ``end``, or to now while ``end`` is unset, in SQL"""
+    return func.extract('epoch', func.coalesce(end, func.now()) - start)
+
+def run_progress(row):
+    """A run's or inbox's counters, with the throughput and backlog they imply"""
+    progress = row._asdict()
+    duration = progress['duration_seconds'] = float(progress['duration_seconds'] or 0)
+    # listed emails neither known, ruled out nor downloaded yet
+    progress['backlog'] = (
+        progress['listed'] - progress['duplicates'] - progress['skipped'] - progress['fetched']
+    )
+    progress['emails_per_second'] = round(progress['fetched'] / duration, 2) if duration else 0.0
+    return progress
+
+@api_bp.route('/processing_runs', methods=['GET'])
+@login_required
+def get_processing_runs():
+    """Latest processing runs, newest first, with this user's inboxes' counters summed
+
+    Query params: limit. Reads the runs' ledger rows only, a few per run.
+    """
+
+    try:
+        limit = min(int(request.args.get('limit', RUNS_PAGE_SIZE)), RUNS_MAX_PAGE_SIZE)
+    except ValueError as e:
+        return custom_error(str(e), 400)
+    if limit < 1:
+        return custom_error('limit must be positive', 400)
+
+    user_accounts = db.session.query(LinkedAccount.id).filter(
+        LinkedAccount.user_id == current_user.id
+    )
+    # served by ix_processing_runs_started_at
+    latest_runs = db.session.query(ProcessingRun.id).order_by(
+        ProcessingRun.started_at.desc()
+    ).limit(limit)
+
+    runs = db.session.query(
+        ProcessingRun.id,
+        ProcessingRun.status,
+        ProcessingRun.started_at,
+        ProcessingRun.finished_at,
+        seconds_between(ProcessingRun.started_at, ProcessingRun.finished_at).label('duration_seconds'),
+        func.count(ProcessingRunAccount.id).label('accounts'),
+        func.count(ProcessingRunAccount.id).filter(
+            ProcessingRunAccount.status.in_(('completed', 'failed'))
+        ).label('accounts_finished'),
+        *[func.sum(getattr(ProcessingRunAccount, counter)).label(counter) for counter in COUNTERS],
+    ).join(
+        ProcessingRunAccount, ProcessingRunAccount.run_id == ProcessingRun.id
+    ).filter(
+        ProcessingRun.id.in_(latest_runs.scalar_subquery()),
+        ProcessingRunAccount.account_id.in_(user_accounts.scalar_subquery())
+    ).group_by(ProcessingRun.id).order_by(ProcessingRun.started_at.desc()).all()
+
+    return jsonify({'processing_runs': [run_progress(run) for run in runs]}), 200
+
+@api_bp.route('/processing_runs/<run_id>', methods=['GET'])
+@login_required
+def get_processing_run(run_id):
+    """A processing run with the progress of each of this user's inboxes in it"""
+
+    try:
+        run_id = UUID(run_id)
+    except ValueError:
+        return custom_error("", 404)
+
+    run = ProcessingRun.query.filter(ProcessingRun.id == run_id).first()
+    if run is None:
+        return custom_error("", 404)
+
+    accounts = db.session.query(
+        ProcessingRunAccount.account_id,
+        LinkedAccount.account_type,
+        ProcessingRunAccount.status,
+        ProcessingRunAccount.error,
+        ProcessingRunAccount.queued_at,
+        ProcessingRunAccount.started_at,
+        ProcessingRunAccount.finished_at,
+        seconds_between(
+            ProcessingRunAccount.started_at, ProcessingRunAccount.finished_at
+        ).label('duration_seconds'),
+        *[getattr(ProcessingRunAccount, counter) for counter in COUNTERS],
+    ).join(
+        LinkedAccount, LinkedAccount.id == ProcessingRunAccount.account_id
+    ).filter(
+        ProcessingRunAccount.run_id == run_id,
+        LinkedAccount.user_id == current_user.id
+    ).order_by(ProcessingRunAccount.queued_at, ProcessingRunAccount.account_id).all()
+
+    if not accounts:
+        return custom_error("", 404)
+
+    return jsonify({
+        'processing_run': run,
+        'accounts': [run_progress(account) for account in accounts]
+    }), 200
+
+def encode_bills_cursor(due_date, bill_id):
+    """Opaque cursor pointing just after the given row"""
+    raw = json.dumps([due_date.isoformat(), str(bill_id)])
+    return base64.urlsafe_b64encode(raw.encode('UTF-8')).decode('ascii')
+
+def decode_bills_cursor(cursor):
+    """Inverse of encode_bills_cursor, raises ValueError on garbage"""
+    try:
+        due_date, bill_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(due_date), UUID(bill_id)
+    except (TypeError, json.JSONDecodeError, UnicodeError, binascii.Error) as e:
+        raise ValueError('Invalid cursor') from e
+
+@api_bp.route('/bills', methods=['GET'])
+@login_required
+def get_bills():
+    """List bills of this user, keyset paginated on (due_date, id)
+
+    Query params: account_id, status, due_from, due_to (ISO dates, inclusive),
+    order (asc/desc), limit and cursor (the next_cursor of the previous page).
+    """
+
+    try:
+        limit = min(int(request.args.get('limit', BILLS_PAGE_SIZE)), BILLS_MAX_PAGE_SIZE)
+        due_from = request.args.get('due_from')
+        due_from = date.fromisoformat(due_from) if due_from else None
+        due_to = request.args.get('due_to')
+        due_to = date.fromisoformat(due_to) if due_to else None
+        cursor = request.args.get('cursor')
+        cursor = decode_bills_cursor(cursor) if cursor else None
+        account_id = request.args.get('account_id')
+        account_id = UUID(account_id) if account_id else None
+    except ValueError as e:
+        return custom_error(str(e), 400)
+
+    descending = request.args.get('order', 'asc') == 'desc'
+    if limit < 1:
+        return custom_error('limit must be positive', 400)
+
+    user_accounts = db.session.query(LinkedAccount.id).filter(
+        LinkedAccount.user_id == current_user.id
+    )
+
+    query = db.session.query(
+        Bill.id,
+        Bill.account_id,
+        Bill.amount,
+        Bill.bill_date,
+        Bill.due_date,
+        Bill.status,
+        Bill.bill_url,
+    ).filter(Bill.account_id.in_(user_accounts.scalar_subquery()))
+
+    if account_id is not None:
+        query = query.filter(Bill.account_id == account_id)
+    if request.args.get('status'):
+        query = query.filter(Bill.status == request.args['status'])
+    if due_from is not None:
+        query = query.filter(Bill.due_date >= due_from)
+    if due_to is not None:
+        query = query.filter(Bill.due_date < due_to + timedelta(days=1))
+
+    # seek past the last row of the previous page instead of OFFSET
+    if cursor is not None:
+        keyset = tuple_(Bill.due_date, Bill.id)
+        query = query.filter(keyset < cursor if descending else keyset > cursor)
+
+    if descending:
+        query = query.order_by(Bill.due_date.desc(), Bill.id.desc())
+    else:
+        query = query.order_by(Bill.due_date.asc(), Bill.id.asc())
+
+    # one extra row tells us whether there is a next page
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_bills_cursor(rows[-1].due_date, rows[-1].id)
+
+    return jsonify({
+        'bills': [row._asdict() for row in rows],
+        'next_cursor': next_cursor
+    }), 200
+
+@api_bp.route('/bills/summary', methods=['GET'])
+@login_required
+def get_bills_summary():
+    """Monthly totals per account and the bills falling due soon
+
+    Query params: months (how far back the totals go) and due_within (days).
+    Totals come from bill_monthly_totals, so the cost does not grow with the
+    number of bills.
+    """
+
+    try:
+        months = int(request.args.get('months', SUMMARY_MONTHS))
+        due_within = int(request.args.get('due_within', SUMMARY_DUE_WITHIN_DAYS))
+    except ValueError as e:
+        return custom_error(str(e), 400)
+
+    today = date.today()
+    first_month = month_of(today)
+    for _ in range(max(months - 1, 0)):
+        first_month = month_of(first_month - timedelta(days=1))
+
+    monthly_totals = BillMonthlyTotal.query.filter(
+        BillMonthlyTotal.user_id == current_user.id,
+        BillMonthlyTotal.month >= first_month
+    ).order_by(BillMonthlyTotal.month.desc(), BillMonthlyTotal.account_id).all()
+
+    user_accounts = db.session.query(LinkedAccount.id).filter(
+        LinkedAccount.user_id == current_user.id
+    )
+
+    # served by ix_bills_account_status_due_date_id, bounded by the window
+    upcoming = db.session.query(
+        Bill.id,
+        Bill.account_id,
+        Bill.amount,
+        Bill.due_date,
+        Bill.bill_url,
+    ).filter(
+        Bill.account_id.in_(user_accounts.scalar_subquery()),
+        Bill.status == 'pending',
+        Bill.due_date >= today,
+        Bill.due_date < today + timedelta(days=due_within + 1)
+    ).order_by(Bill.due_date, Bill.id).all()
+
+    return jsonify({
+        'monthly_totals': monthly_totals,
+        'upcoming': [row._asdict() for row in upcoming]
+    }), 200
+
+@api_bp.route('/bills/export', methods=['GET'])
+@login_required
+def export_bills_of_user():
+    """Stream every bill of this user as CSV or NDJSON, optionally gzipped"""
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return custom_error(f'Unsupported format: {export_format}', 400)
+
+    use_gzip = request.args.get('gzip', 'false').lower() in ('1', 'true')
+
+    file_name = f'bills.{export_format}' + ('.gz' if use_gzip else '')
+    response = current_app.response_class(
+        stream_with_context(export_bills(current_user.id, export_format, gzip=use_gzip)),
+        mimetype='application/gzip' if use_gzip else EXPORT_FORMATS[export_format]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{file_name}"'
+
+    return response
+
 @api_bp.route('/run_task/', methods=['GET'])
 @login_required
 def run_task():
     """Manually trigger task"""
 
-    inbox_tasks.check_inbox.delay()
+    # by name, so the web app does not import the tasks and what they use
+    celery.send_task('bills_collector.tasks.inbox_tasks.check_inbox')
 
     return make_response('Ok', 200)
 
@@ -180,5 +580,7 @@ def check_account_connectivity(account_id):
         goog_client = GoogleClient(token=account.token_json)
     except Exception as e:
         print(e)
+    if goog_client is not None:
+        goog_client.close()
 
     return make_response('Ok', 200)
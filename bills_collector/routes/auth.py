@@ -6,6 +6,7 @@ from flask_login import current_user, login_user, logout_user
 
 from bills_collector.models import User
 from bills_collector.extensions import db, login_manager, bcrypt
+from bills_collector.user_cache import invalidate_user, load_cached_user
 
 # Blueprint Configuration
 auth_bp = Blueprint(
@@ -18,7 +19,7 @@ login_manager.login_view = "auth_bp.login"
 def load_user(user_id):
     """Check if user is logged-in upon page load."""
     if (user_id is not None) and (user_id != 'None'):
-        return User.query.get(user_id)
+        return load_cached_user(user_id)
     return None
 
 @auth_bp.route('/login')
@@ -56,6 +57,7 @@ def login_post():
     if does_pass_match:
         existing_user.last_login = datetime.now(timezone.utc)
         db.session.commit() # Save changes to database
+        invalidate_user(existing_user.id)
 
         login_user(existing_user, remember=remember_session)
 
@@ -107,5 +109,7 @@ def signup_post():
 def logout():
     """Logout the currently logged in user"""
 
+    if current_user.is_authenticated:
+        invalidate_user(current_user.id)
     logout_user()
     return redirect(url_for('auth_bp.login'))
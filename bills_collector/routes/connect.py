@@ -5,7 +5,8 @@ from flask import request, redirect, Blueprint, url_for, session, abort
 from flask_login import current_user, login_required
 
 
-from bills_collector.extensions import db, login_manager, bcrypt
+from bills_collector.caching import invalidate_user_cache
+from bills_collector.extensions import db, login_manager, bcrypt, oauth
 from bills_collector.integrations import GoogleClient
 from bills_collector.models import LinkedAccount
 
@@ -14,7 +15,9 @@ connect_bp = Blueprint(
     'connect_bp', __name__
 )
 
-google_app = GoogleClient().app
+def get_google_app():
+    """The Google OAuth app, registered on first use rather than at import"""
+    return oauth.create_client('google') or GoogleClient().app
 
 def get_google_scope(connect_type):
     default_scope = ['email', 'openid', 'profile']
@@ -43,7 +46,7 @@ def connect_google():
     session['google_connect_type'] = connect_type
     session['google_connect_scope'] = connect_scope
 
-    return google_app.authorize_redirect(
+    return get_google_app().authorize_redirect(
         redirect_uri,
         scope=connect_scope,
         access_type='offline'
@@ -56,7 +59,7 @@ def callback_google():
 
     connect_type = session['google_connect_type']
     session_scope = session['google_connect_scope']
-    token = google_app.authorize_access_token(scope=session_scope)
+    token = get_google_app().authorize_access_token(scope=session_scope)
 
     user_profile = {
         'name': token['userinfo']['name'],
@@ -92,6 +95,7 @@ def callback_google():
         existing_account.last_update_at = datetime.now(timezone.utc)
 
     db.session.commit()
+    invalidate_user_cache(current_user.id)
 
     return redirect(url_for('main_bp.home'))
 
@@ -0,0 +1,27 @@
+"""Prometheus scrape endpoint."""
+import hmac
+
+from flask import Blueprint, Response, abort, current_app, request
+
+from bills_collector.metrics import render_metrics
+
+# Blueprint Configuration
+metrics_bp = Blueprint(
+    'metrics_bp', __name__
+)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Pipeline and process metrics in the Prometheus text format
+
+    Scrapers authenticate with ``Authorization: Bearer $METRICS_TOKEN``;
+    without a token configured the endpoint does not exist.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+
+    body, content_type = render_metrics()
+    return Response(body, mimetype=content_type)
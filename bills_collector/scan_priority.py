@@ -0,0 +1,122 @@
+"""Priority of an inbox's scan, from when its bills arrive and fall due.
+
+``check_inbox`` queues every inbox at once. When the workers fall behind,
+the inboxes with a bill about to arrive or fall due should not wait behind
+the others, so each scan is sent with a Celery priority:
+
+- a bill is expected one interval after the latest, the interval being the
+  average gap between the inbox's bills over ``SCAN_PRIORITY_LOOKBACK_DAYS``,
+  and is looked for from ``SCAN_PRIORITY_ARRIVAL_WINDOW_DAYS`` before then;
+- the earlier of that and the next pending due date sets the priority, from
+  ``HIGHEST_PRIORITY`` when it is today down to ``LOWEST_PRIORITY`` when it
+  is ``SCAN_PRIORITY_HORIZON_DAYS`` or more away;
+- inboxes without bills to go by get ``CELERY_TASK_DEFAULT_PRIORITY``.
+
+On the valkey broker 0 is served first, see ``CELERY_BROKER_TRANSPORT_OPTIONS``.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+import math
+
+from sqlalchemy import func
+
+from bills_collector.extensions import db
+from bills_collector.models import Bill
+
+HIGHEST_PRIORITY = 0
+LOWEST_PRIORITY = 9
+
+# Gap assumed between the bills of an inbox with a single one
+DEFAULT_BILL_INTERVAL = timedelta(days=30)
+
+
+def as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+@dataclass(frozen=True)
+class BillHistory:
+    """An inbox's recent bills, summed up"""
+
+    bills: int
+    first_bill_date: date
+    last_bill_date: date
+    next_due_date: date = None
+
+    @property
+    def interval(self) -> timedelta:
+        """Average gap between bills"""
+        if self.bills < 2:
+            return DEFAULT_BILL_INTERVAL
+        return max((self.last_bill_date - self.first_bill_date) / (self.bills - 1), timedelta(days=1))
+
+    def expected_arrival(self, today):
+        """When the next bill should arrive, None when it is a whole interval late"""
+        arrival = self.last_bill_date + self.interval
+        # bills stopped coming, an old guess would keep the inbox on top forever
+        if arrival + self.interval < today:
+            return None
+        return arrival
+
+
+def bill_histories(account_ids, today, lookback_days) -> dict:
+    """``BillHistory`` of each of ``account_ids`` with bills, in one query"""
+    if not account_ids:
+        return {}
+
+    rows = db.session.query(
+        Bill.account_id,
+        func.count(Bill.id),
+        func.min(Bill.bill_date),
+        func.max(Bill.bill_date),
+        func.min(Bill.due_date).filter(Bill.status == "pending", Bill.due_date >= today),
+    ).filter(
+        Bill.account_id.in_(account_ids),
+        Bill.bill_date >= today - timedelta(days=lookback_days),
+    ).group_by(Bill.account_id).all()
+
+    return {
+        account_id: BillHistory(bills, as_date(first), as_date(last), as_date(next_due))
+        for account_id, bills, first, last, next_due in rows
+    }
+
+
+@dataclass(frozen=True)
+class PriorityPolicy:
+    """How near a bill must be for its inbox to be scanned first"""
+
+    horizon_days: int
+    arrival_window_days: int
+    lookback_days: int
+    default_priority: int
+
+    @classmethod
+    def of(cls, config):
+        return cls(
+            horizon_days=config["SCAN_PRIORITY_HORIZON_DAYS"],
+            arrival_window_days=config["SCAN_PRIORITY_ARRIVAL_WINDOW_DAYS"],
+            lookback_days=config["SCAN_PRIORITY_LOOKBACK_DAYS"],
+            default_priority=config["CELERY_TASK_DEFAULT_PRIORITY"],
+        )
+
+    def days_until_needed(self, history, today):
+        """Days until a bill is due or its arrival window opens, None without either"""
+        days = []
+        if history.next_due_date is not None:
+            days.append((history.next_due_date - today).days)
+        arrival = history.expected_arrival(today)
+        if arrival is not None:
+            days.append((arrival - today).days - self.arrival_window_days)
+        return max(min(days), 0) if days else None
+
+    def priority(self, history, today) -> int:
+        """Celery priority of a scan of the inbox ``history`` is of"""
+        days = self.days_until_needed(history, today) if history is not None else None
+        if days is None:
+            return self.default_priority
+        return min(math.ceil(days * LOWEST_PRIORITY / self.horizon_days), LOWEST_PRIORITY)
+
+    def priorities(self, account_ids, today) -> dict:
+        """Priority of each of ``account_ids``"""
+        histories = bill_histories(account_ids, today, self.lookback_days)
+        return {account_id: self.priority(histories.get(account_id), today) for account_id in account_ids}
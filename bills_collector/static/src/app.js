@@ -111,6 +111,24 @@ function App() {
         }
     };
 
+    var objLastRun = {
+        run: {}
+    };
+
+    const fnLoadLastRun = async () => {
+        const response = await fetch('/api/processing_runs?limit=1');
+        if (!response.ok) {
+            return;
+        }
+        const data = await response.json();
+        objLastRun.run = data.processing_runs[0] || {};
+
+        // the counters are written every few seconds while the scan runs
+        if (objLastRun.run.status === 'running') {
+            setTimeout(fnLoadLastRun, 15000);
+        }
+    };
+
     const fnLoadInboxRules = async (accountId) => {
         const response = await fetch('/api/linked_accounts/' + accountId + '/inbox_rules');
         const data = await response.json();
@@ -264,6 +282,9 @@ function App() {
 
             // Load inbox rules for the account
             fnLoadInboxRules(accountId);
+        } else if (pageName === 'home') {
+            tinybind.bind(document.getElementById('divLastRun'), objLastRun);
+            fnLoadLastRun();
         }
     }
 }
@@ -0,0 +1,163 @@
+"""Backfill of a rule's older emails over a date range.
+
+The regular scan only looks at the last 40 days. A backfill walks a rule's
+listing over any date range through the same pipeline, a few pages per run:
+
+- after every page its emails are finished and the page cursor and counters
+  are committed, so a crashed run resumes after the last finished page;
+- a run lists ``BACKFILL_PAGES_PER_RUN`` pages of ``BACKFILL_PAGE_SIZE``
+  messages with at most ``BACKFILL_MAX_CONCURRENCY`` downloads, then queues
+  the next run ``BACKFILL_PAUSE_SECONDS`` later, leaving the account's quota
+  and the worker to the regular scans in between;
+- backfills whose worker died are picked up again by ``resume_backfills``.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from celery.signals import worker_ready
+from celery.utils.log import get_task_logger
+from sqlalchemy.orm import joinedload
+
+from bills_collector.extensions import celery, db
+from bills_collector.mail_providers import get_provider
+from bills_collector.metrics import track_stage
+from bills_collector.models import InboxBackfill, InboxRule
+from bills_collector.query_planner import RuleFilter
+from bills_collector.tasks.inbox_tasks import InboxPipeline, report_bytes_received
+from bills_collector.tracing import account_run
+
+logger = get_task_logger(__name__)
+
+# Backfills still to be run to the end
+ACTIVE_STATUSES = ("pending", "running")
+
+
+@celery.on_after_configure.connect
+def setup_periodic_tasks(sender, **kwargs):
+    """
+    Schedule periodic tasks
+    """
+    sender.add_periodic_task(
+        timedelta(hours=1),
+        resume_backfills.s(),
+        name="Resume backfills whose worker stopped every hour",
+    )
+
+
+@worker_ready.connect
+def at_start(sender, **k):
+    resume_backfills.delay()
+
+
+@celery.task()
+def resume_backfills():
+    """Queue again the active backfills nothing has worked on for a while"""
+    stale_after = timedelta(seconds=celery.app.config["BACKFILL_STALE_AFTER_SECONDS"])
+    stale = db.session.query(InboxBackfill.id).filter(
+        InboxBackfill.status.in_(ACTIVE_STATUSES),
+        InboxBackfill.last_update_at < datetime.now(timezone.utc) - stale_after,
+    ).all()
+
+    for backfill in stale:
+        logger.info(f"Resuming backfill {backfill.id}")
+        backfill_rule.delay(backfill.id)
+
+
+@celery.task()
+def backfill_rule(backfill_id):
+    """Process the next pages of a backfill, then queue the run after"""
+    config = celery.app.config
+
+    backfill = InboxBackfill.query.filter(InboxBackfill.id == backfill_id).first()
+    if backfill is None or backfill.status not in ACTIVE_STATUSES:
+        return
+
+    rule = (
+        InboxRule.query
+        .options(joinedload(InboxRule.account), joinedload(InboxRule.destination_account))
+        .filter(InboxRule.id == backfill.rule_id)
+        .first()
+    )
+    if rule is None or rule.account is None:
+        # nothing left to list, resuming it would fail the same way every hour
+        logger.warning(f"Backfill {backfill.id} lost its rule or inbox, marking it failed")
+        backfill.status = "failed"
+        backfill.error = "The rule or its inbox was deleted"
+        touch(backfill)
+        return
+
+    backfill.status = "running"
+    backfill.error = None
+    touch(backfill)
+
+    provider = get_provider(rule.account)
+    account_type = provider.account_type
+    max_concurrency = min(config["BACKFILL_MAX_CONCURRENCY"], provider.capabilities.max_concurrency)
+    filters = [RuleFilter.of(rule)]
+    pages = provider.stream_pages(
+        rule,
+        since=backfill.start_date,
+        until=backfill.end_date,
+        cursor=backfill.page_cursor,
+        page_size=config["BACKFILL_PAGE_SIZE"],
+    )
+
+    try:
+        with account_run(rule.account_id, account_type) as run, \
+                ThreadPoolExecutor(max_concurrency, thread_name_prefix=f"{account_type}-backfill") as downloads:
+            pipeline = InboxPipeline(rule.account_id, provider, downloads, max_concurrency)
+
+            for _ in range(config["BACKFILL_PAGES_PER_RUN"]):
+                with track_stage("list", account_type):
+                    page = next(pages, None)
+                if page is None:
+                    # resumed after the last page, before it was recorded as completed
+                    complete(backfill)
+                    break
+
+                finished_before = pipeline.finished
+                pipeline.submit_page(filters, page.messages)
+                pipeline.drain()
+                checkpoint(backfill, page, pipeline.finished - finished_before)
+
+                if page.next_cursor is None:
+                    break
+
+            report_bytes_received(provider, account_type, run)
+    except Exception as e:
+        db.session.rollback()
+        backfill.status = "failed"
+        backfill.error = str(e)
+        touch(backfill)
+        raise
+    finally:
+        provider.close()
+
+    if backfill.status == "completed":
+        logger.info(f"Backfill {backfill.id} completed: {backfill.emails_processed} emails")
+        return
+
+    backfill_rule.apply_async((backfill_id,), countdown=config["BACKFILL_PAUSE_SECONDS"])
+
+
+def checkpoint(backfill, page, emails_processed):
+    """Record a finished page, the listing resumes after it"""
+    backfill.page_cursor = page.next_cursor
+    backfill.pages_done += 1
+    backfill.messages_listed += len(page.messages)
+    backfill.emails_processed += emails_processed
+    if page.next_cursor is None:
+        complete(backfill)
+    else:
+        touch(backfill)
+
+
+def complete(backfill):
+    backfill.status = "completed"
+    backfill.finished_at = datetime.now(timezone.utc)
+    touch(backfill)
+
+
+def touch(backfill):
+    backfill.last_update_at = datetime.now(timezone.utc)
+    db.session.commit()
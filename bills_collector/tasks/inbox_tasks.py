@@ -1,45 +1,163 @@
 """Email Inbox related tasks"""
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import date, timedelta
-import base64
+from functools import lru_cache
 from os import environ
 
 from celery.signals import worker_ready
 from celery.utils.log import get_task_logger
-import pikepdf
 import requests
 from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload
 import sentry_sdk
-from sentry_sdk.integrations.celery import CeleryIntegration
-from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
 
+from bills_collector.aggregates import move_bill, record_bill
+from bills_collector.client_pool import drive_clients
+from bills_collector.drive_index import DriveFolderIndex, upload_to_folder
 from bills_collector.extensions import celery, db
 from bills_collector.integrations import GoogleClient, LLMClient
-from bills_collector.models import LinkedAccount, InboxRule, ProcessedEmail, Bill
-
-sentry_sdk.init(
-    dsn=environ.get("SENTRY_DSN"),
-    integrations=[CeleryIntegration(), SqlalchemyIntegration()],
+from bills_collector.integrations.mime_parts import PartKind
+from bills_collector.mail_providers import PROVIDERS, get_provider
+from bills_collector.metrics import (
+    API_BYTES_RECEIVED,
+    BILLS_EXTRACTED,
+    DRIVE_UPLOADS,
+    EMAILS_PROCESSED,
+    record_pdf_size,
+    record_stage,
+    record_stage_error,
+    track_stage,
 )
+from bills_collector.models import LinkedAccount, InboxRule, ProcessedEmail, Bill
+from bills_collector.pdf_processing import order_passwords, pdf_processor, remember_password
+from bills_collector.processing_runs import RunProgress, finish_account, start_account, start_run
+from bills_collector.query_planner import route
+from bills_collector.scan_priority import PriorityPolicy
+from bills_collector.tracing import account_run, active_span, email_span
+from bills_collector.transport import transport
 
 logger = get_task_logger(__name__)
 
-dict_drive_apps = {}
 
+def get_drive_app(account: LinkedAccount) -> GoogleClient:
+    """Pooled Drive client of the destination account"""
+    return drive_clients.get(account.id, account.token_json)
+
+
+@lru_cache(maxsize=4)
+def _llm_client(api_key, base_url, http2):
+    return LLMClient(api_key, base_url=base_url, client_args={'http2': True} if http2 else None)
+
+
+def get_llm_client() -> LLMClient:
+    """LLM client of this process, kept so its connections are reused"""
+    return _llm_client(
+        celery.app.config['GEMINI_API_KEY'],
+        celery.app.config.get('GEMINI_BASE_URL') or None,
+        bool(transport.httpx_client_args().get('http2')),
+    )
+
+
+@dataclass
+class PendingPdf:
+    """A downloaded attachment being decrypted in the PDF pool"""
+
+    part: object
+    file_path: str
+    decrypted: Future
+
+
+@dataclass
+class PendingEmail:
+    """An email on its way through the pipeline, from download to upload.
+
+    An email listed by a search for several rules has no ``rule`` until its
+    headers are fetched and matched against ``routes``.
+    """
+
+    rule: InboxRule
+    email_id: str
+    span: object
+    passwords: list
+    routes: tuple = ()
+    email_date: date = None
+    pdfs: list = field(default_factory=list)
+
+
+def get_folder_index(folder_indexes, rule) -> DriveFolderIndex:
+    """Index of the rule's destination folder, loaded once per run"""
+    key = (rule.destination_account_id, rule.destination_folder_id)
+    if key not in folder_indexes:
+        folder_indexes[key] = DriveFolderIndex.load(
+            get_drive_app(rule.destination_account), *key
+        )
+    return folder_indexes[key]
+
+
+def fetch_processed_ids(inbox_id, email_ids) -> set:
+    """Return the subset of ``email_ids`` already processed for this inbox"""
+    if not email_ids:
+        return set()
+
+    return {
+        row.email_id
+        for row in db.session.query(ProcessedEmail.email_id).filter(
+            ProcessedEmail.account_id == inbox_id,
+            ProcessedEmail.email_id.in_(email_ids)
+        )
+    }
+
+
+def mark_processed(inbox_id, email_id) -> bool:
+    """Mark the email processed, False when another run, e.g. a backfill over the same dates, did first"""
+    return db.session.execute(
+        insert(ProcessedEmail)
+        .values(email_id=email_id, account_id=inbox_id)
+        .on_conflict_do_nothing(index_elements=["account_id", "email_id"])
+        .returning(ProcessedEmail.id)
+    ).scalar() is not None
+
+
+def save_processed_email(inbox_id, email_id, bill_date, bill_url) -> Bill:
+    """Store a placeholder bill and mark the email processed, in one commit.
+
+    Returns None, storing nothing, when another run marked the email processed first.
+    """
+    if not mark_processed(inbox_id, email_id):
+        db.session.commit()
+        return None
+
+    new_bill = Bill(
+        account_id=inbox_id,
+        email_id=email_id,
+        bill_date=bill_date,
+        amount=0,  # Default amount, will be updated after extraction
+        due_date=date.today() + timedelta(days=30),  # Default due date, will be updated after extraction
+        status='pending',
+        bill_url=bill_url,
+    )
 
-def get_drive_app(account_id) -> GoogleClient:
-    if account_id not in dict_drive_apps:
-        the_app = GoogleClient(account_id=account_id)
+    db.session.add(new_bill)
+    record_bill(inbox_id, new_bill.bill_date, new_bill.amount)
+    db.session.commit()
 
-        dict_drive_apps[account_id] = the_app
+    return new_bill
 
-    return dict_drive_apps[account_id]
 
+def report_bytes_received(provider, account_type, span):
+    """Record how much a run downloaded from the mail provider, per API call"""
+    for call, received in provider.bytes_received.items():
+        API_BYTES_RECEIVED.labels(account_type, call).inc(received)
+        span.set_data(f"mail.bytes_received.{call}", received)
 
-def close_drive_apps():
-    for key in dict_drive_apps:
-        this_app = dict_drive_apps[key]
-        this_app.close()
+    logger.info(
+        f"Received {sum(provider.bytes_received.values())} bytes from {account_type}: "
+        f"{provider.bytes_received}"
+    )
 
 
 def ping_healthchecks(is_start):
@@ -47,7 +165,7 @@ def ping_healthchecks(is_start):
 
     try:
         ping_url = environ.get("HEALTH_CHECKS_IO_URL")
-        requests.get(ping_url, timeout=10)
+        transport.session().get(ping_url, timeout=10)
     except requests.RequestException as e:
         # Log ping failure here...
         print("Ping failed: %s" % e)
@@ -86,178 +204,337 @@ def check_inbox():
             func.count(InboxRule.id).label("Rule_Count"),
         )
         .join(InboxRule, InboxRule.account_id == LinkedAccount.id)
-        .filter(LinkedAccount.account_type.in_(["gmail", "zoho"]))
+        .filter(LinkedAccount.account_type.in_(list(PROVIDERS)))
         .group_by(LinkedAccount.id)
         .having(func.count(InboxRule.id) > 0)
         .all()
     )
 
-    # 2. For each Inbox, get all rules
-    for account in inbox_accounts:
-        logger.info(f"Account: {account.id}, {account.Rule_Count}")
+    # the ledger row of every inbox exists before any of them starts
+    run_id = start_run([account.id for account in inbox_accounts])
+
+    # inboxes with a bill about to arrive or fall due overtake the rest in the queue
+    priorities = PriorityPolicy.of(celery.app.config).priorities(
+        [account.id for account in inbox_accounts], date.today()
+    )
+
+    # 2. For each Inbox, get all rules, most urgent first
+    for account in sorted(inbox_accounts, key=lambda account: priorities[account.id]):
+        logger.info(f"Account: {account.id}, {account.Rule_Count}, priority {priorities[account.id]}")
 
-        process_gmail_inbox.delay(account.id)
+        process_inbox.apply_async((account.id, run_id), priority=priorities[account.id])
         # 3. For each rule, check for any new emails in last 24hr
 
         # 4. For every email, check if it has already been processed
         # 4.1. If not, download and save attachment to destination
 
-    # TODO: close all drive apps after all tasks are done
-    # close_drive_apps()
-
     # TODO: clean up tmp folder after processing
 
 
 @celery.task()
-def process_gmail_inbox(inbox_id):
-    """Fetch emails as per the rules for this inbox"""
-
-    inbox_account = LinkedAccount.query.filter(LinkedAccount.id == inbox_id).first()
+def process_inbox(inbox_id, run_id=None):
+    """Fetch emails as per the rules for this inbox, from the provider hosting it.
 
-    inbox_rules = InboxRule.query.filter(InboxRule.account_id == inbox_id).all()
+    Progress is counted on the inbox's row of the ``run_id`` processing run,
+    or of a run of its own when queued without one.
+    """
 
-    google_app = GoogleClient(token=inbox_account.token_json)
+    progress = start_account(run_id, inbox_id, celery.app.config["PROCESSING_RUN_FLUSH_SECONDS"])
+    provider = None
 
-    for rule in inbox_rules:
-        emails = google_app.fetch_inbox_emails(
-            from_address=rule.email_from, subject_text=rule.email_subject
+    try:
+        inbox_account = LinkedAccount.query.filter(LinkedAccount.id == inbox_id).first()
+
+        # destination accounts are needed for every upload, load them with the rules
+        inbox_rules = (
+            InboxRule.query
+            .options(joinedload(InboxRule.destination_account))
+            .filter(InboxRule.account_id == inbox_id)
+            .all()
         )
-        if "messages" in emails:
-            for email in emails["messages"]:
-                email_id = email["id"]
-
-                processed_email = ProcessedEmail.query.filter(
-                    ProcessedEmail.email_id == email_id, ProcessedEmail.account_id == inbox_id
-                ).first()
-
-                if processed_email is not None:
-                    continue
-
-                email_msg = google_app.fetch_one_email(email_id)
-
-                email_date = email_msg["internalDate"] #epoch time in ms
-
-                email_body = ""
-                pdf_file_path = ""
-                pdf_drive_url = ""
-
-                payload = email_msg["payload"]
-                payload_parts = payload.get("parts", [])
-                for part in payload_parts:
-                    payload_mime = part["mimeType"]
-                    logger.info(f"Payload Mime: {payload_mime}")
-
-                    # Get the pdf attachment if it exists
-                    if (
-                        payload_mime == "application/octet-stream"
-                        or payload_mime == "application/pdf"
-                    ):
-                        file_name = part["filename"]
-                        attachment_id = part["body"]["attachmentId"]
-                        logger.info(f"Attachment: {attachment_id}, {file_name}")
-                        if file_name.lower().endswith(".pdf"):
-                            attachment = google_app.get_email_attachment(
-                                message_id=email["id"], attachment_id=attachment_id
-                            )
-                            file_data = base64.urlsafe_b64decode(
-                                attachment["data"].encode("UTF-8")
-                            )
-                            file_path = f"tmp/{file_name}"
-                            with open(file_path, "wb") as f:
-                                f.write(file_data)
-
-                            pdf = pikepdf.open(
-                                file_path, password=rule.attachment_password
-                            )
-
-                            # Save the PDF to a file with the email recieve date as the name
-                            email_date = date.fromtimestamp(
-                                int(email_date) / 1000  # Convert ms to seconds
-                            )
-                            file_name = f"{email_date.strftime('%Y-%m')}.pdf"
-                            pdf_file_path = f"tmp/{file_name}"
-                            pdf.save(pdf_file_path)
-
-                            # upload file to the destination
-                            drive_app = get_drive_app(rule.destination_account_id)
-                            drive_folder_id = rule.destination_folder_id
-
-                            uploaded_file = drive_app.upload_file_to_drive(
-                                file_mime_type=payload_mime,
-                                file_path=pdf_file_path,
-                                file_name=file_name,
-                                drive_folder_id=drive_folder_id,
-                            )
-
-                            if "error" in uploaded_file:
-                                logger.error(
-                                    f"Error uploading file: {uploaded_file['error']}"
-                                )
-                                continue
-
-                            pdf_drive_url = uploaded_file.get("webViewLink", "")
-                            
-                    # Get the email body text
-                    elif payload_mime == "text/plain":
-                        email_body = part.get("body", {}).get("data", "")
-                        if email_body:
-                            email_body = base64.urlsafe_b64decode(
-                                email_body.encode("UTF-8")
-                            ).decode("UTF-8")
-                            
-
-                # Create new bill entry
-                new_bill = Bill(
-                    account_id=inbox_id,
+
+        provider = get_provider(inbox_account)
+        account_type = provider.account_type
+        max_concurrency = provider.capabilities.max_concurrency
+
+        with account_run(inbox_id, account_type) as run, \
+                ThreadPoolExecutor(max_concurrency, thread_name_prefix=f"{account_type}-download") as downloads:
+            pipeline = InboxPipeline(inbox_id, provider, downloads, max_concurrency, progress)
+
+            # as few searches as the rules fit in, not one per rule
+            pages = provider.stream_inbox(inbox_rules)
+            while True:
+                with track_stage("list", account_type):
+                    page = next(pages, None)
+                if page is None:
+                    break
+                pipeline.submit_page(*page)
+
+            pipeline.drain()
+            report_bytes_received(provider, account_type, run)
+    except Exception as e:
+        db.session.rollback()
+        finish_account(progress, error=str(e))
+        raise
+    finally:
+        if provider is not None:
+            provider.close()
+
+    finish_account(progress)
+
+
+class InboxPipeline:
+    """Emails of one inbox on their way from download to upload.
+
+    Downloads run on ``downloads``; the task's thread finishes emails oldest
+    first, keeping up to ``max_concurrency`` downloads plus what the PDF pool
+    can decrypt meanwhile in flight. Emails are counted on ``progress``.
+    """
+
+    def __init__(self, inbox_id, provider, downloads, max_concurrency, progress=None):
+        self.inbox_id = inbox_id
+        self.provider = provider
+        self.account_type = provider.account_type
+        self.downloads = downloads
+        self.max_pending = max_concurrency + pdf_processor.max_in_flight
+        # (email id, download) of the emails being downloaded or decrypted, oldest first
+        self.pending = deque()
+        self.started_ids = set()
+        self.folder_indexes = {}
+        # emails finished, so saved as bills
+        self.finished = 0
+        self.progress = progress or RunProgress()
+
+    def submit_page(self, filters, messages):
+        """Start every message of a listed page not processed yet.
+
+        ``filters`` are the ``RuleFilter``s of the rules the page was listed
+        for, a message is routed to one of them once downloading.
+        """
+        # one dedupe query per page instead of one per listed email
+        with track_stage("dedupe", self.account_type):
+            processed_ids = fetch_processed_ids(
+                self.inbox_id, [message.message_id for message in messages]
+            )
+
+        self.progress.add("listed", len(messages))
+        for message in messages:
+            email_id = message.message_id
+
+            if email_id in processed_ids or email_id in self.started_ids:
+                self.progress.add("duplicates")
+                continue
+            self.started_ids.add(email_id)
+
+            if len(filters) == 1:
+                rule = filters[0]
+                email = PendingEmail(
+                    rule=rule.rule,
                     email_id=email_id,
-                    bill_date=email_date,
-                    amount=0,  # Default amount, will be updated after extraction
-                    due_date=date.today() + timedelta(days=30),  # Default due date, will be updated after extraction
-                    status='pending',
-                    bill_url=pdf_drive_url,
+                    span=email_span(email_id, rule.email_from),
+                    passwords=order_passwords(rule.rule_id, rule.email_from, rule.passwords),
+                )
+            else:
+                email = PendingEmail(
+                    rule=None, email_id=email_id, span=email_span(email_id, None), passwords=[],
+                    routes=tuple(filters),
                 )
+            self.pending.append((
+                email_id,
+                self.downloads.submit(start_email, self.provider, message, email, self.account_type),
+            ))
+
+            # keep downloading while the pool decrypts, up to what both can take
+            while len(self.pending) >= self.max_pending:
+                self.finish_next()
+
+    def finish_next(self):
+        """Wait for the oldest email's download and finish it"""
+        email_id, download = self.pending.popleft()
+        email = download.result()
+        if email is None:
+            # unrouted or without attachments, it would be downloaded again every scan
+            mark_processed(self.inbox_id, email_id)
+            db.session.commit()
+            self.progress.add("skipped")
+        else:
+            self.progress.add("fetched")
+            finish_email(self.inbox_id, email, self.account_type, self.folder_indexes, self.progress)
+            self.finished += 1
+        self.progress.flush_if_due()
 
-                # Mark email as processed
-                processed_email = ProcessedEmail(
-                            email_id=email_id, account_id=inbox_id
-                        )
+    def drain(self):
+        """Finish every email started so far"""
+        while self.pending:
+            self.finish_next()
 
-                db.session.add(processed_email)
-                db.session.add(new_bill)
-                db.session.commit()
 
-                # Extract bill information using LLM
-                extract_bill_info(new_bill.id, pdf_file_path)
+@celery.task()
+def process_gmail_inbox(inbox_id):
+    """Former name of ``process_inbox``, for runs queued before it was renamed"""
+    process_inbox(inbox_id)
+
+
+def start_email(provider, message, email, account_type):
+    """Download an email's PDFs and queue them for decryption, on a download thread.
+
+    Returns ``email``, filled in for ``finish_email``, or None when the email
+    cannot hold a bill. The database session belongs to the task's thread, so
+    only the plain fields of ``email`` are read here.
+    """
+    with celery.app.app_context(), active_span(email.span, finish=False) as span:
+        if email.rule is None:
+            with track_stage("metadata", account_type):
+                message = provider.fetch_headers(message)
+            rule = route(email.routes, message.sender, message.subject)
+            if rule is None:
+                logger.warning(f"Skipping email {email.email_id} matching none of its search's rules")
+                span.finish()
+                return None
+            email.rule = rule.rule
+            email.passwords = order_passwords(rule.rule_id, rule.email_from, rule.passwords)
+            span.set_data("email.sender", rule.email_from)
+
+        if provider.capabilities.metadata_first_pass:
+            with track_stage("metadata", account_type):
+                worth_fetching = provider.is_worth_fetching(message)
+            if not worth_fetching:
+                logger.info(f"Skipping email {email.email_id} without attachments")
+                span.finish()
+                return None
+
+        with track_stage("fetch", account_type):
+            message = provider.fetch_parts(message)
+        email.email_date = message.received_on
+
+        for part in message.parts:
+            logger.info(f"Payload Mime: {part.mime_type}")
+
+            # Get the pdf attachment if it exists
+            if part.kind == PartKind.PDF:
+                logger.info(f"Attachment: {part.attachment_id or 'inline'}, {part.filename}")
+                # several emails are in flight at once, so every file gets a path of its own
+                file_path = f"tmp/{email.email_id}-{part.filename}"
+                with track_stage("attachment", account_type):
+                    with open(file_path, "wb") as f:
+                        provider.fetch_attachment(message, part, f)
+
+                pdf_file_path = f"tmp/{email.email_id}-{part.part_id or 0}-decrypted.pdf"
+                email.pdfs.append(PendingPdf(
+                    part=part,
+                    file_path=pdf_file_path,
+                    decrypted=pdf_processor.submit_decrypt(file_path, pdf_file_path, email.passwords),
+                ))
+
+    return email
+
+
+def finish_email(inbox_id, pending, account_type, folder_indexes, progress):
+    """Upload an email's decrypted PDFs, save its bill and extract the details"""
+    rule = pending.rule
+    pdf_file_path = ""
+    pdf_drive_url = ""
+    upload_failed = False
+
+    with active_span(pending.span):
+        for pdf in pending.pdfs:
+            try:
+                result = pdf.decrypted.result()
+            except Exception:
+                record_stage_error("decrypt", account_type)
+                raise
+            record_stage("decrypt", account_type, result.started_at, result.opened_at)
+            record_stage("optimise", account_type, result.opened_at, result.finished_at)
+            record_pdf_size(account_type, result.bytes_in, result.bytes_out)
+            pending.span.set_data("pdf.bytes_saved", result.bytes_saved)
+            logger.info(
+                f"Optimised {pdf.file_path}: {result.bytes_in} -> {result.bytes_out} bytes"
+            )
+            remember_password(
+                rule.id, rule.email_from, rule.candidate_passwords, pending.passwords[result.password_index]
+            )
+            pdf_file_path = pdf.file_path
+
+            # upload file to the destination, named after the email recieve date,
+            # unless the folder already has it
+            with track_stage("upload", account_type):
+                uploaded = upload_to_folder(
+                    get_folder_index(folder_indexes, rule),
+                    file_mime_type=pdf.part.mime_type,
+                    file_path=pdf.file_path,
+                    file_name=f"{pending.email_date.strftime('%Y-%m')}.pdf",
+                    email_id=pending.email_id,
+                    part_id=pdf.part.part_id,
+                )
+            DRIVE_UPLOADS.labels(account_type, uploaded.action).inc()
+            uploaded_file = uploaded.file
+
+            if "error" in uploaded_file:
+                upload_failed = True
+                record_stage_error("upload", account_type)
+                logger.error(f"Error uploading file: {uploaded_file['error']}")
+                continue
+
+            progress.add("uploaded")
+            pdf_drive_url = uploaded_file.get("webViewLink", "")
+
+        # Create new bill entry and mark the email processed
+        with track_stage("db_write", account_type):
+            new_bill = save_processed_email(
+                inbox_id, pending.email_id, bill_date=pending.email_date, bill_url=pdf_drive_url
+            )
+        if new_bill is None:
+            # already counted as fetched, the other run extracts it
+            logger.info(f"Email {pending.email_id} was processed by another run meanwhile")
+            return
+        EMAILS_PROCESSED.labels(account_type).inc()
+
+        # Extract bill information using LLM
+        extracted = extract_bill_info(new_bill.id, pdf_file_path, account_type=account_type)
+        # one outcome per email, however many of its PDFs failed
+        progress.add("extracted" if extracted and not upload_failed else "failed")
 
-    # Close the Google client app
-    google_app.close()
 
 @celery.task()
-def extract_bill_info(bill_id, pdf_file_path: str) -> dict:
+def extract_bill_info(bill_id, pdf_file_path: str, account_type: str = "unknown") -> dict:
     """
     Extract bill information from email body or PDF file.
     
     Args:
         email_body (str): The body of the email containing bill information.
         pdf_path (str): The path to the PDF file containing bill details.
+        account_type (str): Type of the inbox the bill came from, for metrics.
         
     Returns:
-        dict: A dictionary containing extracted bill information.
+        dict: A dictionary containing extracted bill information, None when
+        no bill was updated.
     """
 
-    llm_client = LLMClient(celery.app.config['GEMINI_API_KEY'])
+    llm_client = get_llm_client()
 
-    extracted_info = llm_client.extract_bill_info(pdf_file_path)
+    with track_stage("llm", account_type):
+        extracted_info = llm_client.extract_bill_info(pdf_file_path)
 
     # If the extraction is successful, update the Bill model
     if extracted_info:
         bill = Bill.query.filter(Bill.id == bill_id).first()
         if bill:
-            bill.amount = extracted_info.get("total_due_amount", 0.0)
-            bill.due_date = extracted_info.get("due_date", date.today() + timedelta(days=30))
-            bill.bill_date = extracted_info.get("invoice_date", date.today())
-            db.session.commit()
+            with track_stage("db_write", account_type):
+                old_bill_date, old_amount = bill.bill_date, bill.amount
+
+                bill.amount = extracted_info.get("total_due_amount", 0.0)
+                bill.due_date = extracted_info.get("due_date", date.today() + timedelta(days=30))
+                bill.bill_date = extracted_info.get("invoice_date", date.today())
+
+                # reload so the dates come back as datetimes, not the LLM's strings
+                db.session.flush()
+                db.session.refresh(bill)
+                move_bill(bill.account_id, old_bill_date, old_amount, bill.bill_date, bill.amount)
+
+                db.session.commit()
+            BILLS_EXTRACTED.labels(account_type).inc()
             logger.info(f"Bill {bill_id} updated with extracted info: {extracted_info}")
+            return extracted_info
         else:
             logger.warning(f"Bill with ID {bill_id} not found.")
     else:
@@ -0,0 +1,121 @@
+"""Sentry error reporting and performance tracing.
+
+Every account run of the inbox pipeline is a transaction. Each email is a
+child span, and so is every stage of it (see ``metrics.track_stage``). The
+Celery integration carries the trace headers through ``.delay()``, so tasks
+dispatched from a traced task join the same trace.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import sentry_sdk
+
+# Span op of each pipeline stage, so external calls group together in Sentry
+STAGE_OPS = {
+    'list': 'http.client',
+    'dedupe': 'db.query',
+    'metadata': 'http.client',
+    'fetch': 'http.client',
+    'attachment': 'http.client',
+    'decrypt': 'file.process',
+    'optimise': 'file.process',
+    'upload': 'http.client',
+    'db_write': 'db.query',
+    'llm': 'ai.run',
+}
+
+
+def init_sentry(app):
+    """Configure the Sentry SDK from the app config.
+
+    Without a DSN nothing is sent, so no integration is set up either: the
+    SDK would otherwise import every library it can instrument.
+    """
+    if not app.config['SENTRY_DSN']:
+        sentry_sdk.init(dsn=None, default_integrations=False, auto_enabling_integrations=False)
+        return
+
+    # pylint: disable=import-outside-toplevel
+    from sentry_sdk.integrations.celery import CeleryIntegration
+    from sentry_sdk.integrations.flask import FlaskIntegration
+    from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
+
+    sentry_sdk.init(
+        dsn=app.config['SENTRY_DSN'],
+        integrations=[
+            FlaskIntegration(),
+            CeleryIntegration(propagate_traces=True),
+            SqlalchemyIntegration(),
+        ],
+        traces_sample_rate=app.config['SENTRY_TRACES_SAMPLE_RATE'],
+        profiles_sample_rate=app.config['SENTRY_PROFILES_SAMPLE_RATE'],
+    )
+
+
+@contextmanager
+def account_run(inbox_id, account_type):
+    """Transaction covering one run of the pipeline over an inbox.
+
+    Inside a Celery task the integration has already started the task's
+    transaction, which is reused; otherwise a new one is started.
+    """
+    sentry_sdk.set_tag('account_type', account_type)
+    sentry_sdk.set_tag('inbox_id', str(inbox_id))
+
+    transaction = sentry_sdk.get_current_scope().transaction
+    if transaction is not None:
+        transaction.set_data('inbox_id', str(inbox_id))
+        yield transaction
+        return
+
+    with sentry_sdk.start_transaction(op='queue.task', name='process_inbox') as transaction:
+        transaction.set_data('inbox_id', str(inbox_id))
+        yield transaction
+
+
+def email_span(email_id, sender):
+    """Child span of the account run covering one email"""
+    span = sentry_sdk.start_span(op='email.process', name=f'email {email_id}')
+    span.set_data('email.id', email_id)
+    span.set_data('email.sender', sender)
+    return span
+
+
+def stage_span(stage, account_type):
+    """Child span of the current span covering one pipeline stage"""
+    span = sentry_sdk.start_span(op=STAGE_OPS.get(stage, 'function'), name=stage)
+    span.set_data('account_type', account_type)
+    return span
+
+
+@contextmanager
+def active_span(span, finish=True):
+    """Make ``span`` the current span for the block.
+
+    Lets a span be worked on in several pieces, e.g. an email that is
+    downloaded first and uploaded once its PDF has been decrypted in the
+    pool. The span is finished after the block if ``finish`` or on error.
+    """
+    scope = sentry_sdk.get_current_scope()
+    previous, scope.span = scope.span, span
+    try:
+        yield span
+    except Exception:
+        span.set_status('internal_error')
+        finish = True
+        raise
+    finally:
+        scope.span = previous
+        if finish:
+            span.finish()
+
+
+def record_stage_span(stage, account_type, started_at, finished_at):
+    """Child span of the current span for a stage that ran in another process"""
+    span = sentry_sdk.start_span(
+        op=STAGE_OPS.get(stage, 'function'),
+        name=stage,
+        start_timestamp=datetime.fromtimestamp(started_at, timezone.utc),
+    )
+    span.set_data('account_type', account_type)
+    span.finish(end_timestamp=datetime.fromtimestamp(finished_at, timezone.utc))
@@ -0,0 +1,210 @@
+"""Shared outbound HTTP transport of a process.
+
+Every outbound call to Google, Zoho and Healthchecks goes through one
+``requests`` adapter per process, so connections to a host are kept alive
+and reused across sessions and tasks instead of paying a TLS handshake per
+client:
+
+- ``HTTP_POOL_HOSTS`` hosts keep a pool of up to ``HTTP_POOL_MAXSIZE``
+  idle connections each;
+- ``HTTP_CONNECT_TIMEOUT`` / ``HTTP_READ_TIMEOUT`` apply to every request;
+- connection errors are retried ``HTTP_RETRIES`` times with exponential
+  backoff, as are 429 and 5xx responses of idempotent requests.
+
+The web app configures the transport with ``web=True``, which swaps in
+``WEB_HTTP_READ_TIMEOUT`` and ``WEB_HTTP_RETRIES`` so a request thread gives
+up on a slow Google long before a gunicorn worker would be recycled.
+
+``OAuth2Session``s are mounted on the shared adapter with ``mount``. The
+Drive API client, which expects an ``httplib2.Http``, gets ``GoogleApiHttp``
+on top of it; google-auth and httplib2 are only imported once it does. ``requests`` only speaks HTTP/1.1; with ``HTTP2_ENABLED`` the
+Gemini client, which uses httpx, negotiates HTTP/2 when ``h2`` is installed.
+
+Requests and newly opened connections are counted per host, so the reuse
+rate is ``1 - connections opened / requests``.
+"""
+import importlib.util
+import os
+import threading
+from urllib.parse import urlsplit
+
+from celery.signals import worker_process_shutdown
+from celery.utils.log import get_task_logger
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from bills_collector.metrics import HTTP_CONNECTIONS_OPENED, HTTP_REQUESTS
+
+logger = get_task_logger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        HTTP_CONNECTIONS_OPENED.labels(self.host).inc()
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        HTTP_CONNECTIONS_OPENED.labels(self.host).inc()
+        return super()._new_conn()
+
+
+class SharedHTTPAdapter(HTTPAdapter):
+    """Adapter mounted on many sessions at once, counting what it sends"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):    # pylint: disable=arguments-differ
+        HTTP_REQUESTS.labels(urlsplit(request.url).hostname or '').inc()
+        return super().send(request, **kwargs)
+
+    def close(self):
+        """Sessions are closed all the time, the pools outlive them"""
+
+    def shutdown(self):
+        super().close()
+
+
+class TimeoutSession(requests.Session):
+    """Session applying the transport's timeouts unless a call sets its own"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):    # pylint: disable=arguments-differ
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class GoogleApiHttp:
+    """Just enough of ``httplib2.Http`` for googleapiclient, over an authorized session"""
+
+    def __init__(self, session, timeout):
+        self.session = session
+        self.timeout = timeout
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=5, connection_type=None):    # pylint: disable=unused-argument
+        import httplib2    # pylint: disable=import-outside-toplevel
+
+        resp = self.session.request(
+            method, uri, data=body, headers=headers, timeout=self.timeout,
+            # Drive answers resumable uploads with 308, which is not a redirect
+            allow_redirects=False,
+        )
+        info = {key.lower(): value for key, value in resp.headers.items()}
+        # requests has decoded the body already
+        info.pop('content-encoding', None)
+        info['status'] = str(resp.status_code)
+        return httplib2.Response(info), resp.content
+
+    def close(self):
+        self.session.close()
+
+
+class Transport:
+    """The adapter and plain session of the current process"""
+
+    def __init__(self):
+        self.pool_hosts = 10
+        self.pool_maxsize = 10
+        self.timeout = (5, 60)
+        self.retries = 3
+        self.retry_backoff = 0.5
+        self.http2 = False
+        self._pid = None
+        self._adapter = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def configure(self, app, web=False):
+        self.shutdown()
+        prefix = 'WEB_HTTP_' if web else 'HTTP_'
+        self.pool_hosts = app.config['HTTP_POOL_HOSTS']
+        self.pool_maxsize = app.config['HTTP_POOL_MAXSIZE']
+        self.timeout = (app.config['HTTP_CONNECT_TIMEOUT'], app.config[f'{prefix}READ_TIMEOUT'])
+        self.retries = app.config[f'{prefix}RETRIES']
+        self.retry_backoff = app.config['HTTP_RETRY_BACKOFF']
+        self.http2 = app.config['HTTP2_ENABLED']
+
+    def _ensure_started(self):
+        with self._lock:
+            # a forked child must not share the parent's sockets
+            if self._pid != os.getpid():
+                self._adapter = SharedHTTPAdapter(
+                    pool_connections=self.pool_hosts,
+                    pool_maxsize=self.pool_maxsize,
+                    max_retries=Retry(
+                        total=self.retries,
+                        backoff_factor=self.retry_backoff,
+                        status_forcelist=RETRY_STATUSES,
+                        respect_retry_after_header=True,
+                        raise_on_status=False,
+                    ),
+                )
+                self._session = self.mount(TimeoutSession(self.timeout), self._adapter)
+                self._pid = os.getpid()
+
+    @property
+    def adapter(self):
+        self._ensure_started()
+        return self._adapter
+
+    def session(self):
+        """Plain session for calls without OAuth, e.g. discovery and health pings"""
+        self._ensure_started()
+        return self._session
+
+    def mount(self, session, adapter=None):
+        """Send ``session``'s requests through the shared adapter"""
+        adapter = adapter or self.adapter
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def google_api_http(self, credentials):
+        """``http`` for googleapiclient, authorized with ``credentials``"""
+        # pylint: disable=import-outside-toplevel
+        from google.auth.transport.requests import AuthorizedSession, Request
+
+        session = AuthorizedSession(credentials, auth_request=Request(self.session()))
+        return GoogleApiHttp(self.mount(session), self.timeout)
+
+    def httpx_client_args(self):
+        """Extra httpx client arguments, for clients built on httpx"""
+        if not self.http2:
+            return {}
+        if importlib.util.find_spec('h2') is None:
+            logger.warning("HTTP2_ENABLED is set but h2 is not installed, using HTTP/1.1")
+            return {}
+        return {'http2': True}
+
+    def shutdown(self):
+        """Close the pooled connections of this process"""
+        with self._lock:
+            if self._adapter is not None and self._pid == os.getpid():
+                self._adapter.shutdown()
+            self._adapter = self._session = self._pid = None
+
+
+transport = Transport()
+
+
+def configure(app, web=False):
+    transport.configure(app, web=web)
+
+
+@worker_process_shutdown.connect
+def shutdown_transport(**kwargs):    # pylint: disable=unused-argument
+    transport.shutdown()
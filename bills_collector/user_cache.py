@@ -0,0 +1,138 @@
+"""Identity cache for Flask-Login's user loader.
+
+Authenticated requests only need the user's id, name and email. These are
+kept in a small per-process LRU with a TTL and, when the ``cache`` extension
+is backed by valkey, in valkey as well so that other processes can skip the
+``users`` table too. Entries are dropped on login, logout and on any update
+of the user row; the TTL bounds how stale other processes' LRUs can get.
+"""
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+import threading
+import time
+from uuid import UUID
+
+from flask import current_app
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from bills_collector.extensions import cache, db
+from bills_collector.models import User
+
+
+@dataclass
+class SessionUser(UserMixin):
+    """The subset of ``User`` needed to serve an authenticated request"""
+
+    id: UUID
+    name: str
+    email: str
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, name=user.name, email=user.email)
+
+    def to_json(self):
+        data = asdict(self)
+        data['id'] = str(self.id)
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(id=UUID(data['id']), name=data['name'], email=data['email'])
+
+
+class LRUCache:
+    """Thread-safe LRU mapping whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local_users = LRUCache()
+
+
+def configure(app):
+    """Size the per-process LRU from the app config"""
+    _local_users.maxsize = app.config['USER_CACHE_SIZE']
+    _local_users.ttl = app.config['USER_CACHE_TTL']
+    _local_users.clear()
+
+
+def _valkey_key(user_id):
+    return f'user:{user_id}'
+
+
+def load_cached_user(user_id):
+    """Return a ``SessionUser`` for ``user_id``, hitting the db only on a miss"""
+    user_id = str(user_id)
+
+    if not current_app.config['USER_CACHE_ENABLED']:
+        user = db.session.get(User, user_id)
+        return SessionUser.from_user(user) if user is not None else None
+
+    session_user = _local_users.get(user_id)
+    if session_user is not None:
+        return session_user
+
+    data = cache.get_json(_valkey_key(user_id)) if cache.client is not None else None
+    if data is not None:
+        session_user = SessionUser.from_json(data)
+    else:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        session_user = SessionUser.from_user(user)
+        if cache.client is not None:
+            cache.set_json(
+                _valkey_key(user_id), session_user.to_json(),
+                timeout=current_app.config['USER_CACHE_TTL']
+            )
+
+    _local_users.set(user_id, session_user)
+    return session_user
+
+
+def invalidate_user(user_id):
+    """Forget the cached identity of ``user_id``"""
+    if user_id is None:
+        return
+    user_id = str(user_id)
+    _local_users.delete(user_id)
+    if cache.client is not None:
+        cache.delete(_valkey_key(user_id))
+
+
+@event.listens_for(User, 'after_update')
+def _invalidate_on_update(mapper, connection, target):    # pylint: disable=unused-argument
+    invalidate_user(target.id)
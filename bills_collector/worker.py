@@ -0,0 +1,12 @@
+"""Celery entry point for workers and beat.
+
+    celery -A bills_collector.worker.celery worker
+
+Imports the task modules before the app is configured, so their periodic
+tasks are scheduled, and builds the worker app without the web routes.
+"""
+from bills_collector.extensions import celery    # noqa: F401  pylint: disable=unused-import
+from bills_collector.tasks import backfill_tasks, inbox_tasks    # noqa: F401  pylint: disable=unused-import
+from bills_collector.app import create_worker_app
+
+flask_app = create_worker_app()
@@ -0,0 +1,23 @@
+"""Gunicorn settings, picked up automatically from the working directory.
+
+Workers are threaded (``gthread``) by default: a request waiting on Google
+only holds its own thread, so the other threads keep serving the dashboard.
+Every thread may hold one database connection, keep ``GUNICORN_THREADS``
+within the SQLAlchemy pool (5 connections plus 10 overflow per worker).
+``GUNICORN_WORKER_CLASS=sync`` restores one request per worker.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+# threaded workers heartbeat from their main thread, so this only catches hung workers
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+
+
+def child_exit(server, worker):    # pylint: disable=unused-argument
+    """Drop the multiprocess metrics of a worker that exited"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess    # pylint: disable=import-outside-toplevel
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,37 @@
+"""Add keyset pagination indexes to bills
+
+Revision ID: 3f1c2b7d9e4a
+Revises: 12a488ebad1e
+Create Date: 2026-10-19 09:12:31.418203
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2b7d9e4a'
+down_revision = '12a488ebad1e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bills', schema=None) as batch_op:
+        batch_op.create_index(
+            'ix_bills_account_due_date_id',
+            ['account_id', 'due_date', 'id'],
+            unique=False,
+            postgresql_include=['amount', 'bill_date', 'status', 'bill_url']
+        )
+        batch_op.create_index(
+            'ix_bills_account_status_due_date_id',
+            ['account_id', 'status', 'due_date', 'id'],
+            unique=False,
+            postgresql_include=['amount', 'bill_date', 'bill_url']
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('bills', schema=None) as batch_op:
+        batch_op.drop_index('ix_bills_account_status_due_date_id')
+        batch_op.drop_index('ix_bills_account_due_date_id')
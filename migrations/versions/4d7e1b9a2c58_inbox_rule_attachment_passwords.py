@@ -0,0 +1,27 @@
+"""Add candidate attachment passwords to inbox_rules
+
+Revision ID: 4d7e1b9a2c58
+Revises: c6d2a9f0b313
+Create Date: 2026-10-19 15:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '4d7e1b9a2c58'
+down_revision = 'c6d2a9f0b313'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('inbox_rules', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('attachment_passwords', postgresql.JSONB(astext_type=sa.Text()), server_default='[]', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('inbox_rules', schema=None) as batch_op:
+        batch_op.drop_column('attachment_passwords')
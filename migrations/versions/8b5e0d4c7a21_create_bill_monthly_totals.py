@@ -0,0 +1,44 @@
+"""Create bill_monthly_totals table
+
+Revision ID: 8b5e0d4c7a21
+Revises: 3f1c2b7d9e4a
+Create Date: 2026-10-19 10:03:12.730154
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b5e0d4c7a21'
+down_revision = '3f1c2b7d9e4a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('bill_monthly_totals',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('account_id', sa.UUID(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('total_amount', sa.Float(), nullable=False),
+    sa.Column('bill_count', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['account_id'], ['linked_accounts.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'account_id', 'month')
+    )
+
+    # Backfill from the bills collected so far
+    op.execute("""
+        INSERT INTO bill_monthly_totals (user_id, account_id, month, total_amount, bill_count, updated_at)
+        SELECT la.user_id, b.account_id, date_trunc('month', b.bill_date)::date,
+               sum(b.amount), count(*), now()
+        FROM bills b JOIN linked_accounts la ON la.id = b.account_id
+        WHERE la.user_id IS NOT NULL
+        GROUP BY la.user_id, b.account_id, date_trunc('month', b.bill_date)::date
+    """)
+
+
+def downgrade():
+    op.drop_table('bill_monthly_totals')
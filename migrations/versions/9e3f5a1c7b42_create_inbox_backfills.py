@@ -0,0 +1,49 @@
+"""Create inbox_backfills table
+
+Revision ID: 9e3f5a1c7b42
+Revises: 4d7e1b9a2c58
+Create Date: 2026-10-19 13:20:05.118342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3f5a1c7b42'
+down_revision = '4d7e1b9a2c58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('inbox_backfills',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('rule_id', sa.UUID(), nullable=False),
+    sa.Column('start_date', sa.Date(), nullable=False),
+    sa.Column('end_date', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('page_cursor', sa.String(length=500), nullable=True),
+    sa.Column('pages_done', sa.Integer(), nullable=False),
+    sa.Column('messages_listed', sa.Integer(), nullable=False),
+    sa.Column('emails_processed', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('last_update_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['rule_id'], ['inbox_rules.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('inbox_backfills', schema=None) as batch_op:
+        batch_op.create_index('ix_inbox_backfills_rule_created', ['rule_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_inbox_backfills_status', ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('inbox_backfills', schema=None) as batch_op:
+        batch_op.drop_index('ix_inbox_backfills_status')
+        batch_op.drop_index('ix_inbox_backfills_rule_created')
+
+    op.drop_table('inbox_backfills')
@@ -0,0 +1,64 @@
+"""Create processing_runs and processing_run_accounts tables
+
+Revision ID: b71d4e2f9a30
+Revises: 9e3f5a1c7b42
+Create Date: 2026-10-19 14:02:41.306519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71d4e2f9a30'
+down_revision = '9e3f5a1c7b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('processing_runs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('accounts_total', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('processing_runs', schema=None) as batch_op:
+        batch_op.create_index('ix_processing_runs_started_at', ['started_at'], unique=False)
+
+    op.create_table('processing_run_accounts',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('run_id', sa.UUID(), nullable=False),
+    sa.Column('account_id', sa.UUID(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('listed', sa.Integer(), nullable=False),
+    sa.Column('duplicates', sa.Integer(), nullable=False),
+    sa.Column('skipped', sa.Integer(), nullable=False),
+    sa.Column('fetched', sa.Integer(), nullable=False),
+    sa.Column('uploaded', sa.Integer(), nullable=False),
+    sa.Column('extracted', sa.Integer(), nullable=False),
+    sa.Column('failed', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('queued_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['account_id'], ['linked_accounts.id'], ),
+    sa.ForeignKeyConstraint(['run_id'], ['processing_runs.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('processing_run_accounts', schema=None) as batch_op:
+        batch_op.create_index('ix_processing_run_accounts_run_account', ['run_id', 'account_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('processing_run_accounts', schema=None) as batch_op:
+        batch_op.drop_index('ix_processing_run_accounts_run_account')
+
+    op.drop_table('processing_run_accounts')
+
+    with op.batch_alter_table('processing_runs', schema=None) as batch_op:
+        batch_op.drop_index('ix_processing_runs_started_at')
+
+    op.drop_table('processing_runs')
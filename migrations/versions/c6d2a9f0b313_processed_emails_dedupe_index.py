@@ -0,0 +1,25 @@
+"""Add dedupe index to processed_emails
+
+Revision ID: c6d2a9f0b313
+Revises: 8b5e0d4c7a21
+Create Date: 2026-10-19 11:40:05.218764
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6d2a9f0b313'
+down_revision = '8b5e0d4c7a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('processed_emails', schema=None) as batch_op:
+        batch_op.create_index('ix_processed_emails_account_email', ['account_id', 'email_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('processed_emails', schema=None) as batch_op:
+        batch_op.drop_index('ix_processed_emails_account_email')
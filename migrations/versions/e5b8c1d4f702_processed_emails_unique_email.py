@@ -0,0 +1,34 @@
+"""Make processed_emails unique per account and email
+
+Revision ID: e5b8c1d4f702
+Revises: b71d4e2f9a30
+Create Date: 2026-10-19 18:21:37.504113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b8c1d4f702'
+down_revision = 'b71d4e2f9a30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keep one of the rows a scan and a backfill racing left for an email
+    op.execute(sa.text(
+        "DELETE FROM processed_emails dup USING processed_emails kept "
+        "WHERE dup.account_id = kept.account_id AND dup.email_id = kept.email_id "
+        "AND dup.id > kept.id"
+    ))
+    with op.batch_alter_table('processed_emails', schema=None) as batch_op:
+        batch_op.drop_index('ix_processed_emails_account_email')
+        batch_op.create_unique_constraint('uq_processed_emails_account_email', ['account_id', 'email_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('processed_emails', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_processed_emails_account_email', type_='unique')
+        batch_op.create_index('ix_processed_emails_account_email', ['account_id', 'email_id'], unique=False)
@@ -0,0 +1,96 @@
+"""
+Fixtures for the benchmark suite.
+
+The benchmarks are marked ``timing`` and only run with RUN_BENCHMARKS=1.
+Each benchmark's best time over its rounds is compared with the baselines of
+this machine, ``baselines/<hostname>.json`` or the file BENCHMARK_BASELINES
+names; the minimum is the least noisy estimate on a shared machine. A run
+slower than the baseline by more than BENCHMARK_TOLERANCE (a fraction,
+default 0.5) fails, a benchmark without a baseline only warns. Record the
+baselines of a machine, kept out of git, with:
+
+    RUN_BENCHMARKS=1 BENCHMARK_UPDATE_BASELINES=1 pytest tests/benchmarks -p no:randomly
+"""
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import time
+import warnings
+
+import pytest
+
+BASELINES_PATH = Path(
+    os.environ.get('BENCHMARK_BASELINES')
+    or Path(__file__).with_name('baselines') / f'{platform.node() or "default"}.json'
+)
+TOLERANCE = float(os.environ.get('BENCHMARK_TOLERANCE', '0.5'))
+UPDATE_BASELINES = os.environ.get('BENCHMARK_UPDATE_BASELINES') == '1'
+
+
+@pytest.fixture(scope='session')
+def baselines():
+    """Recorded best times, in seconds, keyed by benchmark name"""
+    recorded = {}
+    if BASELINES_PATH.exists():
+        recorded = json.loads(BASELINES_PATH.read_text())
+
+    yield recorded
+
+    if UPDATE_BASELINES:
+        recorded = {name: round(best, 6) for name, best in recorded.items()}
+        BASELINES_PATH.parent.mkdir(parents=True, exist_ok=True)
+        BASELINES_PATH.write_text(json.dumps(recorded, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture()
+def compare_to_baseline(baselines):
+    """Fail if the best of ``timings`` regressed against the baseline of ``name``.
+
+    Returns the best time.
+    """
+    def compare(name, timings):
+        best = min(timings)
+        baseline = baselines.get(name)
+        print(f'\n{name}: best {best * 1000:.3f} ms, median {statistics.median(timings) * 1000:.3f} ms'
+              + (f' (baseline {baseline * 1000:.3f} ms)' if baseline else ''))
+
+        if UPDATE_BASELINES:
+            baselines[name] = best
+        elif baseline is None:
+            warnings.warn(f'No baseline recorded for benchmark {name}')
+        elif best > baseline * (1 + TOLERANCE):
+            pytest.fail(
+                f'{name} regressed: best {best * 1000:.3f} ms, '
+                f'baseline {baseline * 1000:.3f} ms, tolerance {TOLERANCE:.0%}'
+            )
+
+        return best
+
+    return compare
+
+
+@pytest.fixture()
+def benchmark(compare_to_baseline):
+    """Time ``func`` and fail if it regressed against its baseline.
+
+    ``setup`` runs before every round and is not timed. One untimed warm-up
+    round runs first. Returns the best time.
+    """
+    def run(name, func, rounds=5, setup=None):
+        if setup is not None:
+            setup()
+        func()
+
+        timings = []
+        for _ in range(rounds):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+
+        return compare_to_baseline(name, timings)
+
+    return run
@@ -0,0 +1,97 @@
+"""
+Import-time budget of the web and worker entry points.
+
+Each entry point is imported in a fresh interpreter under ``python -X importtime``.
+The modules imported must stay out of the other process's graph: the web
+app never loads the Google API client, Gemini, pikepdf or the tasks, and
+the worker never loads the routes. That is checked in every run; the total
+import time is held to its baseline like any other benchmark.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROUNDS = 3
+
+ENTRY_POINTS = {
+    'web': 'from bills_collector.app import create_app; create_app()',
+    'worker': 'import bills_collector.worker',
+}
+
+# Modules each entry point must not import, not even indirectly
+FORBIDDEN = {
+    'web': (
+        'alembic',
+        'flask_migrate',
+        'google.genai',
+        'googleapiclient',
+        'httplib2',
+        'pikepdf',
+        'bills_collector.tasks',
+    ),
+    'worker': (
+        'alembic',
+        'flask_migrate',
+        'bills_collector.routes',
+    ),
+}
+
+
+def import_profile(code):
+    """Run ``code`` in a fresh interpreter, returning the cumulative import time of every module.
+
+    Times are in microseconds. The total import time is the sum over
+    top-level imports, which ``importtime`` does not indent.
+    """
+    env = dict(os.environ, CONFIG_TYPE='bills_collector.config.TestingConfig', SENTRY_DSN='')
+    env.setdefault('SECRET_KEY', 'import-time')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env=env, check=False,
+    )
+    assert result.returncode == 0, result.stderr
+
+    modules, total = {}, 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        modules[name.strip()] = int(cumulative)
+        if not name.startswith('  '):
+            total += int(cumulative)
+    return modules, total
+
+
+@pytest.mark.parametrize('entry_point', ENTRY_POINTS)
+def test_entry_point_imports(entry_point):
+    """
+    GIVEN the web or worker entry point
+    WHEN it is imported in a fresh interpreter
+    THEN it loads none of the other process's modules
+    """
+    modules, _ = import_profile(ENTRY_POINTS[entry_point])
+
+    imported = [
+        module for module in modules
+        if any(module == forbidden or module.startswith(forbidden + '.')
+               for forbidden in FORBIDDEN[entry_point])
+    ]
+    assert not imported, f'{entry_point} imports {", ".join(sorted(imported))}'
+
+
+@pytest.mark.timing
+@pytest.mark.parametrize('entry_point', ENTRY_POINTS)
+def test_import_time(entry_point, compare_to_baseline):
+    """
+    GIVEN the web or worker entry point
+    WHEN it is imported in a fresh interpreter
+    THEN it is imported within its import-time baseline
+    """
+    timings = []
+    for _ in range(ROUNDS):
+        _, total = import_profile(ENTRY_POINTS[entry_point])
+        timings.append(total / 1e6)
+
+    compare_to_baseline(f'import_time[{entry_point}]', timings)
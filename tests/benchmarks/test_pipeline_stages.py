@@ -0,0 +1,229 @@
+"""
+Micro-benchmarks of the stages of the inbox ingestion pipeline.
+
+Each benchmark times the same helper ``process_inbox`` calls, on
+fixture data of a few sizes, so changes to ``inbox_tasks.py`` show up here.
+"""
+import base64
+from datetime import datetime
+import itertools
+import os
+import tracemalloc
+
+import pikepdf
+import pytest
+from sqlalchemy import text
+
+from bills_collector.extensions import db
+from bills_collector.models import Bill, InboxRule, LinkedAccount, User
+from bills_collector.mail_providers import decode_attachment_data, write_attachment_data
+from bills_collector.pdf_processing import PdfProcessor, SaveOptions, decrypt_pdf
+from bills_collector.tasks.inbox_tasks import fetch_processed_ids, save_processed_email
+from tests.pdfs import make_statement_pdf
+
+pytestmark = pytest.mark.timing
+
+PDF_PASSWORD = 'secret'
+
+
+@pytest.fixture
+def bench_account(app, default_user_payload):
+    user = User.query.filter_by(email=default_user_payload['email']).first()
+    account = LinkedAccount(
+        user_id=user.id,
+        account_type='gmail',
+        account_id='bench_gmail_id',
+        expires_at='2023-12-31 23:59:59'
+    )
+    db.session.add(account)
+    db.session.commit()
+
+    return account
+
+
+@pytest.mark.parametrize('size_mb', [1, 10])
+def test_attachment_decode(benchmark, size_mb):
+    """Base64 decode of an attachment body as returned by Gmail"""
+    data = base64.urlsafe_b64encode(os.urandom(size_mb * 1024 * 1024)).decode('ascii')
+
+    benchmark(f'attachment_decode[{size_mb}MB]', lambda: decode_attachment_data(data))
+
+
+@pytest.mark.parametrize('size_mb', [1, 10])
+def test_attachment_write(benchmark, tmp_path, size_mb):
+    """Chunked base64 decode of an attachment body straight to disk"""
+    data = base64.urlsafe_b64encode(os.urandom(size_mb * 1024 * 1024)).decode('ascii')
+    dest = tmp_path / 'attachment.pdf'
+
+    def write():
+        with open(dest, 'wb') as file_obj:
+            write_attachment_data(data, file_obj)
+
+    benchmark(f'attachment_write[{size_mb}MB]', write)
+
+    assert dest.stat().st_size == size_mb * 1024 * 1024
+
+
+def traced_peak(func):
+    """Peak bytes allocated by ``func`` above what was allocated before"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_attachment_write_memory(tmp_path):
+    """Writing a 25 MB attachment keeps only a chunk in memory, not full copies"""
+    payload = os.urandom(25 * 1024 * 1024)
+    data = base64.urlsafe_b64encode(payload).decode('ascii')
+    dest = tmp_path / 'attachment.pdf'
+
+    def write_whole():
+        with open(dest, 'wb') as file_obj:
+            file_obj.write(decode_attachment_data(data))
+
+    def write_chunked():
+        with open(dest, 'wb') as file_obj:
+            write_attachment_data(data, file_obj)
+
+    whole_peak = traced_peak(write_whole)
+    chunked_peak = traced_peak(write_chunked)
+    print(f'\nattachment_write[25MB]: peak {whole_peak / 2**20:.1f} MiB whole, '
+          f'{chunked_peak / 2**20:.2f} MiB chunked')
+
+    # the encoded and the decoded copy, minus a little slack
+    assert whole_peak > 55 * 1024 * 1024
+    assert chunked_peak < 1024 * 1024
+    with open(dest, 'rb') as file_obj:
+        assert file_obj.read() == payload
+
+
+def test_attachment_write_unpadded(tmp_path):
+    """Attachments whose base64 padding was stripped still decode"""
+    payload = os.urandom(1000)
+    data = base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+    dest = tmp_path / 'attachment.pdf'
+
+    with open(dest, 'wb') as file_obj:
+        written = write_attachment_data(data, file_obj, chunk_size=64)
+
+    assert written == len(payload)
+    assert dest.read_bytes() == payload
+
+
+@pytest.mark.parametrize('pages', [1, 20, 100])
+def test_pdf_decrypt(benchmark, tmp_path, pages):
+    """pikepdf open, decrypt and save of an encrypted statement"""
+    src = tmp_path / 'encrypted.pdf'
+    dest = tmp_path / 'decrypted.pdf'
+    src.write_bytes(make_statement_pdf(pages, password=PDF_PASSWORD))
+
+    benchmark(f'pdf_decrypt[{pages}pages]', lambda: decrypt_pdf(src, dest, PDF_PASSWORD))
+
+    with pikepdf.open(dest) as pdf:
+        assert len(pdf.pages) == pages
+        assert not pdf.is_encrypted
+
+
+@pytest.mark.parametrize('pages', [20, 100])
+def test_pdf_optimise(benchmark, tmp_path, pages):
+    """Decrypt and save with every size optimisation on"""
+    src = tmp_path / 'encrypted.pdf'
+    dest = tmp_path / 'optimised.pdf'
+    src.write_bytes(make_statement_pdf(pages, password=PDF_PASSWORD))
+    options = SaveOptions(object_streams=True, recompress_streams=True,
+                          remove_unused_resources=True, linearize=True)
+
+    benchmark(f'pdf_optimise[{pages}pages]', lambda: decrypt_pdf(src, dest, PDF_PASSWORD, options))
+
+    with pikepdf.open(dest) as pdf:
+        assert len(pdf.pages) == pages
+        assert pdf.is_linearized
+
+
+def test_pdf_pool_decrypt(benchmark, tmp_path):
+    """Eight statements decrypted at once by a pool with a process per core"""
+    sources = [tmp_path / f'encrypted-{idx}.pdf' for idx in range(8)]
+    for src in sources:
+        src.write_bytes(make_statement_pdf(20, password=PDF_PASSWORD))
+
+    processor = PdfProcessor()
+    processor.max_workers = os.cpu_count() or 1
+    passwords = ['wrong', PDF_PASSWORD]
+
+    def decrypt_all():
+        futures = [
+            processor.submit_decrypt(src, tmp_path / f'decrypted-{idx}.pdf', passwords)
+            for idx, src in enumerate(sources)
+        ]
+        return [future.result() for future in futures]
+
+    try:
+        benchmark('pdf_pool_decrypt[8x20pages]', decrypt_all)
+        assert {result.password_index for result in decrypt_all()} == {1}
+    finally:
+        processor.shutdown()
+
+
+def test_dedupe_query(benchmark, bench_account):
+    """Dedupe of a 500 message listing against 50k processed emails"""
+    db.session.execute(text("""
+        INSERT INTO processed_emails (id, email_id, account_id, processed_at)
+        SELECT gen_random_uuid(), 'msg_' || n, :account_id, now()
+        FROM generate_series(1, 50000) AS n
+    """), {'account_id': bench_account.id})
+    db.session.commit()
+    db.session.execute(text('ANALYZE processed_emails'))
+
+    # half of the listing is already processed
+    listed = [f'msg_{n}' for n in range(49750, 50250)]
+
+    result = {}
+    benchmark('dedupe_query', lambda: result.update(ids=fetch_processed_ids(bench_account.id, listed)), rounds=20)
+
+    assert len(result['ids']) == 251
+
+
+def test_bill_persistence(benchmark, bench_account):
+    """Bill, processed email and monthly total written in one commit"""
+    counter = itertools.count()
+
+    benchmark(
+        'bill_persistence',
+        lambda: save_processed_email(
+            bench_account.id, f'msg_{next(counter)}',
+            bill_date=datetime(2025, 1, 15), bill_url='https://drive.google.com/file/d/x'
+        ),
+        rounds=20
+    )
+
+    assert Bill.query.filter_by(account_id=bench_account.id).count() == 21
+
+
+def test_model_serialisation(app, benchmark):
+    """JSON serialisation of the dataclass models returned by the API"""
+    rules = [
+        InboxRule(
+            id=f'rule_{idx}', account_id='account', name=f'Rule {idx}',
+            email_from='bills@company.com', email_subject='Monthly statement',
+            attachment_password='secret', destination_folder_id='folder',
+            destination_folder_name='Bills', destination_account_id='drive'
+        )
+        for idx in range(200)
+    ]
+    bills = [
+        Bill(
+            id=f'bill_{idx}', account_id='account', email_id=f'msg_{idx}', amount=idx * 1.5,
+            bill_date=datetime(2025, 1, 1), due_date=datetime(2025, 1, 21),
+            status='pending', bill_url='https://drive.google.com/file/d/x'
+        )
+        for idx in range(200)
+    ]
+
+    benchmark(
+        'model_serialisation',
+        lambda: app.json.dumps({'inbox_rules': rules, 'bills': bills}),
+        rounds=20
+    )
@@ -0,0 +1,61 @@
+"""
+Benchmark of authenticated request latency with and without the user cache.
+
+Run with ``RUN_BENCHMARKS=1 pytest tests/benchmarks -s`` to see the timings.
+"""
+import statistics
+import time
+
+import pytest
+from sqlalchemy import event
+
+from bills_collector.extensions import db
+
+pytestmark = pytest.mark.timing
+
+REQUESTS = 200
+
+
+def run_requests(app, test_client, cache_enabled):
+    """Time REQUESTS polls of a cached API endpoint, counting users queries"""
+    app.config['USER_CACHE_ENABLED'] = cache_enabled
+    user_queries = []
+
+    def count_users_queries(conn, cursor, statement, *args):    # pylint: disable=unused-argument
+        if 'FROM users' in statement:
+            user_queries.append(statement)
+
+    # warm up the response cache and, when enabled, the user cache
+    with app.app_context():
+        test_client.get('/api/linked_accounts')
+
+    event.listen(db.engine, 'before_cursor_execute', count_users_queries)
+    timings = []
+    try:
+        for _ in range(REQUESTS):
+            # the fixture's app context outlives requests, so give every request
+            # its own like production does: a fresh `g` and db session
+            with app.app_context():
+                start = time.perf_counter()
+                response = test_client.get('/api/linked_accounts')
+                timings.append(time.perf_counter() - start)
+            assert response.status_code == 200
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_users_queries)
+
+    return statistics.median(timings), len(user_queries)
+
+
+def test_user_loading_benchmark(app, test_client, log_in_default_user):
+    """Most authenticated requests do not touch the users table"""
+    uncached_median, uncached_queries = run_requests(app, test_client, cache_enabled=False)
+    cached_median, cached_queries = run_requests(app, test_client, cache_enabled=True)
+
+    print(
+        f'\nload_user over {REQUESTS} requests: '
+        f'uncached median {uncached_median * 1000:.3f} ms ({uncached_queries} users queries), '
+        f'cached median {cached_median * 1000:.3f} ms ({cached_queries} users queries)'
+    )
+
+    assert uncached_queries == REQUESTS
+    assert cached_queries == 0
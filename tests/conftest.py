@@ -1,13 +1,27 @@
 import pytest
 import random
 import os
+from contextlib import contextmanager
 
 from flask_login.test_client import FlaskLoginClient
+from sqlalchemy import event
 
 from bills_collector.app import create_app
 from bills_collector.extensions import db, bcrypt
 from bills_collector.models import User
 
+RUN_BENCHMARKS = os.environ.get('RUN_BENCHMARKS') == '1'
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip wall-clock benchmarks unless asked for, their timings depend on the machine"""
+    if RUN_BENCHMARKS:
+        return
+    skip = pytest.mark.skip(reason='timing benchmark, set RUN_BENCHMARKS=1 to run it')
+    for item in items:
+        if item.get_closest_marker('timing'):
+            item.add_marker(skip)
+
 @pytest.fixture()
 def app(default_user_payload):
 
@@ -52,6 +66,45 @@ def log_in_default_user(test_client, default_user_payload):
     test_client.get('/logout')
 
 
+class QueryCounter:
+    """Collects the SQL statements executed while it is active"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+@pytest.fixture()
+def max_queries(app):
+    """Fail when a block runs more SQL statements than allowed.
+
+    Guards hot paths against N+1 regressions:
+
+        with max_queries(5):
+            process_inbox(account_id)
+    """
+    @contextmanager
+    def guard(limit):
+        counter = QueryCounter()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+        try:
+            yield counter
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', counter)
+
+        if counter.count > limit:
+            pytest.fail(
+                f'{counter.count} SQL statements executed, expected at most {limit}:\n'
+                + '\n'.join(counter.statements)
+            )
+
+    return guard
+
 @pytest.fixture()
 def runner(app):
     return app.test_cli_runner()
@@ -0,0 +1,353 @@
+"""
+This file (test_api.py) contains the functional tests for the `api` blueprint.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from bills_collector.aggregates import record_bill
+from bills_collector.extensions import celery, db
+from bills_collector.models import Bill, InboxBackfill, InboxRule, LinkedAccount, User
+from bills_collector.processing_runs import finish_account, start_account, start_run
+
+
+@pytest.fixture()
+def gmail_account(app, default_user_payload):
+    user = User.query.filter_by(email=default_user_payload['email']).first()
+
+    account = LinkedAccount(
+        user_id=user.id,
+        account_type='gmail',
+        account_id='test_gmail_id',
+        access_token='test_access_token',
+        refresh_token='test_refresh_token',
+        token_json={
+            'access_token': 'test_access_token',
+            'refresh_token': 'test_refresh_token',
+            'expires_at': 1700000000
+        },
+        user_profile={'name': 'Somebody Kumar', 'email': 'somebody@gmail.com', 'profile_picture': ''},
+        expires_at='2023-12-31 23:59:59'
+    )
+    db.session.add(account)
+    db.session.commit()
+
+    return account
+
+
+@pytest.fixture()
+def account_bills(gmail_account):
+    bills = []
+    for idx in range(5):
+        bills.append(Bill(
+            account_id=gmail_account.id,
+            email_id=f'email_{idx}',
+            amount=100.0 * idx,
+            bill_date=datetime(2025, 1, 1) + timedelta(days=idx),
+            # two bills share a due date to exercise the id tie-breaker
+            due_date=datetime(2025, 2, 1) + timedelta(days=idx // 2),
+            status='paid' if idx % 2 else 'pending',
+        ))
+    db.session.add_all(bills)
+    db.session.commit()
+
+    return bills
+
+
+def rule_payload(account):
+    return {
+        'name': 'Card statement',
+        'email_from': 'bills@company.com',
+        'email_subject': 'Monthly Bill',
+        'attachment_password': '',
+        'destination_folder_id': 'folder_id',
+        'destination_folder_name': 'Bills',
+        'destination_account_id': str(account.id),
+    }
+
+
+def test_linked_accounts_sets_etag(test_client, log_in_default_user, gmail_account):
+    """
+    GIVEN a logged in user with a linked account
+    WHEN '/api/linked_accounts' is requested twice, the second time with the ETag
+    THEN check the second response is a 304 without a body
+    """
+    response = test_client.get('/api/linked_accounts')
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert response.json['linked_accounts'][0]['account_type'] == 'gmail'
+
+    etag = response.headers['ETag']
+    response = test_client.get('/api/linked_accounts', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_cached_response_skips_database(test_client, log_in_default_user, gmail_account):
+    """
+    GIVEN a warm response cache
+    WHEN the account row is removed behind the cache's back
+    THEN check the cached response is still served, i.e. the table was not read
+    """
+    test_client.get('/api/linked_accounts')
+
+    LinkedAccount.query.filter_by(id=gmail_account.id).delete()
+    db.session.commit()
+
+    response = test_client.get('/api/linked_accounts')
+
+    assert response.status_code == 200
+    assert len(response.json['linked_accounts']) == 1
+
+
+def test_local_cache_is_skipped_with_several_processes(app, test_client, log_in_default_user, gmail_account):
+    """
+    GIVEN an in-process cache on an app that may run in several processes
+    WHEN the account row is removed between two requests
+    THEN check the second reads the table again, still with an ETag
+    """
+    app.config['CACHE_LOCAL_RESPONSES'] = False
+    test_client.get('/api/linked_accounts')
+
+    LinkedAccount.query.filter_by(id=gmail_account.id).delete()
+    db.session.commit()
+
+    response = test_client.get('/api/linked_accounts')
+
+    assert response.status_code == 200
+    assert response.json['linked_accounts'] == []
+    assert 'ETag' in response.headers
+
+
+def test_rule_write_invalidates_cache(test_client, log_in_default_user, gmail_account):
+    """
+    GIVEN a cached list of inbox rules
+    WHEN a new rule is created for the account
+    THEN check the old ETag no longer matches and the new rule is returned
+    """
+    rules_url = f'/api/linked_accounts/{gmail_account.id}/inbox_rules'
+
+    response = test_client.get(rules_url)
+    assert response.json['inbox_rules'] == []
+    etag = response.headers['ETag']
+
+    response = test_client.post(rules_url, json=rule_payload(gmail_account))
+    assert response.status_code == 201
+
+    response = test_client.get(rules_url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.json['inbox_rules'][0]['name'] == 'Card statement'
+
+
+def test_rule_candidate_passwords(test_client, log_in_default_user, gmail_account):
+    """
+    GIVEN a logged in user with a linked account
+    WHEN a rule is created with extra attachment passwords, then updated with a bad list
+    THEN check the passwords are stored and the bad update is rejected with a 400
+    """
+    rules_url = f'/api/linked_accounts/{gmail_account.id}/inbox_rules'
+    payload = dict(rule_payload(gmail_account), attachment_password='2025',
+                   attachment_passwords=['2024', '2025'])
+
+    response = test_client.post(rules_url, json=payload)
+    assert response.status_code == 201
+    assert response.json['attachment_passwords'] == ['2024', '2025']
+
+    rule = InboxRule.query.filter_by(id=response.json['id']).one()
+    assert rule.candidate_passwords == ['2025', '2024']
+
+    response = test_client.post(f"{rules_url}/{rule.id}", json=dict(payload, attachment_passwords='2024'))
+    assert response.status_code == 400
+
+
+def test_backfill_is_started_and_monitored(test_client, log_in_default_user, gmail_account, monkeypatch):
+    """
+    GIVEN a rule of a linked account
+    WHEN a backfill is started for it, then listed and fetched
+    THEN check it is queued by name and its progress is served
+    """
+    sent = []
+    monkeypatch.setattr(celery, 'send_task', lambda name, args: sent.append((name, args)))
+    rules_url = f'/api/linked_accounts/{gmail_account.id}/inbox_rules'
+    rule_id = test_client.post(rules_url, json=rule_payload(gmail_account)).json['id']
+    backfills_url = f'{rules_url}/{rule_id}/backfills'
+
+    response = test_client.post(backfills_url, json={'start_date': '2025-01-01', 'end_date': '2025-12-31'})
+    assert response.status_code == 202
+    backfill_id = response.json['id']
+    assert response.json['status'] == 'pending'
+    assert sent == [('bills_collector.tasks.backfill_tasks.backfill_rule', [backfill_id])]
+
+    assert [backfill['id'] for backfill in test_client.get(backfills_url).json['backfills']] == [backfill_id]
+
+    response = test_client.get(f'/api/backfills/{backfill_id}')
+    assert response.status_code == 200
+    assert (response.json['pages_done'], response.json['emails_processed']) == (0, 0)
+
+    # only failed backfills resume
+    response = test_client.post(f'/api/backfills/{backfill_id}/resume')
+    assert response.status_code == 409
+
+
+def test_backfill_rejects_bad_dates(test_client, log_in_default_user, gmail_account):
+    """
+    GIVEN a rule of a linked account
+    WHEN a backfill is started without dates or with its dates reversed
+    THEN check it is rejected with a 400 and nothing is stored
+    """
+    rules_url = f'/api/linked_accounts/{gmail_account.id}/inbox_rules'
+    rule_id = test_client.post(rules_url, json=rule_payload(gmail_account)).json['id']
+    backfills_url = f'{rules_url}/{rule_id}/backfills'
+
+    assert test_client.post(backfills_url, json={'start_date': '2025-01-01'}).status_code == 400
+    response = test_client.post(backfills_url, json={'start_date': '2025-12-31', 'end_date': '2025-01-01'})
+    assert response.status_code == 400
+    assert InboxBackfill.query.count() == 0
+
+
+def test_processing_runs_show_this_users_progress(test_client, log_in_default_user, gmail_account, max_queries):
+    """
+    GIVEN a running processing run over this user's inbox and somebody else's
+    WHEN '/api/processing_runs' and the run's own page are requested
+    THEN check only this user's inbox is counted, with its backlog, in two queries
+    """
+    other_user = User(name='Other', email='other@kumar.inc', password=b'x')
+    db.session.add(other_user)
+    db.session.flush()
+    other_account = LinkedAccount(user_id=other_user.id, account_type='gmail', account_id='other_gmail_id',
+                                  expires_at=datetime.now())
+    db.session.add(other_account)
+    db.session.commit()
+
+    run_id = start_run([gmail_account.id, other_account.id])
+    for account, listed in ((gmail_account, 10), (other_account, 99)):
+        progress = start_account(run_id, account.id)
+        progress.add('listed', listed)
+        progress.add('duplicates', 2)
+        progress.add('fetched', 5)
+        if account is other_account:
+            finish_account(progress)
+        else:
+            progress.flush()
+
+    with max_queries(2):
+        response = test_client.get('/api/processing_runs')
+
+    assert response.status_code == 200
+    [summary] = response.json['processing_runs']
+    assert summary['id'] == str(run_id)
+    assert summary['status'] == 'running'
+    assert (summary['accounts'], summary['accounts_finished']) == (1, 0)
+    assert (summary['listed'], summary['duplicates'], summary['fetched']) == (10, 2, 5)
+    assert summary['backlog'] == 3
+
+    response = test_client.get(f'/api/processing_runs/{run_id}')
+
+    assert response.status_code == 200
+    assert [account['account_id'] for account in response.json['accounts']] == [str(gmail_account.id)]
+    assert response.json['accounts'][0]['status'] == 'running'
+    assert test_client.get('/api/processing_runs/not-a-run').status_code == 404
+
+
+def test_unknown_account_is_not_cached(test_client, log_in_default_user):
+    """
+    GIVEN a logged in user
+    WHEN an account that does not exist is requested
+    THEN check a 404 is returned without an ETag
+    """
+    response = test_client.get('/api/linked_accounts/00000000-0000-0000-0000-000000000000')
+
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+
+def test_bills_keyset_pagination(test_client, log_in_default_user, account_bills):
+    """
+    GIVEN a user with five bills
+    WHEN '/api/bills' is paged through two at a time
+    THEN check every bill is returned exactly once in (due_date, id) order
+    """
+    seen = []
+    cursor = None
+    while True:
+        params = {'limit': 2}
+        if cursor:
+            params['cursor'] = cursor
+        response = test_client.get('/api/bills', query_string=params)
+        assert response.status_code == 200
+
+        seen.extend(response.json['bills'])
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            break
+
+    expected = sorted(account_bills, key=lambda bill: (bill.due_date, str(bill.id)))
+    assert [bill['id'] for bill in seen] == [str(bill.id) for bill in expected]
+
+
+def test_bills_filters(test_client, log_in_default_user, account_bills):
+    """
+    GIVEN a user with paid and pending bills
+    WHEN '/api/bills' is filtered by status and due date range
+    THEN check only matching bills are returned
+    """
+    response = test_client.get('/api/bills', query_string={
+        'status': 'pending',
+        'due_from': '2025-02-02',
+        'due_to': '2025-02-03',
+    })
+
+    assert response.status_code == 200
+    assert [bill['amount'] for bill in response.json['bills']] == [200.0, 400.0]
+    assert all(bill['status'] == 'pending' for bill in response.json['bills'])
+
+
+def test_bills_invalid_cursor(test_client, log_in_default_user):
+    """
+    GIVEN a logged in user
+    WHEN '/api/bills' is requested with a malformed cursor
+    THEN check a 400 is returned
+    """
+    response = test_client.get('/api/bills', query_string={'cursor': 'not-a-cursor'})
+
+    assert response.status_code == 400
+
+
+def test_bills_summary(test_client, log_in_default_user, gmail_account):
+    """
+    GIVEN a bill due in three days and recorded in the monthly totals
+    WHEN '/api/bills/summary' is requested
+    THEN check the bill shows up in both the totals and the upcoming list
+    """
+    today = date.today()
+    bill = Bill(
+        account_id=gmail_account.id,
+        email_id='email_upcoming',
+        amount=120.0,
+        bill_date=today,
+        due_date=today + timedelta(days=3),
+        status='pending',
+    )
+    db.session.add(bill)
+    record_bill(gmail_account.id, bill.bill_date, bill.amount)
+    db.session.commit()
+
+    response = test_client.get('/api/bills/summary', query_string={'due_within': 5})
+
+    assert response.status_code == 200
+    assert response.json['monthly_totals'][0]['total_amount'] == 120.0
+    assert response.json['monthly_totals'][0]['bill_count'] == 1
+    assert [row['id'] for row in response.json['upcoming']] == [str(bill.id)]
+
+
+def test_bills_query_budget(test_client, log_in_default_user, account_bills, max_queries):
+    """
+    GIVEN a user with several bills
+    WHEN a page of '/api/bills' is requested
+    THEN check it costs at most the user lookup and a single bills query
+    """
+    with max_queries(2):
+        response = test_client.get('/api/bills')
+
+    assert len(response.json['bills']) == len(account_bills)
@@ -0,0 +1,33 @@
+from bills_collector.metrics import track_stage
+
+
+def test_metrics_endpoint(app, test_client):
+    """
+    GIVEN a flask app whose pipeline has run a stage
+    WHEN /metrics is scraped with the metrics token, without logging in
+    THEN the stage histogram is served in the Prometheus text format
+    """
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+    with track_stage('fetch', 'gmail'):
+        pass
+
+    response = test_client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert b'bills_pipeline_stage_seconds_count{account_type="gmail",stage="fetch"}' in response.data
+    assert b'bills_pipeline_stage_errors_total' in response.data
+
+
+def test_metrics_need_the_token(app, test_client):
+    """
+    GIVEN a flask app with and without a metrics token
+    WHEN /metrics is scraped without it, or with a wrong one
+    THEN nothing is served
+    """
+    assert test_client.get('/metrics').status_code == 404
+
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+
+    assert test_client.get('/metrics').status_code == 401
+    assert test_client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
@@ -0,0 +1,142 @@
+"""
+Integration tests for backfills of a rule's older emails.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from bills_collector.extensions import db
+from bills_collector.models import Bill, BillMonthlyTotal, InboxBackfill, InboxRule, ProcessedEmail
+from bills_collector.tasks.backfill_tasks import backfill_rule, resume_backfills
+from bills_collector.tasks.inbox_tasks import save_processed_email
+from tests.loadtest.fake_google import FakeGoogle, Mailbox
+from tests.loadtest.harness import fake_google_config, seed_accounts
+
+
+@pytest.fixture
+def queued_runs(monkeypatch):
+    """Backfill runs queued, instead of being sent to a worker"""
+    queued = []
+    monkeypatch.setattr(backfill_rule, 'apply_async', lambda args, countdown: queued.append(args))
+    monkeypatch.setattr(backfill_rule, 'delay', lambda *args: queued.append(args))
+    return queued
+
+
+def test_backfill_resumes_from_its_checkpoint(app, queued_runs, monkeypatch, tmp_path):
+    """
+    GIVEN a backfill over last year of a rule matching more emails than fit in a page
+    WHEN its first run stops after one page and the worker never runs the next one
+    THEN it is resumed as stale and continues from the checkpointed page to completion
+    """
+    mailbox = Mailbox(accounts=1, messages=5, pdf_pages=1)
+    seed_accounts(mailbox)
+    rule = InboxRule.query.first()
+    last_year = date.today().year - 1
+    backfill = InboxBackfill(
+        user_id=rule.user_id, rule_id=rule.id,
+        start_date=date(last_year, 1, 1), end_date=date(last_year, 12, 31)
+    )
+    db.session.add(backfill)
+    db.session.commit()
+
+    app.config.update(BACKFILL_PAGE_SIZE=2, BACKFILL_PAGES_PER_RUN=1, BACKFILL_STALE_AFTER_SECONDS=0)
+    # the tasks write attachments under ./tmp
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'tmp').mkdir()
+
+    with FakeGoogle(mailbox) as fake:
+        app.config.update(fake_google_config(fake))
+
+        backfill_rule(backfill.id)
+        assert (backfill.status, backfill.pages_done, backfill.emails_processed) == ('running', 1, 2)
+        assert backfill.page_cursor == '2'
+        assert queued_runs == [(backfill.id,)]
+
+        # the queued run is lost with its worker
+        queued_runs.clear()
+        resume_backfills()
+        assert queued_runs == [(backfill.id,)]
+
+        while backfill.status != 'completed':
+            backfill_rule(backfill.id)
+
+    assert (backfill.pages_done, backfill.messages_listed, backfill.emails_processed) == (3, 5, 5)
+    assert backfill.finished_at is not None
+    assert ProcessedEmail.query.count() == 5
+    # every page listed once, over the backfill's dates
+    assert fake.stats.requests['messages.list'] == 3
+    assert set(fake.stats.searches) == {
+        f'has:attachment after:{last_year}/01/01 before:{last_year + 1}/01/01 in:INBOX '
+        f'from:{rule.email_from} subject:{rule.email_subject}'
+    }
+
+
+def test_failed_backfill_records_the_error(app, queued_runs, monkeypatch, tmp_path):
+    """
+    GIVEN a backfill whose listing fails
+    WHEN it runs
+    THEN it is marked failed with the error and no further run is queued
+    """
+    mailbox = Mailbox(accounts=1, messages=2, pdf_pages=1)
+    seed_accounts(mailbox)
+    rule = InboxRule.query.first()
+    backfill = InboxBackfill(
+        user_id=rule.user_id, rule_id=rule.id,
+        start_date=date.today() - timedelta(days=400), end_date=date.today()
+    )
+    db.session.add(backfill)
+    db.session.commit()
+    monkeypatch.chdir(tmp_path)
+
+    with FakeGoogle(mailbox, error_rate=1.0) as fake:
+        app.config.update(fake_google_config(fake))
+        with pytest.raises(Exception):
+            backfill_rule(backfill.id)
+
+    assert backfill.status == 'failed'
+    assert backfill.error
+    assert queued_runs == []
+
+
+def test_backfill_of_a_rule_without_an_inbox_fails(app, queued_runs):
+    """
+    GIVEN a backfill of a rule whose inbox was unlinked
+    WHEN it runs
+    THEN it is marked failed without raising, so it is not resumed again
+    """
+    seed_accounts(Mailbox(accounts=1, messages=1))
+    rule = InboxRule.query.first()
+    backfill = InboxBackfill(
+        user_id=rule.user_id, rule_id=rule.id,
+        start_date=date.today() - timedelta(days=400), end_date=date.today()
+    )
+    db.session.add(backfill)
+    rule.account_id = None
+    db.session.commit()
+
+    backfill_rule(backfill.id)
+
+    assert backfill.status == 'failed'
+    assert backfill.error == 'The rule or its inbox was deleted'
+    assert queued_runs == []
+
+
+def test_email_saved_by_a_scan_and_a_backfill_is_billed_once(app):
+    """
+    GIVEN an email a scan and a backfill both downloaded before either saved it
+    WHEN both save it
+    THEN the second finds it processed and adds no bill nor monthly total
+    """
+    seed_accounts(Mailbox(accounts=1, messages=1))
+    inbox_id = InboxRule.query.first().account_id
+    bill_date = date.today().replace(day=1)
+
+    saved = [
+        save_processed_email(inbox_id, 'msg-1', bill_date=bill_date, bill_url='https://drive.test/1')
+        for _ in range(2)
+    ]
+
+    assert saved[0] is not None and saved[1] is None
+    assert ProcessedEmail.query.filter_by(account_id=inbox_id).count() == 1
+    assert Bill.query.filter_by(account_id=inbox_id).count() == 1
+    assert [total.bill_count for total in BillMonthlyTotal.query.filter_by(account_id=inbox_id)] == [1]
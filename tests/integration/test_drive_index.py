@@ -0,0 +1,134 @@
+"""
+Integration tests for the Drive folder index consulted before uploads.
+"""
+import pytest
+
+from bills_collector.drive_index import DriveFolderIndex, UploadAction, upload_to_folder
+from bills_collector.integrations import GoogleClient
+from bills_collector.models import LinkedAccount
+from bills_collector.tasks.inbox_tasks import process_inbox
+from tests.loadtest.fake_google import FakeGoogle, Mailbox, access_token
+from tests.loadtest.harness import fake_google_config, seed_accounts
+
+FOLDER_ID = 'bills-folder'
+
+DRIVE_TOKEN = {
+    'access_token': access_token('drive'),
+    'refresh_token': 'lt-refresh-drive',
+    'token_type': 'Bearer',
+    'expires_at': 4102444800,
+}
+
+
+@pytest.fixture
+def fake_drive(app):
+    with FakeGoogle(Mailbox(accounts=1, messages=1)) as fake:
+        app.config.update(fake_google_config(fake))
+        yield fake
+
+
+@pytest.fixture
+def drive_client(fake_drive):
+    client = GoogleClient(token=DRIVE_TOKEN)
+    yield client
+    client.close()
+
+
+def upload(drive_client, path, email_id, name='2025-01.pdf'):
+    """Upload as one run of the pipeline would: with a freshly loaded index"""
+    index = DriveFolderIndex.load(drive_client, 'drive-account', FOLDER_ID)
+    return upload_to_folder(index, 'application/pdf', path, name, email_id)
+
+
+def test_reupload_is_skipped_and_changes_are_revisions(fake_drive, drive_client, tmp_path):
+    """
+    GIVEN a statement uploaded to an empty folder
+    WHEN the same email is uploaded again, unchanged and then changed,
+        and another email's statement of the same month follows
+    THEN the unchanged copy is skipped, the changed one becomes a revision
+        and only the other email creates a second file
+    """
+    statement = tmp_path / 'statement.pdf'
+    statement.write_bytes(b'%PDF-1.7 january')
+
+    created = upload(drive_client, statement, 'msg-1')
+    assert created.action == UploadAction.CREATED
+
+    skipped = upload(drive_client, statement, 'msg-1')
+    assert skipped.action == UploadAction.SKIPPED
+    assert skipped.file['id'] == created.file['id']
+    assert skipped.file['webViewLink'] == created.file['webViewLink']
+
+    statement.write_bytes(b'%PDF-1.7 january, reissued')
+    revised = upload(drive_client, statement, 'msg-1')
+    assert revised.action == UploadAction.REVISED
+    assert revised.file['id'] == created.file['id']
+
+    other = tmp_path / 'other.pdf'
+    other.write_bytes(b'%PDF-1.7 another biller')
+    assert upload(drive_client, other, 'msg-2').action == UploadAction.CREATED
+
+    assert fake_drive.stats.requests['files.create'] == 2
+    assert fake_drive.stats.requests['files.update'] == 1
+    # listed once, then caught up from the changes feed
+    assert fake_drive.stats.requests['files.list'] == 1
+    assert fake_drive.stats.requests['changes.list'] == 3
+
+
+def test_index_follows_the_changes_feed(fake_drive, drive_client, tmp_path):
+    """
+    GIVEN an indexed folder
+    WHEN a matching file is added to it, and another to a different folder, outside the pipeline
+    THEN the next upload of that content only tags the file in this folder
+    """
+    DriveFolderIndex.load(drive_client, 'drive-account', FOLDER_ID)
+
+    statement = tmp_path / 'statement.pdf'
+    statement.write_bytes(b'%PDF-1.7 uploaded by hand')
+    fake_drive.write_drive_file('elsewhere', {'name': '2025-01.pdf', 'parents': ['other-folder']},
+                                statement.read_bytes())
+    fake_drive.write_drive_file('by-hand', {'name': 'January.pdf', 'parents': [FOLDER_ID]},
+                                statement.read_bytes())
+
+    tagged = upload(drive_client, statement, 'msg-1')
+
+    assert tagged.action == UploadAction.TAGGED
+    assert tagged.file['id'] == 'by-hand'
+    assert fake_drive.drive_files['by-hand']['appProperties'] == {'email_id': 'msg-1'}
+    assert upload(drive_client, statement, 'msg-1').action == UploadAction.SKIPPED
+    assert 'files.create' not in fake_drive.stats.requests
+
+
+def test_each_statement_of_an_email_gets_its_own_file(app, monkeypatch, tmp_path):
+    """
+    GIVEN an email with two PDF statements, both named after the same month in Drive
+    WHEN its inbox is processed, and later a changed copy of the second one is uploaded
+    THEN Drive holds a file per statement, told apart by their part id, and the
+        change is a revision of the second statement's file only
+    """
+    mailbox = Mailbox(accounts=1, messages=1, pdf_pages=1, pdfs=2)
+    seed_accounts(mailbox)
+    account = LinkedAccount.query.filter_by(account_type='gmail').first()
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'tmp').mkdir()
+
+    with FakeGoogle(mailbox) as fake:
+        app.config.update(fake_google_config(fake))
+        process_inbox(account.id)
+
+        assert fake.stats.requests['files.create'] == 2
+        assert 'files.update' not in fake.stats.requests
+        files = {file['appProperties']['part_id']: file for file in fake.drive_files.values()}
+        assert sorted(files) == ['1', '2']
+        assert files['1']['name'] == files['2']['name']
+        email_id = files['1']['appProperties']['email_id']
+
+        client = GoogleClient(token=DRIVE_TOKEN)
+        reissued = tmp_path / 'reissued.pdf'
+        reissued.write_bytes(b'%PDF-1.7 reissued')
+        index = DriveFolderIndex.load(client, 'drive-account', files['2']['parents'][0])
+        revised = upload_to_folder(index, 'application/pdf', reissued, files['2']['name'], email_id, '2')
+        client.close()
+
+    assert revised.action == UploadAction.REVISED
+    assert revised.file['id'] == files['2']['id']
@@ -10,9 +10,9 @@ from googleapiclient.discovery import build
 from googleapiclient.http import HttpMock, RequestMockBuilder
 
 from bills_collector.extensions import db
-from bills_collector.models import LinkedAccount, InboxRule, ProcessedEmail, User
+from bills_collector.models import LinkedAccount, InboxRule, ProcessedEmail, ProcessingRunAccount, User
 from bills_collector.integrations import GoogleClient
-from bills_collector.tasks.inbox_tasks import process_gmail_inbox
+from bills_collector.tasks.inbox_tasks import process_inbox
 
 def read_response(filename):
     """Helper to read mock response files"""
@@ -22,7 +22,7 @@ def read_response(filename):
 @pytest.fixture
 def mock_google_client():
     """Returns a mocked GoogleClient"""
-    with patch('bills_collector.tasks.inbox_tasks.GoogleClient') as MockGoogleClient:
+    with patch('bills_collector.mail_providers.GoogleClient') as MockGoogleClient:
         mock_client = MockGoogleClient.return_value
         # Setup common mock returns
         mock_client.fetch_inbox_emails.return_value = {
@@ -100,6 +100,7 @@ def linked_accounts_setup(app):
         }
         
         # Cleanup
+        ProcessingRunAccount.query.filter_by(account_id=gmail_account.id).delete()
         ProcessedEmail.query.filter_by(account_id=gmail_account.id).delete()
         InboxRule.query.filter_by(account_id=gmail_account.id).delete()
         LinkedAccount.query.filter_by(id=gmail_account.id).delete()
@@ -145,7 +146,7 @@ def test_process_gmail_inbox_standard_mocks(app, inbox_rule_setup, mock_google_c
                 mock_pdf_open.return_value = mock_pdf
                 
                 # Execute the task
-                process_gmail_inbox(inbox_rule_setup.account_id)
+                process_inbox(inbox_rule_setup.account_id)
                 
                 # Assertions
                 mock_google_client.fetch_inbox_emails.assert_called_once()
@@ -196,7 +197,7 @@ def test_process_gmail_inbox_with_google_mocks(app, inbox_rule_setup):
                     mock_get_drive.return_value = mock_drive_client
                     
                     # Execute the task
-                    process_gmail_inbox(inbox_rule_setup.account_id)
+                    process_inbox(inbox_rule_setup.account_id)
                     
                     # Verify email was marked as processed
                     processed_email = ProcessedEmail.query.filter_by(
@@ -221,7 +222,7 @@ def test_process_gmail_inbox_skips_processed_emails(app, inbox_rule_setup, mock_
         db.session.commit()
         
         # Run the task
-        process_gmail_inbox(inbox_rule_setup.account_id)
+        process_inbox(inbox_rule_setup.account_id)
         
         # Verify that fetch_one_email was not called since email was already processed
         mock_google_client.fetch_one_email.assert_not_called()
@@ -230,16 +231,37 @@ def test_process_gmail_inbox_error_handling(app, inbox_rule_setup):
     """Test error handling during email processing"""
     with app.app_context():
         # Create a GoogleClient that raises an exception
-        with patch('bills_collector.tasks.inbox_tasks.GoogleClient') as MockGoogleClient:
+        with patch('bills_collector.mail_providers.GoogleClient') as MockGoogleClient:
             mock_client = MockGoogleClient.return_value
             mock_client.fetch_inbox_emails.side_effect = Exception("API Error")
             
             # Execute the task - it should not raise an exception
-            process_gmail_inbox(inbox_rule_setup.account_id)
+            process_inbox(inbox_rule_setup.account_id)
             
             # Verify no emails were processed
             processed_email_count = ProcessedEmail.query.filter_by(
                 account_id=inbox_rule_setup.account_id
             ).count()
             
-            assert processed_email_count == 0 
\ No newline at end of file
+            assert processed_email_count == 0 
+
+
+def test_process_gmail_inbox_query_budget(app, inbox_rule_setup, mock_google_client, max_queries):
+    """Test that a scan of already processed emails does not issue a query per email"""
+    with app.app_context():
+        message_ids = [f'test_email_id_{idx}' for idx in range(50)]
+        mock_google_client.fetch_inbox_emails.return_value = {
+            'messages': [{'id': message_id, 'threadId': 'thread_1'} for message_id in message_ids]
+        }
+        db.session.add_all([
+            ProcessedEmail(email_id=message_id, account_id=inbox_rule_setup.account_id)
+            for message_id in message_ids
+        ])
+        db.session.commit()
+
+        # inbox account, rules with their destination, one dedupe query per rule,
+        # and the ledger: its run and row created, then finished
+        with max_queries(7):
+            process_inbox(inbox_rule_setup.account_id)
+
+        mock_google_client.fetch_one_email.assert_not_called()
@@ -0,0 +1,120 @@
+"""
+Integration tests for the partial responses GoogleClient asks Gmail for.
+"""
+import pytest
+
+from bills_collector.integrations import GoogleClient
+from bills_collector.integrations.google_client import GMAIL_MESSAGE_FIELDS, GMAIL_UNMASKED_MESSAGE_FIELDS
+from bills_collector.integrations.mime_parts import walk_message_parts
+from tests.loadtest.fake_google import (
+    FakeGoogle, Mailbox, access_token, apply_fields, message_id, parse_fields, sender
+)
+from tests.loadtest.harness import fake_google_config
+
+
+@pytest.fixture
+def fake_gmail(app):
+    with FakeGoogle(Mailbox(accounts=1, messages=3)) as fake:
+        app.config.update(fake_google_config(fake))
+        yield fake
+
+
+@pytest.fixture
+def gmail_client(fake_gmail):
+    client = GoogleClient(token={
+        'access_token': access_token(0),
+        'refresh_token': 'lt-refresh-0',
+        'token_type': 'Bearer',
+        'expires_at': 4102444800,
+    })
+    yield client
+    client.close()
+
+
+def test_list_selects_ids_only(gmail_client):
+    """
+    GIVEN a Gmail inbox with matching messages
+    WHEN GoogleClient lists them
+    THEN only the message ids come back
+    """
+    emails = gmail_client.fetch_inbox_emails(from_address=sender(0), subject_text='Statement')
+
+    assert emails['messages'][0] == {'id': message_id(0, 0), 'threadId': message_id(0, 0)}
+    assert gmail_client.bytes_received['messages.list'] > 0
+
+
+def test_metadata_pass_skips_the_part_tree(gmail_client):
+    """
+    GIVEN a message with many headers and an HTML body
+    WHEN GoogleClient fetches its metadata
+    THEN only the date, MIME type and the headers it needs are returned
+    """
+    metadata = gmail_client.fetch_email_metadata(message_id(0, 0))
+
+    assert metadata['payload']['mimeType'] == 'multipart/mixed'
+    assert 'internalDate' in metadata
+    assert 'parts' not in metadata['payload']
+    assert {header['name'] for header in metadata['payload']['headers']} == {'Content-Type', 'From', 'Subject'}
+
+
+def test_full_fetch_keeps_the_part_tree_not_headers(gmail_client):
+    """
+    GIVEN a message with nested bodies and a PDF attachment
+    WHEN GoogleClient fetches it in full
+    THEN the nested part tree and attachment id are returned without headers
+    """
+    email = gmail_client.fetch_one_email(message_id(0, 0))
+
+    alternative, pdf = email['payload']['parts']
+    assert [part['mimeType'] for part in alternative['parts']] == ['text/plain', 'text/html']
+    assert 'data' in alternative['parts'][0]['body']
+    assert pdf['body']['attachmentId'] == f'att-{message_id(0, 0)}'
+    assert 'headers' not in email['payload']
+    assert 'headers' not in pdf
+
+
+def test_parts_below_the_mask_are_fetched_unmasked(gmail_client, monkeypatch):
+    """
+    GIVEN a statement forwarded as message/rfc822, nested deeper than the fields mask reaches
+    WHEN GoogleClient fetches it in full
+    THEN it sees the cut-off subtree and fetches the message again unmasked, PDF included
+    """
+    def container(mime_type, *parts):
+        return {'partId': '', 'mimeType': mime_type, 'filename': '', 'body': {'size': 0}, 'parts': list(parts)}
+
+    pdf = {'partId': '0.0.0.0', 'mimeType': 'application/pdf', 'filename': 'statement.pdf',
+           'body': {'attachmentId': 'att-deep', 'size': 1024}}
+    email = {'id': 'deep', 'threadId': 'deep', 'internalDate': '0', 'payload': container(
+        'multipart/mixed', container('multipart/mixed', container(
+            'message/rfc822', container('multipart/mixed', pdf))))}
+    masks = []
+
+    def gmail_get(call, url, params):
+        masks.append(params['fields'])
+        return apply_fields(email, parse_fields(params['fields']))
+
+    monkeypatch.setattr(gmail_client, '_GoogleClient__gmail_get', gmail_get)
+
+    fetched = gmail_client.fetch_one_email('deep')
+
+    assert masks == [GMAIL_MESSAGE_FIELDS, GMAIL_UNMASKED_MESSAGE_FIELDS]
+    assert [part.filename for part in walk_message_parts(fetched['payload'])] == ['statement.pdf']
+
+
+def test_masks_reduce_bytes_received(gmail_client, fake_gmail):
+    """
+    GIVEN the same message
+    WHEN it is fetched with and without the field mask
+    THEN the masked responses together are smaller than the full one
+    """
+    gmail_client.fetch_email_metadata(message_id(0, 1))
+    gmail_client.fetch_one_email(message_id(0, 1))
+
+    unmasked = gmail_client.app.get(f'{fake_gmail.url}/gmail/v1/users/me/messages/{message_id(0, 1)}')
+
+    masked = gmail_client.bytes_transferred
+    assert masked == (
+        gmail_client.bytes_received['messages.get.metadata']
+        + gmail_client.bytes_received['messages.get.full']
+    )
+    assert masked < len(unmasked.content)
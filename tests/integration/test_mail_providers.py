@@ -0,0 +1,158 @@
+"""
+Integration tests for the mail providers the inbox pipeline dispatches to.
+"""
+from collections import Counter
+from dataclasses import replace
+from datetime import date, timedelta
+
+import pytest
+
+from bills_collector.integrations import GoogleClient
+from bills_collector.mail_providers import GmailProvider, ZohoMailProvider, get_provider
+from bills_collector.models import Bill, InboxRule, LinkedAccount, ProcessedEmail
+from bills_collector.query_planner import RuleFilter, coalesced_criteria
+from bills_collector.tasks.inbox_tasks import process_inbox
+from tests.loadtest import harness
+from tests.loadtest.fake_google import FakeGoogle, Mailbox, sender
+
+
+def test_zoho_inbox_runs_through_the_pipeline(app, monkeypatch):
+    """
+    GIVEN a Zoho Mail inbox with more statements than fit in one search page
+    WHEN the pipeline runs over it
+    THEN every statement is found page by page, downloaded from Zoho and extracted
+    """
+    monkeypatch.setattr(ZohoMailProvider, 'capabilities',
+                        replace(ZohoMailProvider.capabilities, page_size=2))
+
+    report = harness.run(app, Mailbox(accounts=1, messages=5, pdf_pages=1, account_type='zoho'))
+
+    assert report.emails_processed == 5
+    assert report.bills_extracted == 5
+    assert report.requests['zoho.messages.search'] == 3
+    assert report.requests['zoho.folders'] == 1
+    assert report.requests['zoho.attachmentinfo'] == 5
+    assert report.requests['zoho.attachments.get'] == 5
+    assert 'messages.list' not in report.requests
+
+
+def test_gmail_listing_follows_page_tokens(app, monkeypatch):
+    """
+    GIVEN a Gmail inbox with more statements than fit in one listing page
+    WHEN the pipeline runs over it
+    THEN it follows nextPageToken until every statement is processed
+    """
+    monkeypatch.setattr(GmailProvider, 'capabilities',
+                        replace(GmailProvider.capabilities, page_size=2))
+
+    report = harness.run(app, Mailbox(accounts=1, messages=5, pdf_pages=1))
+
+    assert report.emails_processed == 5
+    assert report.requests['messages.list'] == 3
+
+
+def test_downloads_run_at_the_provider_concurrency(app, monkeypatch):
+    """
+    GIVEN a slow Gmail and a provider allowing three requests at once
+    WHEN the pipeline runs over an inbox
+    THEN downloads overlap, but never beyond that, plus the task's own calls
+    """
+    monkeypatch.setattr(GmailProvider, 'capabilities',
+                        replace(GmailProvider.capabilities, max_concurrency=3))
+
+    report = harness.run(app, Mailbox(accounts=1, messages=12, pdf_pages=1), latency_ms=30)
+
+    assert report.emails_processed == 12
+    assert 1 < report.peak_in_flight <= 4
+
+
+def test_unknown_account_types_have_no_provider(app):
+    """
+    GIVEN a linked account that is not an inbox
+    WHEN its provider is looked up
+    THEN a ValueError says so
+    """
+    with pytest.raises(ValueError, match='google_drive'):
+        get_provider(LinkedAccount(account_type='google_drive'))
+
+
+def test_zoho_listing_over_a_date_range_resumes_from_its_cursor(app):
+    """
+    GIVEN a Zoho Mail inbox whose statements all arrived today
+    WHEN it is listed over today, then over the days before
+    THEN today's listing pages by cursor and resumes from one, the earlier one is empty
+    """
+    mailbox = Mailbox(accounts=1, messages=5, pdf_pages=1, account_type='zoho')
+    harness.seed_accounts(mailbox)
+    account = LinkedAccount.query.filter_by(account_type='zoho').first()
+    rule = InboxRule.query.filter_by(account_id=account.id).first()
+    today = date.today()
+
+    with FakeGoogle(mailbox) as fake:
+        app.config.update(harness.fake_google_config(fake))
+        provider = get_provider(account)
+
+        pages = list(provider.stream_pages(rule, since=today, until=today, page_size=2))
+        resumed = list(provider.stream_pages(rule, since=today, until=today, cursor='3', page_size=2))
+        earlier = list(provider.stream_pages(rule, since=today - timedelta(days=7),
+                                             until=today - timedelta(days=1), page_size=2))
+        provider.close()
+
+    assert [len(page.messages) for page in pages] == [2, 2, 1]
+    assert [page.next_cursor for page in pages] == ['3', '5', None]
+    assert [len(page.messages) for page in resumed] == [2, 1]
+    assert all(not page.messages for page in earlier)
+
+
+@pytest.mark.parametrize('rules_per_search', [4, 2])
+def test_gmail_rules_share_searches_and_route_locally(app, monkeypatch, tmp_path, rules_per_search):
+    """
+    GIVEN a Gmail inbox with four billers, each with a rule filing into its own folder
+    WHEN the pipeline runs with room for this many rules per search
+    THEN the rules are OR'd into that few searches, and every statement reaches its rule's folder
+    """
+    mailbox = Mailbox(accounts=1, messages=12, pdf_pages=1, billers=4)
+    harness.seed_accounts(mailbox)
+    account = LinkedAccount.query.filter_by(account_type='gmail').first()
+    filters = [RuleFilter(None, biller, sender(0, biller), 'Statement') for biller in range(4)]
+    max_length = len(GoogleClient.inbox_query(coalesced_criteria(filters[-rules_per_search:])))
+    app.config.update(GMAIL_QUERY_MAX_LENGTH=max_length)
+    # the tasks write attachments under ./tmp
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'tmp').mkdir()
+
+    with FakeGoogle(mailbox) as fake:
+        app.config.update(harness.fake_google_config(fake))
+        process_inbox(account.id)
+
+    assert fake.stats.requests['messages.list'] == 4 // rules_per_search
+    assert all(len(search) <= max_length for search in fake.stats.searches)
+    assert ProcessedEmail.query.count() == 12
+    assert Counter(file['parents'][0] for file in fake.drive_files.values()) == {
+        'loadtest-folder': 3, 'loadtest-folder-1': 3, 'loadtest-folder-2': 3, 'loadtest-folder-3': 3,
+    }
+
+
+def test_unrouted_emails_are_not_fetched_again(app, monkeypatch, tmp_path):
+    """
+    GIVEN a Gmail inbox with two billers, whose listed emails match neither rule's headers
+    WHEN the pipeline runs twice
+    THEN the emails are recorded processed without a bill, and only their headers fetched, once
+    """
+    mailbox = Mailbox(accounts=1, messages=4, pdf_pages=1, billers=2)
+    harness.seed_accounts(mailbox)
+    account = LinkedAccount.query.filter_by(account_type='gmail').first()
+    monkeypatch.setattr('bills_collector.tasks.inbox_tasks.route', lambda filters, sender, subject: None)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'tmp').mkdir()
+
+    with FakeGoogle(mailbox) as fake:
+        app.config.update(harness.fake_google_config(fake))
+        process_inbox(account.id)
+        process_inbox(account.id)
+
+    assert ProcessedEmail.query.count() == 4
+    assert Bill.query.count() == 0
+    assert fake.stats.requests['messages.list'] == 2
+    assert fake.stats.requests['messages.get.metadata'] == 4
+    assert 'messages.get' not in fake.stats.requests
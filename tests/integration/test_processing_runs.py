@@ -0,0 +1,105 @@
+"""
+Integration tests for the processing run ledger the inbox tasks keep.
+"""
+import pytest
+
+from bills_collector.drive_index import UploadResult
+from bills_collector.extensions import db
+from bills_collector.models import LinkedAccount, ProcessingRun, ProcessingRunAccount
+from bills_collector.processing_runs import RunProgress
+from bills_collector.tasks.inbox_tasks import process_inbox
+from tests.loadtest import harness
+from tests.loadtest.fake_google import FakeGoogle, Mailbox
+
+
+def test_runs_record_each_inbox_counters(app, tmp_path):
+    """
+    GIVEN two Gmail inboxes of three statements each
+    WHEN the scan runs twice
+    THEN each run completes with a row per inbox, counting the statements, then the duplicates
+    """
+    mailbox = Mailbox(accounts=2, messages=6, pdf_pages=1)
+    harness.seed_accounts(mailbox)
+    (tmp_path / 'tmp').mkdir()
+
+    with FakeGoogle(mailbox) as fake:
+        harness.run_eager(app, fake, tmp_path)
+        harness.run_eager(app, fake, tmp_path)
+
+    first, second = ProcessingRun.query.order_by(ProcessingRun.started_at).all()
+    assert (first.status, first.accounts_total) == ('completed', 2)
+    assert (second.status, second.accounts_total) == ('completed', 2)
+    assert first.finished_at <= second.started_at
+
+    rows = ProcessingRunAccount.query.filter_by(run_id=first.id).all()
+    assert [row.status for row in rows] == ['completed', 'completed']
+    assert all(
+        (row.listed, row.duplicates, row.fetched, row.uploaded, row.extracted, row.failed)
+        == (3, 0, 3, 3, 3, 0)
+        for row in rows
+    )
+    assert all(row.queued_at <= row.started_at <= row.finished_at for row in rows)
+
+    rows = ProcessingRunAccount.query.filter_by(run_id=second.id).all()
+    assert all((row.listed, row.duplicates, row.fetched) == (3, 3, 0) for row in rows)
+
+
+def test_counters_are_written_in_batches(app, monkeypatch):
+    """
+    GIVEN an inbox of twelve statements and a flush interval longer than the scan
+    WHEN the scan runs
+    THEN its counters are written once, as it finishes, not per email
+    """
+    app.config.update(PROCESSING_RUN_FLUSH_SECONDS=3600)
+    writes = []
+    flush = RunProgress.flush
+
+    def counting_flush(progress, **values):
+        if progress.run_account_id is not None and any(progress.pending.values()):
+            writes.append(dict(progress.pending))
+        flush(progress, **values)
+
+    monkeypatch.setattr(RunProgress, 'flush', counting_flush)
+
+    report = harness.run(app, Mailbox(accounts=1, messages=12, pdf_pages=1))
+
+    assert report.emails_processed == 12
+    assert len(writes) == 1
+    assert writes[0]['listed'] == 12
+
+
+def test_inbox_without_a_provider_is_marked_failed(app):
+    """
+    GIVEN a linked account no mail provider can read
+    WHEN its inbox is processed
+    THEN the task fails and its row is marked failed with the error, not left running
+    """
+    harness.seed_accounts(Mailbox(accounts=1, messages=1))
+    drive = LinkedAccount.query.filter_by(account_type='google_drive').one()
+
+    with pytest.raises(ValueError):
+        process_inbox(drive.id)
+
+    row = ProcessingRunAccount.query.filter_by(account_id=drive.id).one()
+    assert row.status == 'failed'
+    assert 'No mail provider' in row.error
+    assert db.session.get(ProcessingRun, row.run_id).status == 'completed'
+
+
+def test_emails_failing_twice_are_counted_once(app, monkeypatch, tmp_path):
+    """
+    GIVEN an inbox of three statements and a Drive refusing every upload
+    WHEN the scan runs
+    THEN each email is counted failed once, the upload and extraction outcomes adding up to the fetched
+    """
+    mailbox = Mailbox(accounts=1, messages=3, pdf_pages=1)
+    harness.seed_accounts(mailbox)
+    (tmp_path / 'tmp').mkdir()
+    monkeypatch.setattr('bills_collector.tasks.inbox_tasks.upload_to_folder',
+                        lambda *args, **kwargs: UploadResult('create', {'error': 'storage quota exceeded'}))
+
+    with FakeGoogle(mailbox) as fake:
+        harness.run_eager(app, fake, tmp_path)
+
+    row = ProcessingRunAccount.query.one()
+    assert (row.fetched, row.uploaded, row.extracted, row.failed) == (3, 0, 0, 3)
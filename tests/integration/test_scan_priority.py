@@ -0,0 +1,41 @@
+"""
+Integration tests for the priority inbox scans are queued with.
+"""
+from datetime import datetime, timedelta
+
+from bills_collector.extensions import db
+from bills_collector.models import Bill, LinkedAccount
+from bills_collector.tasks.inbox_tasks import check_inbox, process_inbox
+from tests.loadtest import harness
+from tests.loadtest.fake_google import Mailbox
+
+
+def test_scans_of_inboxes_with_bills_near_are_queued_first(app, monkeypatch, max_queries):
+    """
+    GIVEN three inboxes: one without bills, one billed monthly with the next
+          bill weeks away, and one whose monthly bill is about to arrive
+    WHEN the periodic check queues their scans
+    THEN the one about to get a bill is queued first, at the highest priority, then the
+         one without bills at the default, all bill histories read in one query
+    """
+    harness.seed_accounts(Mailbox(accounts=3, messages=3))
+    accounts = LinkedAccount.query.filter_by(account_type='gmail').order_by(LinkedAccount.account_id).all()
+    now = datetime.now()
+    for account, last_bill_days_ago in ((accounts[1], 5), (accounts[2], 29)):
+        db.session.add_all(
+            Bill(account_id=account.id, email_id=f'{account.account_id}-{month}',
+                 bill_date=now - timedelta(days=last_bill_days_ago + 30 * month),
+                 due_date=now - timedelta(days=last_bill_days_ago + 30 * month - 20))
+            for month in range(3)
+        )
+    db.session.commit()
+
+    queued = []
+    monkeypatch.setattr(process_inbox, 'apply_async',
+                        lambda args, priority: queued.append((args[0], priority)))
+
+    # inboxes, the run's ledger, and the bill histories
+    with max_queries(5):
+        check_inbox()
+
+    assert queued == [(accounts[2].id, 0), (accounts[0].id, 5), (accounts[1].id, 9)]
@@ -0,0 +1,100 @@
+"""
+Integration tests for Sentry tracing of the inbox pipeline.
+"""
+from unittest.mock import patch
+
+import pytest
+import sentry_sdk
+from sentry_sdk.transport import Transport
+
+from bills_collector.extensions import celery
+from bills_collector.tasks.inbox_tasks import extract_bill_info
+from bills_collector.tracing import init_sentry
+from tests.loadtest import harness
+from tests.loadtest.fake_google import Mailbox
+
+
+class CapturingTransport(Transport):
+    """Keeps the transactions Sentry would have sent"""
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.transactions = []
+
+    def capture_envelope(self, envelope):
+        for item in envelope.items:
+            if item.type == 'transaction':
+                self.transactions.append(item.payload.json)
+
+
+@pytest.fixture
+def sentry_transactions(app):
+    """Trace everything, collecting transactions instead of sending them"""
+    transport = CapturingTransport()
+    sentry_sdk.init(dsn='http://public@localhost/1', traces_sample_rate=1.0, transport=transport)
+
+    yield transport.transactions
+
+    init_sentry(app)
+
+
+def test_account_run_traces_every_email(app, sentry_transactions):
+    """
+    GIVEN tracing enabled and an inbox with two statements
+    WHEN the pipeline runs over it
+    THEN the run is one transaction with a span per email and per stage
+    """
+    harness.run(app, Mailbox(accounts=1, messages=2, pdf_pages=1))
+    sentry_sdk.flush()
+
+    runs = [
+        txn for txn in sentry_transactions if txn['transaction'].endswith('process_inbox')
+    ]
+    assert len(runs) == 1
+    run = runs[0]
+    assert run['tags']['account_type'] == 'gmail'
+
+    spans = run['spans']
+    emails = [span for span in spans if span['op'] == 'email.process']
+    assert len(emails) == 2
+    assert {span['data']['email.sender'] for span in emails} == {'billing@biller0.test'}
+
+    parents = {span['span_id']: span.get('parent_span_id') for span in spans}
+
+    def within(span, ancestor):
+        parent = parents.get(span['span_id'])
+        while parent is not None:
+            if parent == ancestor['span_id']:
+                return True
+            parent = parents.get(parent)
+        return False
+
+    for email in emails:
+        stages = {span['description'] for span in spans if within(span, email)}
+        assert {'fetch', 'attachment', 'decrypt', 'optimise', 'upload', 'db_write', 'llm'} <= stages
+
+    llm_spans = [span for span in spans if span['op'] == 'ai.run']
+    assert len(llm_spans) == 2
+
+
+def test_trace_crosses_delay_into_extract_bill_info(app, sentry_transactions):
+    """
+    GIVEN a traced task
+    WHEN it dispatches extract_bill_info with .delay()
+    THEN extract_bill_info runs in the same trace
+    """
+    celery.conf.task_always_eager = True
+    try:
+        with patch('bills_collector.tasks.inbox_tasks.LLMClient') as llm_client:
+            llm_client.return_value.extract_bill_info.return_value = None
+
+            with sentry_sdk.start_transaction(op='queue.task', name='parent') as parent:
+                extract_bill_info.delay('00000000-0000-0000-0000-000000000000', 'tmp/missing.pdf')
+    finally:
+        celery.conf.task_always_eager = False
+    sentry_sdk.flush()
+
+    child = next(
+        txn for txn in sentry_transactions if txn['transaction'].endswith('extract_bill_info')
+    )
+    assert child['contexts']['trace']['trace_id'] == parent.trace_id
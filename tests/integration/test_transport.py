@@ -0,0 +1,119 @@
+"""
+Integration tests for the shared outbound HTTP transport.
+"""
+import time
+
+from prometheus_client import REGISTRY
+
+from bills_collector.extensions import db
+from bills_collector.integrations import GoogleClient
+from bills_collector.models import LinkedAccount, User
+from bills_collector.transport import transport
+from tests.loadtest import harness
+from tests.loadtest.fake_google import FakeGoogle, Mailbox, access_token
+from tests.loadtest.harness import fake_google_config
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def http_counts():
+    return (
+        sample('bills_http_requests_total', host='127.0.0.1'),
+        sample('bills_http_connections_opened_total', host='127.0.0.1'),
+    )
+
+
+def token(account):
+    return {
+        'access_token': access_token(account),
+        'refresh_token': f'lt-refresh-{account}',
+        'token_type': 'Bearer',
+        'expires_at': 4102444800,
+    }
+
+
+def test_clients_share_keep_alive_connections(app):
+    """
+    GIVEN several Google clients, created and closed one after the other
+    WHEN each of them calls Gmail and Drive
+    THEN they all reuse the connections of the shared transport
+    """
+    with FakeGoogle(Mailbox(accounts=1, messages=1)) as fake:
+        app.config.update(fake_google_config(fake))
+        requests_before, opened_before = http_counts()
+
+        for _ in range(5):
+            client = GoogleClient(token=token(0))
+            client.fetch_inbox_emails(from_address='nobody@bills.test', subject_text='Statement')
+            client.get_drive_changes_token()
+            client.close()
+
+        requests_after, opened_after = http_counts()
+
+    # discovery once, it is cached, then messages.list and changes.getStartPageToken per client
+    assert requests_after - requests_before == 11
+    assert opened_after - opened_before <= 2
+
+
+def test_pipeline_reuses_connections(app):
+    """
+    GIVEN the inbox pipeline running against a fake Google
+    WHEN every email has been processed
+    THEN almost every request went over an already open connection
+    """
+    requests_before, opened_before = http_counts()
+
+    report = harness.run(app, Mailbox(accounts=2, messages=40, pdf_pages=1))
+
+    requests_after, opened_after = http_counts()
+    assert report.emails_processed == 40
+    assert requests_after - requests_before > 20
+    assert (opened_after - opened_before) / (requests_after - requests_before) < 0.1
+
+
+def test_session_applies_timeouts_and_retries(app):
+    """
+    GIVEN the configured transport
+    WHEN its plain session is used
+    THEN it carries the configured timeouts and retry policy
+    """
+    app.config.update(HTTP_CONNECT_TIMEOUT=1.5, HTTP_READ_TIMEOUT=7, HTTP_RETRIES=2)
+    transport.configure(app)
+
+    session = transport.session()
+    adapter = session.get_adapter('https://gmail.googleapis.com')
+
+    assert session.timeout == (1.5, 7)
+    assert adapter is transport.adapter
+    assert adapter.max_retries.total == 2
+    assert 503 in adapter.max_retries.status_forcelist
+
+
+def test_web_requests_give_up_on_a_slow_google(app, test_client, log_in_default_user,
+                                               default_user_payload):
+    """
+    GIVEN an account whose token needs refreshing and a Google slower than the web read timeout
+    WHEN the account is requested through the API
+    THEN the request fails fast with a 504 instead of waiting on Google
+    """
+    user = User.query.filter_by(email=default_user_payload['email']).first()
+    account = LinkedAccount(
+        user_id=user.id, account_type='gmail', account_id='slow-google',
+        access_token=access_token(0), refresh_token='lt-refresh-0',
+        token_json=dict(token(0), expires_at=int(time.time()) - 60), expires_at='2020-01-01'
+    )
+    db.session.add(account)
+    db.session.commit()
+
+    with FakeGoogle(auth_latency_ms=1000) as fake:
+        app.config.update(fake_google_config(fake), WEB_HTTP_READ_TIMEOUT=0.1, WEB_HTTP_RETRIES=1)
+        transport.configure(app, web=True)
+
+        start = time.perf_counter()
+        response = test_client.get(f'/api/linked_accounts/{account.id}')
+        elapsed = time.perf_counter() - start
+
+    assert response.status_code == 504
+    assert elapsed < 1
@@ -0,0 +1,657 @@
+"""
+Local stand-in for the Google endpoints used by GoogleClient and LLMClient.
+
+Implements just enough of OpenID discovery, the OAuth token endpoint, Gmail
+(messages.list/get, attachments.get), Drive (files.create/update/list and the
+changes feed, kept in memory) and
+Gemini (models.generateContent) to drive the real inbox tasks, with
+configurable latency, error rate and mailbox size. The same mailboxes are
+also served through Zoho Mail's accounts, folders, search and attachment
+endpoints, for ZohoClient.
+
+Every message's attachment carries its message id in the PDF /Title, so the
+server can time each email from its messages.get to its generateContent
+call without any cooperation from the code under test.
+"""
+import base64
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
+
+import pikepdf
+
+from tests.pdfs import make_statement_pdf
+
+MESSAGE_ID_PATTERN = re.compile(rb'lt\d{5}m\d{6}')
+TITLE_PLACEHOLDER = 'lt00000m000000'
+ZOHO_INBOX_FOLDER_ID = '1'
+
+# A typical transactional email: plenty of headers and an HTML body
+MESSAGE_HEADERS = [
+    {'name': 'Content-Type', 'value': 'multipart/mixed; boundary="000000000000statement"'},
+    {'name': 'Subject', 'value': 'Statement'},
+] + [
+    {'name': 'Received', 'value': f'from relay{hop}.mail.test (relay{hop}.mail.test [10.0.0.{hop}]) '
+                                  'by mx.google.com with ESMTPS id statement for <user@gmail.test>'}
+    for hop in range(8)
+] + [
+    {'name': f'X-Header-{idx}', 'value': 'x' * 64} for idx in range(10)
+]
+TEXT_BODY = b'Your statement is ready. Pay before the due date.'
+TEXT_BODY_DATA = base64.urlsafe_b64encode(TEXT_BODY).decode('ascii')
+HTML_BODY = b'<html><body>' + b'<p>Your statement is ready. Pay before the due date.</p>' * 200 + b'</body></html>'
+HTML_BODY_DATA = base64.urlsafe_b64encode(HTML_BODY).decode('ascii')
+
+
+def message_id(account, index):
+    return f'lt{account:05d}m{index:06d}'
+
+
+def sender(account, biller=0):
+    """Address of an account's ``biller``, the first one keeps the plain address"""
+    return f'billing@biller{account}.test' if biller == 0 else f'billing@biller{account}-{biller}.test'
+
+
+def parse_message_id(msg_id):
+    """``(account, index)`` of a ``message_id``"""
+    return int(msg_id[2:7]), int(msg_id[8:])
+
+
+def access_token(account):
+    return f'lt-access-{account}'
+
+
+def refresh_token(account):
+    return f'lt-refresh-{account}'
+
+
+def parse_fields(mask):
+    """Parse a partial-response mask like ``a,b(c,d)`` into a nested dict"""
+    tree, stack, name = {}, [], ''
+    for char in mask + ',':
+        if char in ',()':
+            if name.strip():
+                tree[name.strip()] = {}
+            if char == '(':
+                stack.append(tree)
+                tree = tree[name.strip()]
+            elif char == ')':
+                tree = stack.pop()
+            name = ''
+        else:
+            name += char
+    return tree
+
+
+def apply_fields(value, tree):
+    """Keep only the fields of ``value`` selected by a parsed mask"""
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [apply_fields(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: apply_fields(value[key], sub) for key, sub in tree.items() if key in value}
+    return value
+
+
+def statement_message_id(pdf_bytes):
+    """The message id in a statement's title, also once compressed in an object stream"""
+    match = MESSAGE_ID_PATTERN.search(pdf_bytes)
+    if match is None:
+        try:
+            with pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+                match = MESSAGE_ID_PATTERN.search(str(pdf.docinfo.get('/Title', '')).encode())
+        except pikepdf.PdfError:
+            return None
+    return match.group(0).decode() if match else None
+
+
+@dataclass
+class Mailbox:
+    """Shape of the fake mailboxes: ``messages`` spread over ``accounts``"""
+
+    accounts: int = 100
+    messages: int = 10_000
+    pdf_pages: int = 2
+    pdf_password: str = None
+    # send the PDF inline in body.data, as Gmail does for small attachments
+    inline_attachments: bool = False
+    # provider the harness links the mailboxes as: gmail or zoho
+    account_type: str = 'gmail'
+    # senders per account, each with a rule, taking turns at the messages
+    billers: int = 1
+    # PDF attachments of every Gmail message, each with different content
+    pdfs: int = 1
+
+    @property
+    def messages_per_account(self):
+        return max(self.messages // self.accounts, 1)
+
+
+@dataclass
+class Stats:
+    """What the server observed, shared between handler threads"""
+
+    requests: dict = field(default_factory=dict)
+    errors_injected: int = 0
+    bytes_sent: int = 0
+    started: dict = field(default_factory=dict)
+    finished: dict = field(default_factory=dict)
+    # requests sleeping on the injected latency, now and at most
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    # q of every messages.list
+    searches: list = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def latencies(self):
+        """Seconds from messages.get to generateContent, per completed email"""
+        with self.lock:
+            return [
+                self.finished[msg_id] - started
+                for msg_id, started in self.started.items()
+                if msg_id in self.finished
+            ]
+
+
+class FakeGoogle:
+    """Threaded HTTP server, use as a context manager or start()/stop()"""
+
+    def __init__(self, mailbox=None, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 host='127.0.0.1', port=0, seed=None, auth_latency_ms=0.0):
+        self.mailbox = mailbox or Mailbox()
+        self.latency_ms = latency_ms
+        # latency of discovery and the token endpoint, which the web app waits on
+        self.auth_latency_ms = auth_latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.stats = Stats()
+        self.random = random.Random(seed)
+        self.pdf_template = None
+        if not self.mailbox.pdf_password:
+            # same length ids, so substituting the title keeps the xref valid
+            self.pdf_template = make_statement_pdf(self.mailbox.pdf_pages, TITLE_PLACEHOLDER)
+
+        # Drive files by id, and the ids in the order they changed
+        self.drive_files = {}
+        self.drive_changes = []
+
+        handler = type('Handler', (FakeGoogleHandler,), {'fake': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def attachment_pdf(self, msg_id, number=0):
+        if number:
+            # a page more per attachment, so each has content of its own
+            return make_statement_pdf(self.mailbox.pdf_pages + number, msg_id, self.mailbox.pdf_password)
+        if self.pdf_template is not None:
+            return self.pdf_template.replace(TITLE_PLACEHOLDER.encode(), msg_id.encode())
+        return make_statement_pdf(self.mailbox.pdf_pages, msg_id, self.mailbox.pdf_password)
+
+    def write_drive_file(self, file_id, metadata, content=None):
+        """Create or update a Drive file, recording the change"""
+        with self.stats.lock:
+            file = self.drive_files.setdefault(file_id, {
+                'id': file_id,
+                'webViewLink': f'{self.url}/file/d/{file_id}/view',
+                'trashed': False,
+                'appProperties': {},
+            })
+            file['name'] = metadata.get('name', file.get('name', ''))
+            file['parents'] = metadata.get('parents', file.get('parents', []))
+            file['appProperties'] = dict(file['appProperties'], **metadata.get('appProperties', {}))
+            if content is not None:
+                file['md5Checksum'] = hashlib.md5(content).hexdigest()
+            self.drive_changes.append(file_id)
+            return dict(file)
+
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            seconds = self.random.gauss(self.latency_ms, self.jitter_ms) / 1000
+            with self.stats.lock:
+                self.stats.in_flight += 1
+                self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.stats.in_flight)
+            time.sleep(max(seconds, 0))
+            with self.stats.lock:
+                self.stats.in_flight -= 1
+
+    def auth_delay(self):
+        if self.auth_latency_ms:
+            time.sleep(self.auth_latency_ms / 1000)
+
+    def should_fail(self):
+        return self.error_rate and self.random.random() < self.error_rate
+
+
+class FakeGoogleHandler(BaseHTTPRequestHandler):
+    """Routes requests to the fake Google endpoints"""
+
+    fake = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):    # pylint: disable=redefined-builtin
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass    # the client timed out and hung up while we were sleeping
+
+    def send_json(self, payload, status=200):
+        fields = parse_qs(urlparse(self.path).query).get('fields')
+        if fields and status == 200:
+            payload = apply_fields(payload, parse_fields(fields[0]))
+        body = json.dumps(payload).encode('UTF-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.fake.stats.lock:
+            self.fake.stats.bytes_sent += len(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def account(self):
+        """Mailbox index from the bearer or Zoho token"""
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        token = token.removeprefix('Zoho-oauthtoken ')
+        match = re.fullmatch(r'lt-access-(\d+)', token)
+        return int(match.group(1)) if match else None
+
+    def inject_error(self, endpoint):
+        if not self.fake.should_fail():
+            return False
+        with self.fake.stats.lock:
+            self.fake.stats.errors_injected += 1
+        self.send_json({'error': {'code': 503, 'message': f'{endpoint} unavailable'}}, status=503)
+        return True
+
+    def do_GET(self):    # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+
+        if url.path == '/.well-known/openid-configuration':
+            self.fake.stats.count('discovery')
+            self.fake.auth_delay()
+            return self.send_json({
+                'issuer': self.fake.url,
+                'authorization_endpoint': f'{self.fake.url}/auth',
+                'token_endpoint': f'{self.fake.url}/token',
+                'revocation_endpoint': f'{self.fake.url}/revoke',
+                'userinfo_endpoint': f'{self.fake.url}/userinfo',
+            })
+
+        if parts[:4] == ['gmail', 'v1', 'users', 'me'] and parts[4:5] == ['messages']:
+            self.fake.delay()
+            if len(parts) == 5:
+                return self.list_messages(query)
+            if len(parts) == 6:
+                return self.get_message(parts[5], query)
+            if len(parts) == 8 and parts[6] == 'attachments':
+                return self.get_attachment(parts[5], parts[7])
+
+        if parts[:2] == ['api', 'accounts']:
+            self.fake.delay()
+            return self.zoho_get(parts[2:], query)
+
+        if url.path == '/drive/v3/files':
+            return self.list_drive_files(query)
+        if url.path == '/drive/v3/changes/startPageToken':
+            self.fake.stats.count('changes.getStartPageToken')
+            return self.send_json({'startPageToken': str(len(self.fake.drive_changes))})
+        if url.path == '/drive/v3/changes':
+            return self.list_drive_changes(query)
+
+        self.send_json({'error': {'code': 404, 'message': 'Not found'}}, status=404)
+
+    def list_messages(self, query):
+        self.fake.stats.count('messages.list')
+        if self.inject_error('messages.list'):
+            return None
+
+        account = self.account()
+        search = query.get('q', [''])[0]
+        with self.fake.stats.lock:
+            self.fake.stats.searches.append(search)
+        # a search for one rule, or for several OR'd together
+        matching = self.matching_messages(account, re.findall(r'from:([^\s()]+)', search))
+        if not matching:
+            return self.send_json({'resultSizeEstimate': 0})
+
+        max_results = int(query.get('maxResults', ['100'])[0])
+        start = int(query.get('pageToken', ['0'])[0])
+        end = min(start + max_results, len(matching))
+
+        payload = {
+            'messages': [
+                {'id': message_id(account, idx), 'threadId': message_id(account, idx)}
+                for idx in matching[start:end]
+            ],
+            'resultSizeEstimate': end - start,
+        }
+        if end < len(matching):
+            payload['nextPageToken'] = str(end)
+        return self.send_json(payload)
+
+    def matching_messages(self, account, senders):
+        """Indexes of ``account``'s messages from any of ``senders``"""
+        if account is None:
+            return []
+        billers = self.fake.mailbox.billers
+        return [
+            idx for idx in range(self.fake.mailbox.messages_per_account)
+            if sender(account, idx % billers) in senders
+        ]
+
+    def get_message(self, msg_id, query):
+        email_format = query.get('format', ['full'])[0]
+        self.fake.stats.count(f'messages.get.{email_format}')
+        with self.fake.stats.lock:
+            self.fake.stats.started.setdefault(msg_id, time.perf_counter())
+        if self.inject_error('messages.get'):
+            return None
+
+        internal_date = int(time.time() * 1000)
+        account, idx = parse_message_id(msg_id)
+        headers = [{'name': 'From', 'value': f'Biller <{sender(account, idx % self.fake.mailbox.billers)}>'}]
+        headers += MESSAGE_HEADERS
+        payload = {
+            'id': msg_id,
+            'threadId': msg_id,
+            'internalDate': str(internal_date),
+            'sizeEstimate': 2048,
+            'payload': {
+                'partId': '',
+                'mimeType': 'multipart/mixed',
+                'filename': '',
+                'headers': headers,
+                'body': {'size': 0},
+                'parts': [
+                    {
+                        'partId': '0',
+                        'mimeType': 'multipart/alternative',
+                        'filename': '',
+                        'body': {'size': 0},
+                        'parts': [
+                            {
+                                'partId': '0.0',
+                                'mimeType': 'text/plain',
+                                'filename': '',
+                                'body': {'size': len(TEXT_BODY), 'data': TEXT_BODY_DATA},
+                            },
+                            {
+                                'partId': '0.1',
+                                'mimeType': 'text/html',
+                                'filename': '',
+                                'body': {'size': len(HTML_BODY), 'data': HTML_BODY_DATA},
+                            },
+                        ],
+                    },
+                ] + [
+                    {
+                        'partId': str(number + 1),
+                        'mimeType': 'application/pdf',
+                        'filename': f'statement-{msg_id}-{number}.pdf' if number else f'statement-{msg_id}.pdf',
+                        'headers': [{'name': 'Content-Type', 'value': 'application/pdf'}],
+                        'body': self.attachment_body(msg_id, number),
+                    }
+                    for number in range(self.fake.mailbox.pdfs)
+                ],
+            },
+        }
+        if email_format == 'metadata':
+            payload['payload'].pop('parts')
+            wanted = query.get('metadataHeaders')
+            if wanted:
+                payload['payload']['headers'] = [
+                    header for header in headers if header['name'] in wanted
+                ]
+        return self.send_json(payload)
+
+    def attachment_body(self, msg_id, number=0):
+        if not self.fake.mailbox.inline_attachments:
+            return {'attachmentId': f'att-{msg_id}-{number}' if number else f'att-{msg_id}', 'size': 4096}
+        data = self.fake.attachment_pdf(msg_id, number)
+        return {'size': len(data), 'data': base64.urlsafe_b64encode(data).decode('ascii')}
+
+    def zoho_get(self, parts, query):
+        """Zoho Mail: /api/accounts[/{id}/folders | /{id}/messages/search | /{id}/folders/...]"""
+        account = self.account()
+        if not parts:
+            self.fake.stats.count('zoho.accounts')
+            return self.send_json({'status': {'code': 200}, 'data': [{'accountId': f'zoho-{account}'}]})
+
+        if parts[1:] == ['folders']:
+            self.fake.stats.count('zoho.folders')
+            return self.send_json({'status': {'code': 200}, 'data': [
+                {'folderId': ZOHO_INBOX_FOLDER_ID, 'folderName': 'Inbox', 'folderType': 'Inbox'},
+                {'folderId': '2', 'folderName': 'Sent', 'folderType': 'Sent'},
+            ]})
+
+        if parts[1:] == ['messages', 'search']:
+            return self.search_zoho_messages(account, query)
+
+        if len(parts) == 6 and parts[5] == 'attachmentinfo':
+            msg_id = parts[4]
+            self.fake.stats.count('zoho.attachmentinfo')
+            with self.fake.stats.lock:
+                self.fake.stats.started.setdefault(msg_id, time.perf_counter())
+            if self.inject_error('zoho.attachmentinfo'):
+                return None
+            return self.send_json({'status': {'code': 200}, 'data': {
+                'messageId': msg_id,
+                'attachments': [{
+                    'attachmentId': f'att-{msg_id}',
+                    'attachmentName': f'statement-{msg_id}.pdf',
+                    'attachmentSize': 4096,
+                }],
+            }})
+
+        if len(parts) == 7 and parts[5] == 'attachments':
+            self.fake.stats.count('zoho.attachments.get')
+            if self.inject_error('zoho.attachments.get'):
+                return None
+            return self.send_bytes(self.fake.attachment_pdf(parts[4]))
+
+        return self.send_json({'status': {'code': 404}, 'data': {}}, status=404)
+
+    def search_zoho_messages(self, account, query):
+        self.fake.stats.count('zoho.messages.search')
+        if self.inject_error('zoho.messages.search'):
+            return None
+
+        matching = self.matching_messages(
+            account, re.findall(r'sender:([^:]+)', query.get('searchKey', [''])[0])
+        )
+
+        # 1-based, as Zoho's
+        start = int(query.get('start', ['1'])[0]) - 1
+        end = min(start + int(query.get('limit', ['10'])[0]), len(matching))
+        now_ms = int(time.time() * 1000)
+        return self.send_json({'status': {'code': 200}, 'data': [
+            {
+                'messageId': message_id(account, idx),
+                'folderId': ZOHO_INBOX_FOLDER_ID,
+                'fromAddress': sender(account, idx % self.fake.mailbox.billers),
+                'subject': 'Statement',
+                'hasAttachment': '1',
+                # newest first, a minute apart
+                'receivedTime': str(now_ms - idx * 60_000),
+            }
+            for idx in matching[start:end]
+        ]})
+
+    def send_bytes(self, body, content_type='application/octet-stream'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.fake.stats.lock:
+            self.fake.stats.bytes_sent += len(body)
+
+    def list_drive_files(self, query):
+        self.fake.stats.count('files.list')
+        match = re.search(r"'([^']+)' in parents", query.get('q', [''])[0])
+        folder_id = match.group(1) if match else None
+        with self.fake.stats.lock:
+            files = [
+                dict(file) for file in self.fake.drive_files.values()
+                if folder_id in file['parents'] and not file['trashed']
+            ]
+        return self.send_json({'files': files})
+
+    def list_drive_changes(self, query):
+        self.fake.stats.count('changes.list')
+        start = int(query.get('pageToken', ['0'])[0])
+        with self.fake.stats.lock:
+            changed = self.fake.drive_changes[start:]
+            changes = [
+                {'fileId': file_id, 'removed': False, 'file': dict(self.fake.drive_files[file_id])}
+                for file_id in changed
+            ]
+            token = str(len(self.fake.drive_changes))
+        return self.send_json({'changes': changes, 'newStartPageToken': token})
+
+    def read_upload(self, body):
+        """Metadata and content of a Drive multipart upload, or of a metadata-only request"""
+        content_type = self.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/'):
+            return json.loads(body or b'{}'), None
+
+        message = BytesParser().parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode('UTF-8') + body
+        )
+        metadata, media = message.get_payload()
+        return json.loads(metadata.get_payload(decode=True)), media.get_payload(decode=True)
+
+    def do_PATCH(self):    # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        body = self.read_body()
+        parts = url.path.strip('/').split('/')
+
+        # metadata-only updates go to /drive/v3, those with content to /upload/drive/v3
+        if url.path.startswith(('/drive/v3/files/', '/upload/drive/v3/files/')):
+            self.fake.delay()
+            self.fake.stats.count('files.update')
+            if self.inject_error('files.update'):
+                return None
+            if parts[-1] not in self.fake.drive_files:
+                return self.send_json({'error': {'code': 404, 'message': 'File not found'}}, status=404)
+            metadata, content = self.read_upload(body)
+            return self.send_json(self.fake.write_drive_file(parts[-1], metadata, content))
+
+        self.send_json({'error': {'code': 404, 'message': 'Not found'}}, status=404)
+
+    def get_attachment(self, msg_id, attachment_id):
+        self.fake.stats.count('attachments.get')
+        if self.inject_error('attachments.get'):
+            return None
+
+        number = int(attachment_id.removeprefix(f'att-{msg_id}').lstrip('-') or 0)
+        data = self.fake.attachment_pdf(msg_id, number)
+        return self.send_json({
+            'size': len(data),
+            'data': base64.urlsafe_b64encode(data).decode('ascii'),
+        })
+
+    def do_POST(self):    # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        body = self.read_body()
+
+        if url.path == '/token':
+            self.fake.stats.count('token')
+            self.fake.auth_delay()
+            form = parse_qs(body.decode('UTF-8'))
+            token = form.get('refresh_token', [''])[0]
+            account = token.removeprefix('lt-refresh-')
+            return self.send_json({
+                'access_token': access_token(account),
+                'refresh_token': token,
+                'token_type': 'Bearer',
+                'expires_in': 3600,
+            })
+
+        if url.path == '/upload/drive/v3/files':
+            self.fake.delay()
+            self.fake.stats.count('files.create')
+            if self.inject_error('files.create'):
+                return None
+            metadata, content = self.read_upload(body)
+            return self.send_json(self.fake.write_drive_file(uuid4().hex, metadata, content))
+
+        if url.path.endswith(':generateContent'):
+            self.fake.delay()
+            self.fake.stats.count('generateContent')
+            if self.inject_error('generateContent'):
+                return None
+            return self.generate_content(body)
+
+        self.send_json({'error': {'code': 404, 'message': 'Not found'}}, status=404)
+
+    def generate_content(self, body):
+        request = json.loads(body)
+        msg_id = None
+        for content in request.get('contents', []):
+            for part in content.get('parts', []):
+                inline = part.get('inlineData') or part.get('inline_data')
+                if inline:
+                    data = inline['data'].replace('-', '+').replace('_', '/')
+                    msg_id = statement_message_id(base64.b64decode(data))
+
+        if msg_id is not None:
+            with self.fake.stats.lock:
+                self.fake.stats.finished[msg_id] = time.perf_counter()
+
+        extracted = {
+            'invoice_number': msg_id or 'unknown',
+            'total_due_amount': 1234.5,
+            'due_date': time.strftime('%Y-%m-%d', time.gmtime(time.time() + 20 * 86400)),
+            'invoice_date': time.strftime('%Y-%m-%d', time.gmtime()),
+        }
+        return self.send_json({
+            'candidates': [{
+                'content': {'role': 'model', 'parts': [{'text': json.dumps(extracted)}]},
+                'finishReason': 'STOP',
+            }],
+            'modelVersion': 'gemini-2.5-flash',
+        })
@@ -0,0 +1,316 @@
+"""
+End-to-end load test of check_inbox -> process_inbox -> extract_bill_info.
+
+Runs the real Celery tasks against the FakeGoogle server and reports
+emails/sec, p50/p99 per-email latency and peak worker RSS. The mailboxes are
+linked as Gmail accounts, or with --provider zoho as Zoho Mail accounts.
+
+    python -m tests.loadtest.harness --accounts 100 --messages 10000 \\
+        --latency-ms 40 --jitter-ms 10 --error-rate 0.01
+
+By default the tasks run eagerly in this process. With --workers N a real
+``celery worker`` with N prefork processes is started against
+CELERY_BROKER_URL (valkey) instead.
+
+The harness creates and finally drops every table in the target database
+(TEST_DATABASE_URL or --database-url); never point it at real data.
+"""
+import argparse
+from dataclasses import asdict, dataclass
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from tests.loadtest.fake_google import FakeGoogle, Mailbox, access_token, refresh_token, sender
+
+PASSWORD = 'loadtest'
+
+
+@dataclass
+class Report:
+    accounts: int
+    emails_expected: int
+    emails_processed: int
+    bills_extracted: int
+    errors_injected: int
+    elapsed_seconds: float
+    emails_per_second: float
+    latency_p50_ms: float
+    latency_p99_ms: float
+    peak_worker_rss_mb: float
+    bytes_sent: int
+    # most requests the fake served at once, only counted with latency
+    peak_in_flight: int
+    requests: dict
+
+    def __str__(self):
+        return '\n'.join([
+            f'accounts            {self.accounts}',
+            f'emails processed    {self.emails_processed}/{self.emails_expected}',
+            f'bills extracted     {self.bills_extracted}',
+            f'errors injected     {self.errors_injected}',
+            f'elapsed             {self.elapsed_seconds:.2f} s',
+            f'throughput          {self.emails_per_second:.1f} emails/s',
+            f'latency p50         {self.latency_p50_ms:.1f} ms',
+            f'latency p99         {self.latency_p99_ms:.1f} ms',
+            f'peak worker RSS     {self.peak_worker_rss_mb:.1f} MB',
+            f'bytes sent          {self.bytes_sent} ({self.bytes_sent / max(self.emails_processed, 1):.0f}/email)',
+            f'peak in flight      {self.peak_in_flight}',
+            f'requests            {json.dumps(self.requests, sort_keys=True)}',
+        ])
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+def fake_google_config(fake):
+    """App config pointing every Google integration at ``fake``"""
+    return {
+        'GOOGLE_DISCOVERY_URL': f'{fake.url}/.well-known/openid-configuration',
+        'GMAIL_API_URL': fake.url,
+        'DRIVE_API_URL': fake.url,
+        'GEMINI_BASE_URL': fake.url,
+        'GEMINI_API_KEY': 'loadtest',
+        'GOOGLE_CLIENT_ID': 'loadtest',
+        'GOOGLE_CLIENT_SECRET': 'loadtest',
+        'ZOHO_MAIL_API_URL': fake.url,
+        'ZOHO_ACCESS_TOKEN_URL': f'{fake.url}/token',
+        'ZOHO_CLIENT_ID': 'loadtest',
+        'ZOHO_CLIENT_SECRET': 'loadtest',
+    }
+
+
+def seed_accounts(mailbox):
+    """One user, one Drive account and a mail account with a rule per biller per mailbox"""
+    # pylint: disable=import-outside-toplevel
+    from bills_collector.extensions import bcrypt, db
+    from bills_collector.models import InboxRule, LinkedAccount, User
+
+    user = User.query.filter_by(email='loadtest@bills.test').first()
+    if user is None:
+        user = User(name='Load Test', email='loadtest@bills.test',
+                    password=bcrypt.generate_password_hash(PASSWORD))
+        db.session.add(user)
+        db.session.flush()
+
+    expires_at = int(time.time()) + 86400
+
+    def token(account):
+        return {
+            'access_token': access_token(account),
+            'refresh_token': refresh_token(account),
+            'token_type': 'Bearer',
+            'expires_at': expires_at,
+        }
+
+    drive = LinkedAccount(
+        user_id=user.id, account_type='google_drive', account_id='loadtest-drive',
+        access_token=access_token('drive'), refresh_token=refresh_token('drive'),
+        token_json=token('drive'), expires_at='2099-01-01'
+    )
+    db.session.add(drive)
+    db.session.flush()
+
+    for account in range(mailbox.accounts):
+        inbox = LinkedAccount(
+            user_id=user.id, account_type=mailbox.account_type, account_id=f'loadtest-{account}',
+            access_token=access_token(account), refresh_token=refresh_token(account),
+            token_json=token(account), expires_at='2099-01-01'
+        )
+        db.session.add(inbox)
+        db.session.flush()
+        for biller in range(mailbox.billers):
+            # every biller files into a folder of its own, the first into loadtest-folder
+            db.session.add(InboxRule(
+                user_id=user.id, account_id=inbox.id,
+                name=f'Biller {account}' + (f'-{biller}' if biller else ''),
+                email_from=sender(account, biller), email_subject='Statement',
+                attachment_password=mailbox.pdf_password or '',
+                destination_folder_id='loadtest-folder' + (f'-{biller}' if biller else ''),
+                destination_folder_name='Bills',
+                destination_account_id=drive.id
+            ))
+
+    db.session.commit()
+
+
+def count_results():
+    # pylint: disable=import-outside-toplevel
+    from bills_collector.extensions import db
+    from bills_collector.models import Bill, ProcessedEmail
+
+    db.session.expire_all()
+    processed = ProcessedEmail.query.count()
+    extracted = Bill.query.filter(Bill.amount > 0).count()
+    db.session.rollback()
+    return processed, extracted
+
+
+def run_eager(app, fake, workdir):
+    """Run check_inbox and everything it dispatches inline in this process"""
+    # pylint: disable=import-outside-toplevel
+    from bills_collector.extensions import celery
+    from bills_collector.tasks.inbox_tasks import check_inbox
+
+    app.config.update(fake_google_config(fake))
+    eager = celery.conf.task_always_eager, celery.conf.task_eager_propagates
+    celery.conf.task_always_eager, celery.conf.task_eager_propagates = True, False
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        start = time.perf_counter()
+        with app.app_context():
+            check_inbox()
+        elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        celery.conf.task_always_eager, celery.conf.task_eager_propagates = eager
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, peak_rss_kb
+
+
+def run_workers(app, fake, workdir, workers, expected, idle_timeout):
+    """Start a real prefork worker and wait until it stops making progress"""
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])),
+        DATABASE_URL=app.config['SQLALCHEMY_DATABASE_URI'],
+        CONFIG_TYPE='bills_collector.config.ProductionConfig',
+        **fake_google_config(fake),
+    )
+    # the worker kicks off check_inbox itself once it is ready
+    worker = subprocess.Popen(
+        [sys.executable, '-m', 'celery', '-A', 'bills_collector.worker.celery', 'worker',
+         '--pool', 'prefork', '--concurrency', str(workers), '--loglevel', 'warning'],
+        env=env,
+        cwd=workdir,
+    )
+
+    start = time.perf_counter()
+    last_progress, last_count = start, -1
+    try:
+        with app.app_context():
+            while True:
+                processed, _ = count_results()
+                now = time.perf_counter()
+                if processed != last_count:
+                    last_progress, last_count = now, processed
+                if processed >= expected or now - last_progress > idle_timeout:
+                    break
+                time.sleep(0.5)
+        elapsed = last_progress - start
+    finally:
+        worker.terminate()
+        worker.wait()
+
+    # ru_maxrss of children is the largest RSS among all reaped descendants
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return elapsed, peak_rss_kb
+
+
+def run(app, mailbox, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, workers=0,
+        idle_timeout=30.0, seed=None):
+    """Seed ``app``'s database, run the pipeline against a fake Google, report"""
+    # pylint: disable=import-outside-toplevel
+    from bills_collector.extensions import db
+
+    with app.app_context():
+        seed_accounts(mailbox)
+
+    expected = mailbox.accounts * mailbox.messages_per_account
+
+    # the tasks write attachments under ./tmp, keep them out of the checkout
+    with tempfile.TemporaryDirectory() as workdir, \
+            FakeGoogle(mailbox, latency_ms=latency_ms, jitter_ms=jitter_ms,
+                       error_rate=error_rate, seed=seed) as fake:
+        os.makedirs(os.path.join(workdir, 'tmp'))
+        if workers:
+            elapsed, peak_rss_kb = run_workers(app, fake, workdir, workers, expected, idle_timeout)
+        else:
+            elapsed, peak_rss_kb = run_eager(app, fake, workdir)
+
+    with app.app_context():
+        processed, extracted = count_results()
+        db.session.remove()
+
+    latencies = sorted(fake.stats.latencies())
+    return Report(
+        accounts=mailbox.accounts,
+        emails_expected=expected,
+        emails_processed=processed,
+        bills_extracted=extracted,
+        errors_injected=fake.stats.errors_injected,
+        elapsed_seconds=elapsed,
+        emails_per_second=processed / elapsed if elapsed else 0.0,
+        latency_p50_ms=percentile(latencies, 50) * 1000,
+        latency_p99_ms=percentile(latencies, 99) * 1000,
+        peak_worker_rss_mb=peak_rss_kb / 1024,
+        bytes_sent=fake.stats.bytes_sent,
+        peak_in_flight=fake.stats.peak_in_flight,
+        requests=dict(fake.stats.requests),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', 1)[0])
+    parser.add_argument('--accounts', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=10_000, help='total across all accounts')
+    parser.add_argument('--pdf-pages', type=int, default=2)
+    parser.add_argument('--encrypted', action='store_true', help='password protect the PDFs')
+    parser.add_argument('--provider', choices=('gmail', 'zoho'), default='gmail')
+    parser.add_argument('--billers', type=int, default=1, help='senders, each with a rule, per account')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=0, help='prefork worker processes, 0 runs eagerly')
+    parser.add_argument('--idle-timeout', type=float, default=30.0)
+    parser.add_argument('--database-url', help='defaults to TEST_DATABASE_URL')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    os.environ['CONFIG_TYPE'] = 'bills_collector.config.TestingConfig'
+    if args.database_url:
+        os.environ['TEST_DATABASE_URL'] = args.database_url
+
+    # pylint: disable=import-outside-toplevel
+    from bills_collector.app import create_app
+    from bills_collector.extensions import db
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    mailbox = Mailbox(
+        accounts=args.accounts, messages=args.messages, pdf_pages=args.pdf_pages,
+        pdf_password=PASSWORD if args.encrypted else None, account_type=args.provider,
+        billers=args.billers
+    )
+    try:
+        report = run(
+            app, mailbox, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate, workers=args.workers,
+            idle_timeout=args.idle_timeout, seed=args.seed
+        )
+    finally:
+        with app.app_context():
+            db.drop_all()
+
+    print(json.dumps(asdict(report), indent=2) if args.json else report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+from bills_collector.models import Bill, ProcessedEmail
+from tests.loadtest.fake_google import Mailbox
+from tests.loadtest import harness
+
+
+def test_harness_processes_every_email(app):
+    """
+    GIVEN two fake mailboxes with three statements each
+    WHEN the load test harness runs the inbox pipeline eagerly
+    THEN every email is processed, extracted and timed end to end
+    """
+    report = harness.run(app, Mailbox(accounts=2, messages=6, pdf_pages=1))
+
+    assert report.emails_expected == 6
+    assert report.emails_processed == 6
+    assert report.bills_extracted == 6
+    assert report.requests['messages.list'] == 2
+    assert report.requests['generateContent'] == 6
+    assert report.latency_p99_ms >= report.latency_p50_ms > 0
+
+    assert ProcessedEmail.query.count() == 6
+    assert {bill.amount for bill in Bill.query.all()} == {1234.5}
+
+
+def test_harness_decrypts_protected_statements(app):
+    """
+    GIVEN a fake mailbox whose statements are password protected
+    WHEN the load test harness runs the inbox pipeline eagerly
+    THEN the rule's password unlocks every statement
+    """
+    mailbox = Mailbox(accounts=1, messages=2, pdf_pages=1, pdf_password=harness.PASSWORD)
+
+    report = harness.run(app, mailbox)
+
+    assert report.bills_extracted == 2
+
+
+def test_harness_uses_inline_attachments(app):
+    """
+    GIVEN a fake mailbox that inlines its small statements
+    WHEN the load test harness runs the inbox pipeline eagerly
+    THEN the statements are processed without fetching any attachment
+    """
+    mailbox = Mailbox(accounts=1, messages=2, pdf_pages=1, inline_attachments=True)
+
+    report = harness.run(app, mailbox)
+
+    assert report.bills_extracted == 2
+    assert 'attachments.get' not in report.requests
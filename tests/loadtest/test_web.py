@@ -0,0 +1,20 @@
+import pytest
+
+from tests.loadtest import web
+
+# wall-clock bounds on a gunicorn subprocess, too noisy for every CI run
+pytestmark = pytest.mark.timing
+
+
+def test_dashboard_stays_responsive_while_google_is_slow(app):
+    """
+    GIVEN a threaded gunicorn worker with every thread but a few waiting on a slow Google
+    WHEN the dashboard is polled meanwhile
+    THEN it keeps answering quickly and the slow requests still succeed
+    """
+    report = web.run(app, slow_requests=4, google_latency_ms=1500, workers=1, threads=8)
+
+    assert report.slow_statuses == {200: 4}
+    assert report.slow_p50_ms >= 1500
+    assert report.dashboard_requests >= 4
+    assert report.dashboard_max_ms < 750
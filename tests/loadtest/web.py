@@ -0,0 +1,223 @@
+"""
+Load test of the web tier while Google is slow.
+
+Starts gunicorn with the repository's ``gunicorn.conf.py`` against the
+FakeGoogle server, whose discovery and token endpoints answer after
+--google-latency-ms. Every linked account's access token has expired, so
+each request for one waits on a token refresh. While those requests are in
+flight the dashboard (``/`` and ``/api/linked_accounts``) is polled; the report
+compares its latency with the slow requests'.
+
+    python -m tests.loadtest.web --slow-requests 8 --google-latency-ms 2000 \\
+        --workers 1 --threads 16
+
+--worker-class sync --threads 1 shows the pool running dry instead (gunicorn
+turns sync workers with more threads into gthread ones). Like the pipeline
+harness, this creates and finally drops every table in the target database.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+import json
+import os
+from pathlib import Path
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+from tests.loadtest.fake_google import FakeGoogle, Mailbox
+from tests.loadtest.harness import PASSWORD, fake_google_config, percentile, seed_accounts
+
+GUNICORN_CONF = Path(__file__).resolve().parents[2] / 'gunicorn.conf.py'
+DASHBOARD_PATHS = ('/', '/api/linked_accounts')
+
+
+@dataclass
+class WebReport:
+    worker_class: str
+    workers: int
+    threads: int
+    google_latency_ms: float
+    slow_requests: int
+    # HTTP status of every slow request, by status
+    slow_statuses: dict
+    slow_p50_ms: float
+    slow_max_ms: float
+    dashboard_requests: int
+    dashboard_p50_ms: float
+    dashboard_max_ms: float
+
+    def __str__(self):
+        return '\n'.join([
+            f'gunicorn            {self.workers} {self.worker_class} worker(s), {self.threads} thread(s)',
+            f'google latency      {self.google_latency_ms:.0f} ms',
+            f'slow requests       {self.slow_requests} {self.slow_statuses}',
+            f'slow p50 / max      {self.slow_p50_ms:.1f} / {self.slow_max_ms:.1f} ms',
+            f'dashboard requests  {self.dashboard_requests}',
+            f'dashboard p50 / max {self.dashboard_p50_ms:.1f} / {self.dashboard_max_ms:.1f} ms',
+        ])
+
+
+def expire_tokens():
+    """Make every linked account's next request refresh its access token"""
+    # pylint: disable=import-outside-toplevel
+    from bills_collector.extensions import db
+    from bills_collector.models import LinkedAccount
+
+    accounts = LinkedAccount.query.filter(LinkedAccount.account_type != 'google_drive').all()
+    for account in accounts:
+        account.token_json = dict(account.token_json, expires_at=int(time.time()) - 60)
+    db.session.commit()
+    return [str(account.id) for account in accounts]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(app, fake, port, worker_class, workers, threads, read_timeout):
+    """Serve ``create_app()`` on ``port`` and wait until it answers"""
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])),
+        CONFIG_TYPE='bills_collector.config.TestingConfig',
+        TEST_DATABASE_URL=app.config['SQLALCHEMY_DATABASE_URI'],
+        SECRET_KEY=app.config['SECRET_KEY'] or 'loadtest',
+        GUNICORN_WORKER_CLASS=worker_class,
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(threads),
+        WEB_HTTP_READ_TIMEOUT=str(read_timeout),
+        **fake_google_config(fake),
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', str(GUNICORN_CONF), '-b', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'bills_collector.app:create_app()'],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/login', timeout=5)
+            return server
+        except requests.RequestException:
+            if server.poll() is not None:
+                raise RuntimeError('gunicorn exited before serving') from None
+            time.sleep(0.2)
+    server.terminate()
+    server.wait()
+    raise RuntimeError('gunicorn did not start')
+
+
+def timed_get(url, cookies):
+    start = time.perf_counter()
+    resp = requests.get(url, cookies=cookies, timeout=120)
+    return resp.status_code, time.perf_counter() - start
+
+
+def run(app, slow_requests=8, google_latency_ms=2000.0, worker_class='gthread', workers=1,
+        threads=16, read_timeout=10.0):
+    """Poll the dashboard of a gunicorn served app while requests wait on a slow Google"""
+    with app.app_context():
+        seed_accounts(Mailbox(accounts=slow_requests))
+        account_ids = expire_tokens()
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    with FakeGoogle(auth_latency_ms=google_latency_ms) as fake:
+        server = start_gunicorn(app, fake, port, worker_class, workers, threads, read_timeout)
+        try:
+            session = requests.Session()
+            session.post(f'{base_url}/login', timeout=30,
+                         data={'email': 'loadtest@bills.test', 'password': PASSWORD})
+            cookies = session.cookies.get_dict()
+            for path in DASHBOARD_PATHS:
+                session.get(f'{base_url}{path}', timeout=30)    # warm up templates and caches
+
+            with ThreadPoolExecutor(max_workers=slow_requests) as executor:
+                slow = [
+                    executor.submit(timed_get, f'{base_url}/api/linked_accounts/{account_id}', cookies)
+                    for account_id in account_ids
+                ]
+                # let the slow requests reach Google before polling
+                time.sleep(min(google_latency_ms / 4000, 0.5))
+
+                dashboard = []
+                while not all(future.done() for future in slow):
+                    for path in DASHBOARD_PATHS:
+                        status, elapsed = timed_get(f'{base_url}{path}', cookies)
+                        assert status == 200, f'{path} answered {status}'
+                        dashboard.append(elapsed)
+                    time.sleep(0.05)
+                slow = [future.result() for future in slow]
+        finally:
+            server.terminate()
+            server.wait()
+
+    slow_timings = sorted(elapsed for _, elapsed in slow)
+    statuses = {}
+    for status, _ in slow:
+        statuses[status] = statuses.get(status, 0) + 1
+    dashboard = sorted(dashboard)
+    return WebReport(
+        worker_class=worker_class,
+        workers=workers,
+        threads=threads,
+        google_latency_ms=google_latency_ms,
+        slow_requests=slow_requests,
+        slow_statuses=statuses,
+        slow_p50_ms=statistics.median(slow_timings) * 1000,
+        slow_max_ms=slow_timings[-1] * 1000,
+        dashboard_requests=len(dashboard),
+        dashboard_p50_ms=percentile(dashboard, 50) * 1000 if dashboard else 0.0,
+        dashboard_max_ms=dashboard[-1] * 1000 if dashboard else 0.0,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n', 1)[0])
+    parser.add_argument('--slow-requests', type=int, default=8)
+    parser.add_argument('--google-latency-ms', type=float, default=2000.0)
+    parser.add_argument('--worker-class', default='gthread')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--read-timeout', type=float, default=10.0, help='WEB_HTTP_READ_TIMEOUT')
+    parser.add_argument('--database-url', help='defaults to TEST_DATABASE_URL')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    os.environ['CONFIG_TYPE'] = 'bills_collector.config.TestingConfig'
+    if args.database_url:
+        os.environ['TEST_DATABASE_URL'] = args.database_url
+
+    # pylint: disable=import-outside-toplevel
+    from bills_collector.app import create_app
+    from bills_collector.extensions import db
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    try:
+        report = run(
+            app, slow_requests=args.slow_requests, google_latency_ms=args.google_latency_ms,
+            worker_class=args.worker_class, workers=args.workers, threads=args.threads,
+            read_timeout=args.read_timeout
+        )
+    finally:
+        with app.app_context():
+            db.drop_all()
+
+    print(json.dumps(asdict(report), indent=2) if args.json else report)
+
+
+if __name__ == '__main__':
+    main()
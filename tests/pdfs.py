@@ -0,0 +1,44 @@
+"""
+Statement-like PDFs for the tests, benchmarks and the fake Google server.
+"""
+import io
+
+import pikepdf
+
+
+def make_statement_pdf(pages=1, title=None, password=None, unused_font=False):
+    """
+    A statement-like PDF of ``pages`` pages of 70 transaction lines, as bytes.
+
+    Streams are left uncompressed and outside object streams, like in many bank
+    statements, so the size optimisations have something to do. ``title`` sets
+    the /Title, ``password`` encrypts it and ``unused_font`` adds a font to every
+    page's resources that none of them uses.
+    """
+    pdf = pikepdf.new()
+    if title is not None:
+        pdf.docinfo['/Title'] = title
+    font = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type1, BaseFont=pikepdf.Name.Courier
+    ))
+    for page_no in range(pages):
+        pdf.add_blank_page(page_size=(612, 792))
+        lines = b''.join(
+            b'BT /F1 9 Tf 36 %d Td (Txn %06d Amount %d.00) Tj ET\n' % (760 - line * 10, line, line * 7)
+            for line in range(70)
+        )
+        page = pdf.pages[page_no]
+        page.Contents = pdf.make_stream(lines)
+        fonts = pikepdf.Dictionary(F1=font, F9=font) if unused_font else pikepdf.Dictionary(F1=font)
+        page.Resources = pikepdf.Dictionary(Font=fonts)
+
+    buffer = io.BytesIO()
+    encryption = pikepdf.Encryption(user=password, owner=password) if password else False
+    pdf.save(
+        buffer,
+        encryption=encryption,
+        compress_streams=False,
+        object_stream_mode=pikepdf.ObjectStreamMode.disable,
+    )
+    pdf.close()
+    return buffer.getvalue()
@@ -0,0 +1,97 @@
+"""
+This file (test_aggregates.py) contains the unit tests for the aggregates.py file.
+"""
+from datetime import datetime
+
+import pytest
+
+from bills_collector.aggregates import move_bill, record_bill
+from bills_collector.extensions import db
+from bills_collector.models import Bill, BillMonthlyTotal, LinkedAccount, User
+
+
+@pytest.fixture()
+def account(app, default_user_payload):
+    user = User.query.filter_by(email=default_user_payload['email']).first()
+    account = LinkedAccount(
+        user_id=user.id,
+        account_type='gmail',
+        account_id='test_gmail_id',
+        expires_at='2023-12-31 23:59:59'
+    )
+    db.session.add(account)
+    db.session.commit()
+
+    return account
+
+
+def totals(account):
+    return {
+        row.month.strftime('%Y-%m'): (row.total_amount, row.bill_count)
+        for row in BillMonthlyTotal.query.filter_by(account_id=account.id)
+    }
+
+
+def test_record_bill_accumulates(account):
+    """
+    GIVEN an account without totals
+    WHEN two bills of the same month are recorded
+    THEN check they land in one bucket with the summed amount
+    """
+    record_bill(account.id, datetime(2025, 3, 2), 100.0)
+    record_bill(account.id, datetime(2025, 3, 28), 50.5)
+    db.session.commit()
+
+    assert totals(account) == {'2025-03': (150.5, 2)}
+
+
+def test_record_bill_skips_accounts_without_a_user(app):
+    """
+    GIVEN an account that belongs to no user
+    WHEN a bill of it is recorded
+    THEN check nothing is totalled, rather than the insert failing
+    """
+    account = LinkedAccount(account_type='gmail', account_id='orphan_gmail_id',
+                            expires_at='2023-12-31 23:59:59')
+    db.session.add(account)
+    db.session.commit()
+
+    record_bill(account.id, datetime(2025, 3, 2), 100.0)
+    db.session.commit()
+
+    assert totals(account) == {}
+
+
+def test_move_bill_between_months(account):
+    """
+    GIVEN a bill recorded with a placeholder amount
+    WHEN extraction changes its amount and moves it to another month
+    THEN check the old bucket is emptied and the new one holds the amount
+    """
+    record_bill(account.id, datetime(2025, 4, 1), 0)
+    move_bill(account.id, datetime(2025, 4, 1), 0, datetime(2025, 3, 20), 75.0)
+    db.session.commit()
+
+    assert totals(account) == {'2025-04': (0, 0), '2025-03': (75.0, 1)}
+
+
+def test_rebuild_command(runner, account):
+    """
+    GIVEN bills whose totals were never recorded
+    WHEN the rebuild-bill-totals command is run
+    THEN check the totals match the bills table
+    """
+    db.session.add_all([
+        Bill(account_id=account.id, email_id='a', amount=10.0,
+             bill_date=datetime(2025, 1, 5), due_date=datetime(2025, 1, 25)),
+        Bill(account_id=account.id, email_id='b', amount=20.0,
+             bill_date=datetime(2025, 1, 9), due_date=datetime(2025, 1, 29)),
+        Bill(account_id=account.id, email_id='c', amount=5.0,
+             bill_date=datetime(2025, 2, 5), due_date=datetime(2025, 2, 25)),
+    ])
+    db.session.commit()
+
+    result = runner.invoke(args=['rebuild-bill-totals'])
+
+    assert 'Rebuilt 2 monthly total rows' in result.output
+    assert totals(account) == {'2025-01': (30.0, 2), '2025-02': (5.0, 1)}
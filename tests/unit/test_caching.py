@@ -0,0 +1,25 @@
+"""
+This file (test_caching.py) contains the unit tests for the in-process fallback of the cache extension.
+"""
+from bills_collector.extensions import FlaskCache
+
+
+def test_expired_and_orphaned_entries_are_evicted(monkeypatch):
+    """
+    GIVEN an in-process cache holding an expired entry and a user's responses
+    WHEN a set falls after the sweep interval, and the user's prefix is deleted
+    THEN check neither the expired entry nor the responses are kept around
+    """
+    clock = [1000.0]
+    monkeypatch.setattr('bills_collector.extensions.time.monotonic', lambda: clock[0])
+    cache = FlaskCache()
+    cache.set('short', 'x', timeout=1)
+    cache.set('api:user-1:0:/a', 'a')
+    cache.set('api:user-1:0:/b', 'b')
+    cache.set('api:user-2:0:/a', 'c')
+
+    clock[0] += FlaskCache.SWEEP_INTERVAL
+    cache.set('fresh', 'y')
+    cache.delete_prefix('api:user-1:')
+
+    assert sorted(cache._local) == ['api:user-2:0:/a', 'fresh']
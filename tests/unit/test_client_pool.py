@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from bills_collector.client_pool import TOKEN_EXPIRY_MARGIN, ClientPool
+
+
+class FakeClient:
+    def __init__(self, token):
+        self.token = token
+        self.token_expires_at = token.get('expires_at')
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    return ClientPool('test', FakeClient, **kwargs)
+
+
+def test_reuses_clients_and_evicts_least_recently_used():
+    """
+    GIVEN a pool of two clients
+    WHEN a third account is looked up after reusing the first
+    THEN the least recently used client is closed and dropped
+    """
+    pool = make_pool(maxsize=2)
+
+    first = pool.get('a', {})
+    second = pool.get('b', {})
+    assert pool.get('a', {}) is first
+
+    pool.get('c', {})
+
+    assert second.closed and not first.closed
+    assert len(pool) == 2
+    assert (pool.stats.hits, pool.stats.misses, pool.stats.evictions) == (1, 3, 1)
+
+
+def test_expires_by_ttl_and_token_expiry():
+    """
+    GIVEN clients past the pool's TTL or about to outlive their access token
+    WHEN they are looked up again
+    THEN they are closed and replaced by new clients
+    """
+    pool = make_pool(ttl=0)
+    stale = pool.get('a', {})
+    assert pool.get('a', {}) is not stale
+    assert stale.closed
+
+    pool = make_pool(ttl=3600)
+    expiring = pool.get('a', {'expires_at': time.time() + TOKEN_EXPIRY_MARGIN / 2})
+    fresh = pool.get('a', {'expires_at': time.time() + 3600})
+    assert fresh is not expiring and expiring.closed
+    assert pool.get('a', {}) is fresh
+
+
+def test_close_all_and_discard():
+    """
+    GIVEN a pool with clients
+    WHEN one is discarded and then the pool is shut down
+    THEN every client is closed and the pool is empty
+    """
+    pool = make_pool()
+    clients = [pool.get(key, {}) for key in 'abc']
+
+    pool.discard('a')
+    assert clients[0].closed and len(pool) == 2
+
+    pool.close_all()
+    assert all(client.closed for client in clients)
+    assert len(pool) == 0
+
+
+def test_concurrent_lookups_share_one_client():
+    """
+    GIVEN many threads asking for the same account at once
+    WHEN the pool builds the client
+    THEN they all get the pooled client and any extra one built is closed
+    """
+    pool = make_pool()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: pool.get('a', {}), range(64)))
+
+    pooled = pool.get('a', {})
+    assert all(client is pooled for client in clients)
+    assert not pooled.closed
+    assert len(pool) == 1
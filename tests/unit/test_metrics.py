@@ -0,0 +1,74 @@
+import subprocess
+import sys
+
+import pytest
+from prometheus_client import REGISTRY
+
+from bills_collector.metrics import get_registry, render_metrics, track_stage
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_track_stage_observes_latency():
+    """
+    GIVEN a pipeline stage
+    WHEN it completes inside track_stage
+    THEN its latency is observed under the account type and stage labels
+    """
+    labels = {'account_type': 'gmail', 'stage': 'decrypt'}
+    before = sample('bills_pipeline_stage_seconds_count', **labels)
+    errors_before = sample('bills_pipeline_stage_errors_total', **labels)
+
+    with track_stage('decrypt', 'gmail'):
+        pass
+
+    assert sample('bills_pipeline_stage_seconds_count', **labels) == before + 1
+    assert sample('bills_pipeline_stage_errors_total', **labels) == errors_before
+
+
+def test_track_stage_counts_errors():
+    """
+    GIVEN a pipeline stage that raises
+    WHEN it runs inside track_stage
+    THEN the error is counted, the latency observed and the exception re-raised
+    """
+    labels = {'account_type': 'zoho', 'stage': 'upload'}
+    before = sample('bills_pipeline_stage_seconds_count', **labels)
+    errors_before = sample('bills_pipeline_stage_errors_total', **labels)
+
+    with pytest.raises(RuntimeError):
+        with track_stage('upload', 'zoho'):
+            raise RuntimeError('Drive unavailable')
+
+    assert sample('bills_pipeline_stage_seconds_count', **labels) == before + 1
+    assert sample('bills_pipeline_stage_errors_total', **labels) == errors_before + 1
+
+
+def test_multiprocess_registry_aggregates_processes(tmp_path, monkeypatch):
+    """
+    GIVEN PROMETHEUS_MULTIPROC_DIR shared by several worker processes
+    WHEN each of them tracks a stage
+    THEN a scrape from another process reports their sum
+    """
+    script = (
+        "from bills_collector.metrics import track_stage\n"
+        "with track_stage('llm', 'gmail'):\n"
+        "    pass\n"
+    )
+    env = {'PROMETHEUS_MULTIPROC_DIR': str(tmp_path), 'PATH': ''}
+    for _ in range(3):
+        subprocess.run([sys.executable, '-c', script], env=env, check=True)
+
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    registry = get_registry()
+
+    assert registry is not REGISTRY
+    assert registry.get_sample_value(
+        'bills_pipeline_stage_seconds_count', {'account_type': 'gmail', 'stage': 'llm'}
+    ) == 3
+
+    body, content_type = render_metrics()
+    assert content_type.startswith('text/plain')
+    assert b'bills_pipeline_stage_seconds_bucket' in body
@@ -0,0 +1,75 @@
+from bills_collector.integrations.mime_parts import MessagePart, PartKind, walk_message_parts
+
+
+def leaf(part_id, mime_type, filename='', **body):
+    return {'partId': part_id, 'mimeType': mime_type, 'filename': filename, 'body': body}
+
+
+def test_walk_finds_nested_parts():
+    """
+    GIVEN a PDF nested in multipart/mixed -> multipart/alternative
+    WHEN the message parts are walked
+    THEN every leaf of interest is yielded, depth first
+    """
+    payload = {
+        'mimeType': 'multipart/mixed',
+        'parts': [
+            {
+                'partId': '0',
+                'mimeType': 'multipart/alternative',
+                'parts': [
+                    leaf('0.0', 'text/plain', size=5, data='aGVsbG8='),
+                    leaf('0.1', 'text/html', size=12, data='PHA-aGVsbG88L3A-'),
+                    {
+                        'partId': '0.2',
+                        'mimeType': 'multipart/mixed',
+                        'parts': [leaf('0.2.0', 'application/pdf', 'Bill.PDF', size=9000, attachmentId='att-1')],
+                    },
+                ],
+            },
+            leaf('1', 'image/png', 'logo.png', attachmentId='att-2'),
+            leaf('2', 'application/octet-stream', 'statement.pdf', size=120, data='JVBERi0='),
+        ],
+    }
+
+    parts = list(walk_message_parts(payload))
+
+    assert [(part.part_id, part.kind) for part in parts] == [
+        ('0.0', PartKind.TEXT),
+        ('0.1', PartKind.HTML),
+        ('0.2.0', PartKind.PDF),
+        ('2', PartKind.PDF),
+    ]
+    assert parts[2] == MessagePart(
+        kind=PartKind.PDF, part_id='0.2.0', mime_type='application/pdf',
+        filename='Bill.PDF', size=9000, attachment_id='att-1'
+    )
+    assert not parts[2].is_inline
+    assert parts[3].is_inline
+    assert parts[3].data == 'JVBERi0='
+
+
+def test_walk_single_part_message():
+    """
+    GIVEN a message whose payload is the PDF itself
+    WHEN the message parts are walked
+    THEN the payload is yielded
+    """
+    payload = leaf('', 'application/pdf', 'statement.pdf', size=10, attachmentId='att-1')
+
+    assert [part.kind for part in walk_message_parts(payload)] == [PartKind.PDF]
+
+
+def test_walk_is_lazy():
+    """
+    GIVEN a message with several parts
+    WHEN the first part is taken from the walk
+    THEN the remaining parts are not inspected
+    """
+    class Exploding(dict):
+        def get(self, *args):
+            raise AssertionError('inspected too early')
+
+    payload = {'parts': [leaf('0', 'text/plain', data='aGk='), Exploding()]}
+
+    assert next(walk_message_parts(payload)).kind == PartKind.TEXT
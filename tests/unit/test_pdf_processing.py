@@ -0,0 +1,131 @@
+import pikepdf
+import pytest
+
+from bills_collector.extensions import cache
+from bills_collector.models import InboxRule
+from bills_collector.pdf_processing import (
+    NoMatchingPassword,
+    PdfProcessor,
+    SaveOptions,
+    decrypt_with_candidates,
+    order_passwords,
+    password_cache_key,
+    remember_password,
+)
+from tests.pdfs import make_statement_pdf
+
+
+def test_decrypt_tries_every_candidate(tmp_path):
+    """
+    GIVEN a PDF encrypted with the second of three candidate passwords
+    WHEN it is decrypted with the candidates
+    THEN the decrypted copy is written and the index of the password is returned
+    """
+    src, dest = tmp_path / 'src.pdf', tmp_path / 'dest.pdf'
+    src.write_bytes(make_statement_pdf(password='march'))
+
+    result = decrypt_with_candidates(src, dest, ['jan', 'march', 'dec'])
+
+    assert result.password_index == 1
+    assert result.seconds >= 0
+    with pikepdf.open(dest) as pdf:
+        assert not pdf.is_encrypted
+
+    with pytest.raises(NoMatchingPassword):
+        decrypt_with_candidates(src, dest, ['jan', 'dec'])
+
+
+def test_optimised_copy(tmp_path):
+    """
+    GIVEN an encrypted statement with uncompressed streams
+    WHEN it is decrypted with and without the size optimisations
+    THEN the optimised copy is smaller, linearized and the saving is reported
+    """
+    src = tmp_path / 'src.pdf'
+    src.write_bytes(make_statement_pdf(50, password='secret', unused_font=True))
+
+    plain = decrypt_with_candidates(src, tmp_path / 'plain.pdf', ['secret'])
+    optimised = decrypt_with_candidates(
+        src, tmp_path / 'optimised.pdf', ['secret'],
+        SaveOptions(object_streams=True, recompress_streams=True,
+                    remove_unused_resources=True, linearize=True),
+    )
+
+    assert optimised.bytes_in == plain.bytes_in == src.stat().st_size
+    assert optimised.bytes_out < plain.bytes_out
+    assert optimised.bytes_saved == optimised.bytes_in - optimised.bytes_out
+    assert optimised.started_at <= optimised.opened_at <= optimised.finished_at
+    with pikepdf.open(tmp_path / 'optimised.pdf') as pdf:
+        assert pdf.is_linearized
+        assert len(pdf.pages) == 50
+        assert 'F9' not in pdf.pages[0].Resources.Font
+
+
+def test_password_that_worked_is_tried_first(app):
+    """
+    GIVEN a rule with several candidate passwords
+    WHEN one of them is remembered for the sender
+    THEN it is ordered first, for that sender only, and only its index is cached
+    """
+    rule = InboxRule(id='rule', attachment_password='jan', attachment_passwords=['march', 'jan', 'dec'])
+    assert rule.candidate_passwords == ['jan', 'march', 'dec']
+    assert order_passwords(rule.id, 'bills@bank.test', rule.candidate_passwords) == ['jan', 'march', 'dec']
+
+    remember_password(rule.id, 'Bills@Bank.test', rule.candidate_passwords, 'dec')
+
+    assert cache.get_json(password_cache_key(rule.id, 'bills@bank.test')) == 2
+    assert order_passwords(rule.id, 'bills@bank.test', rule.candidate_passwords) == ['dec', 'jan', 'march']
+    assert order_passwords(rule.id, 'other@bank.test', rule.candidate_passwords) == ['jan', 'march', 'dec']
+
+
+
+class StringStore:
+    """Stands in for the valkey client, which hands back every value as a string"""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = str(value)
+
+
+def test_remembered_password_read_back_from_a_shared_cache(app, monkeypatch):
+    """
+    GIVEN a shared cache returning strings, holding the password of one sender and junk for another
+    WHEN the passwords are ordered for both
+    THEN the remembered one comes first, and the junk is ignored rather than failing the run
+    """
+    monkeypatch.setattr(cache, 'client', StringStore())
+    passwords = ['jan', 'march', 'dec']
+
+    remember_password('rule', 'bills@bank.test', passwords, 'dec')
+    cache.set(password_cache_key('rule', 'other@bank.test'), '9f86d081884c7d65')
+
+    assert order_passwords('rule', 'bills@bank.test', passwords) == ['dec', 'jan', 'march']
+    assert order_passwords('rule', 'other@bank.test', passwords) == passwords
+
+
+@pytest.mark.parametrize('max_workers', [0, 2])
+def test_processor_inline_and_pooled(tmp_path, max_workers):
+    """
+    GIVEN a processor running inline or with a pool of processes
+    WHEN PDFs are submitted for decryption
+    THEN both resolve the futures the same way, including failures
+    """
+    processor = PdfProcessor()
+    processor.max_workers = max_workers
+    src = tmp_path / 'src.pdf'
+    src.write_bytes(make_statement_pdf(password='secret'))
+
+    try:
+        decrypted = processor.submit_decrypt(src, tmp_path / 'ok.pdf', ['nope', 'secret'])
+        failed = processor.submit_decrypt(src, tmp_path / 'ko.pdf', ['nope'])
+
+        assert decrypted.result().password_index == 1
+        with pytest.raises(NoMatchingPassword):
+            failed.result()
+    finally:
+        processor.shutdown()
@@ -0,0 +1,82 @@
+from bills_collector.query_planner import RuleFilter, coalesced_criteria, plan_queries, route
+
+
+def rule_filter(email_from, email_subject='Statement'):
+    return RuleFilter(rule=None, rule_id=email_from, email_from=email_from, email_subject=email_subject)
+
+
+def test_rules_are_ored_into_searches_that_fit():
+    """
+    GIVEN five rules and room for about two of them per search
+    WHEN the searches are planned
+    THEN the rules are OR'd in order into searches no longer than the limit
+    """
+    filters = [rule_filter(f'billing@biller{idx}.test') for idx in range(5)]
+    max_length = len(coalesced_criteria(filters[:2]))
+
+    groups = plan_queries(filters, max_length)
+
+    assert [len(group) for group in groups] == [2, 2, 1]
+    assert [rule for group in groups for rule in group] == filters
+    assert all(len(coalesced_criteria(group)) <= max_length for group in groups)
+    assert coalesced_criteria(groups[0]) == (
+        '{(from:billing@biller0.test subject:Statement) (from:billing@biller1.test subject:Statement)}'
+    )
+
+
+def test_a_rule_longer_than_the_limit_gets_a_search_of_its_own():
+    """
+    GIVEN a rule whose terms alone exceed the query length
+    WHEN the searches are planned
+    THEN it is still searched for, alone
+    """
+    filters = [rule_filter('a.test'), rule_filter('b.test', 'x' * 200), rule_filter('c.test')]
+
+    groups = plan_queries(filters, 100)
+
+    assert [len(group) for group in groups] == [1, 1, 1]
+
+
+def test_search_syntax_in_rules_is_left_out():
+    """
+    GIVEN a rule whose subject holds Gmail's grouping characters
+    WHEN its search terms are built
+    THEN only its words are searched for, grouped under subject:
+    """
+    assert rule_filter('bank.test', 'Your (e-)Statement {May}').clause == (
+        '(from:bank.test subject:(Your e- Statement May))'
+    )
+
+
+def test_messages_are_routed_to_the_first_matching_rule():
+    """
+    GIVEN rules for two senders, one of them twice with different subjects
+    WHEN messages are routed by their From and Subject headers
+    THEN each goes to the first rule all of whose words match, case aside
+    """
+    card = rule_filter('cards@bank.test', 'Card Statement')
+    account = rule_filter('bank.test', 'account statement')
+    power = rule_filter('billing@power.test', '')
+    filters = [card, account, power]
+
+    assert route(filters, 'Bank <cards@bank.test>', 'Your card statement for May') is card
+    assert route(filters, 'Bank <cards@bank.test>', 'Your account statement') is account
+    assert route(filters, 'billing@power.test', 'Invoice') is power
+    assert route(filters, 'someone@else.test', 'Card statement') is None
+
+
+def test_words_match_whole_tokens_like_gmail():
+    """
+    GIVEN a rule for any sender mentioning bank, listed before the rule of a bank whose domain contains it
+    WHEN the bank's statement is routed
+    THEN it goes to the bank's rule unless the sender's name says Bank, as Gmail's
+         from:bank matches the name but not hdfcbank.com
+    """
+    generic = rule_filter('bank', 'statement')
+    hdfc = rule_filter('hdfcbank.com', 'statement')
+    filters = [generic, hdfc]
+
+    assert route(filters, 'HDFC Bank <alerts@hdfcbank.com>', 'Your e-Statement') is generic
+    assert route(filters, 'alerts@hdfcbank.com', 'Your e-Statement') is hdfc
+    assert route(filters, 'alerts@hdfcbank.com', 'Statements for May') is None
+    assert route(filters, 'alerts@hdfcbank.community', 'Your statement') is None
@@ -0,0 +1,44 @@
+from datetime import date, timedelta
+
+from bills_collector.scan_priority import BillHistory, PriorityPolicy
+
+TODAY = date(2026, 5, 15)
+
+policy = PriorityPolicy(horizon_days=9, arrival_window_days=3, lookback_days=180, default_priority=5)
+
+
+def monthly_history(last_bill_days_ago, next_due_in=None):
+    last = TODAY - timedelta(days=last_bill_days_ago)
+    next_due = TODAY + timedelta(days=next_due_in) if next_due_in is not None else None
+    return BillHistory(bills=4, first_bill_date=last - timedelta(days=90), last_bill_date=last,
+                       next_due_date=next_due)
+
+
+def test_nearer_bills_get_higher_priorities():
+    """
+    GIVEN inboxes billed every 30 days, last billed longer and longer ago
+    WHEN their scans are prioritised
+    THEN the nearer the next bill's arrival window, the higher the priority, 0 once it is open
+    """
+    priorities = [policy.priority(monthly_history(days_ago), TODAY) for days_ago in (28, 25, 22, 15, 2)]
+
+    assert priorities == [0, 2, 5, 9, 9]
+
+
+def test_a_bill_falling_due_raises_the_priority():
+    """
+    GIVEN an inbox whose next bill is weeks away, but with a pending bill due in two days
+    WHEN its scan is prioritised
+    THEN the due date sets the priority
+    """
+    assert policy.priority(monthly_history(2, next_due_in=2), TODAY) == 2
+
+
+def test_inboxes_without_a_pattern_get_the_default_priority():
+    """
+    GIVEN an inbox without bills, and one whose bills stopped two months ago
+    WHEN their scans are prioritised
+    THEN both get the default priority rather than jumping the queue
+    """
+    assert policy.priority(None, TODAY) == 5
+    assert policy.priority(monthly_history(75), TODAY) == 5
@@ -0,0 +1,50 @@
+"""
+This file (test_user_cache.py) contains the unit tests for the user_cache.py file.
+"""
+from bills_collector.extensions import db
+from bills_collector.models import User
+from bills_collector.user_cache import LRUCache, load_cached_user
+
+
+def test_lru_evicts_least_recently_used():
+    """
+    GIVEN a full LRU cache
+    WHEN a new key is added
+    THEN check the least recently read key is evicted
+    """
+    lru = LRUCache(maxsize=2, ttl=60)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    lru.get('a')
+    lru.set('c', 3)
+
+    assert lru.get('a') == 1
+    assert lru.get('b') is None
+    assert lru.get('c') == 3
+
+
+def test_lru_expires_entries():
+    """
+    GIVEN an LRU cache with a zero TTL
+    WHEN an entry is read back
+    THEN check it has already expired
+    """
+    lru = LRUCache(maxsize=2, ttl=0)
+    lru.set('a', 1)
+
+    assert lru.get('a') is None
+
+
+def test_user_update_invalidates_cache(app, default_user_payload):
+    """
+    GIVEN a cached user
+    WHEN the user row is updated
+    THEN check the next load returns the new name
+    """
+    user = User.query.filter_by(email=default_user_payload['email']).first()
+    assert load_cached_user(user.id).name == default_user_payload['name']
+
+    user.name = 'Somebody Else'
+    db.session.commit()
+
+    assert load_cached_user(user.id).name == 'Somebody Else'